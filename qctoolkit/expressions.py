@@ -74,6 +74,12 @@ class Expression(AnonymousSerializable, metaclass=_ExpressionMeta):
         result = self.expression_lambda(**parsed_kwargs)
         return self._parse_evaluate_numeric_result(result, kwargs)
 
+    def evaluate_numeric_positional(self, arguments: Sequence) -> Union[Number, numpy.ndarray]:
+        """Same as evaluate_numeric but the arguments are given in the order of variables. This avoids the lookup of
+        the arguments if the expression is evaluated repeatedly with prepared arguments."""
+        result = self.expression_lambda(*arguments)
+        return self._parse_evaluate_numeric_result(result, dict(zip(self.variables, arguments)))
+
     def evaluate_symbolic(self, substitutions: Dict[Any, Any]) -> 'Expression':
         return Expression.make(substitute_with_eval(sympify(self.underlying_expression), substitutions))
 
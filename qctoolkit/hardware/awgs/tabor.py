@@ -1,8 +1,14 @@
 import fractions
 import sys
 import functools
+import pickle
+import re
+import hashlib
+import contextlib
+import concurrent.futures
 import weakref
-from typing import List, Tuple, Set, NamedTuple, Callable, Optional, Any, Sequence, cast, Generator
+from typing import List, Tuple, Set, NamedTuple, Callable, Optional, Any, Sequence, cast, Generator, Iterator,\
+    Iterable, Dict, Union
 from enum import Enum
 from collections import OrderedDict
 
@@ -14,8 +20,9 @@ import numpy as np
 
 from qctoolkit.utils.types import ChannelID
 from qctoolkit.pulses.multi_channel_pulse_template import MultiChannelWaveform
-from qctoolkit.hardware.program import Loop, make_compatible
-from qctoolkit.hardware.util import voltage_to_uint16, make_combined_wave, find_positions
+from qctoolkit.hardware.program import Loop, CompactLoop, make_compatible
+from qctoolkit.hardware.util import voltage_to_uint16, make_combined_wave, find_positions, iterate_in_background,\
+    BestFitAllocator
 from qctoolkit.hardware.awgs.base import AWG
 
 
@@ -27,18 +34,37 @@ __all__ = ['TaborAWGRepresentation', 'TaborChannelPair']
 
 class TaborSegment(tuple):
     """Represents one segment of two channels on the device. Convenience class."""
-    def __new__(cls, ch_a: Optional[np.ndarray], ch_b: Optional[np.ndarray]):
+    def __new__(cls, ch_a: Optional[np.ndarray], ch_b: Optional[np.ndarray]) -> 'TaborSegment':
         return tuple.__new__(cls, (ch_a, ch_b))
 
-    def __init__(self, ch_a, ch_b):
+    def __init__(self, ch_a: Optional[np.ndarray], ch_b: Optional[np.ndarray]) -> None:
         if ch_a is None and ch_b is None:
             raise TaborException('Empty TaborSegments are not allowed')
         if ch_a is not None and ch_b is not None and len(ch_a) != len(ch_b):
             raise TaborException('Channel entries to have to have the same length')
 
+    def __getnewargs__(self) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+        return tuple(self)
+
+    @property
+    def digest(self) -> bytes:
+        """Digest of the channel data. It is computed once over memoryviews of the data, i.e. the data must not be
+        modified afterwards."""
+        try:
+            return self._digest
+        except AttributeError:
+            content_hash = hashlib.blake2b(digest_size=32)
+            for channel_data in self:
+                if channel_data is None:
+                    content_hash.update(b'\x00')
+                else:
+                    content_hash.update(b'\x01')
+                    content_hash.update(memoryview(np.ascontiguousarray(channel_data)).cast('B'))
+            self._digest = content_hash.digest()
+            return self._digest
+
     def __hash__(self) -> int:
-        return hash((bytes(self[0]) if self[0] is not None else 0,
-                     bytes(self[1]) if self[1] is not None else 0))
+        return int.from_bytes(self.digest[:8], byteorder='little', signed=True)
 
     @property
     def num_points(self) -> int:
@@ -49,14 +75,211 @@ class TaborSegment(tuple):
         return make_combined_wave([self])
 
 
+def _assert_picklable(obj: Any, description: str) -> None:
+    """Objects that are sent to a process pool have to be picklable. Fail early with a readable message."""
+    try:
+        pickle.dumps(obj)
+    except (pickle.PicklingError, AttributeError, TypeError) as err:
+        raise TypeError('The {} {!r} cannot be sampled in a process pool because it is not picklable'.format(
+            description, obj)) from err
+
+
+def _sample_segment(waveform: MultiChannelWaveform,
+                    segment_length: int,
+                    channels: Tuple[Optional[ChannelID], Optional[ChannelID]],
+                    markers: Tuple[Optional[ChannelID], Optional[ChannelID]],
+                    sample_rate: float,
+                    voltage_amplitude: Tuple[float, float],
+                    voltage_offset: Tuple[float, float],
+                    voltage_transformation: Tuple[Callable, Callable],
+                    chunk_size: int) -> TaborSegment:
+    """Sample one waveform chunk wise directly into the uint16 data of a TaborSegment. Module level to be usable with a
+    process pool."""
+    # all used channels and markers of a waveform are sampled in one batch
+    sampled_channels = [channel for channel in channels + markers if channel is not None]
+    channel_rows = {channel: row for row, channel in enumerate(sampled_channels)}
+
+    # the waveform is sampled chunk wise into these buffers and quantized directly into the segment data
+    chunk_size = min(chunk_size, segment_length)
+    sample_buffer = np.empty((len(sampled_channels), chunk_size))
+    voltage_buffer = np.empty(chunk_size)
+    marker_buffer = np.empty(chunk_size, dtype=bool)
+    marker_bit_buffer = np.empty(chunk_size, dtype=np.uint16)
+
+    segment_data = (np.empty(segment_length, dtype=np.uint16), np.empty(segment_length, dtype=np.uint16))
+    for channel, segment in zip(channels, segment_data):
+        if not channel:
+            segment[:] = 8192
+
+    for chunk_begin in range(0, segment_length, chunk_size):
+        chunk_end = min(chunk_begin + chunk_size, segment_length)
+        chunk_length = chunk_end - chunk_begin
+        sampled = sample_buffer[:, :chunk_length]
+        if sampled_channels:
+            waveform.sample_channels_uniform(channels=sampled_channels,
+                                             n_samples=chunk_length,
+                                             sample_rate=sample_rate,
+                                             t0=chunk_begin / sample_rate,
+                                             output_array=sampled)
+
+        for channel_index, (channel, segment) in enumerate(zip(channels, segment_data)):
+            if channel:
+                voltage_to_uint16(voltage_transformation[channel_index](sampled[channel_rows[channel]]),
+                                  voltage_amplitude[channel_index],
+                                  voltage_offset[channel_index],
+                                  resolution=14,
+                                  output_array=segment[chunk_begin:chunk_end],
+                                  scratch_array=voltage_buffer[:chunk_length])
+
+        marker_data = marker_buffer[:chunk_length]
+        marker_bits = marker_bit_buffer[:chunk_length]
+        for marker_index, markerID in enumerate(markers):
+            if markerID is not None:
+                np.not_equal(sampled[channel_rows[markerID]], 0, out=marker_data)
+                np.left_shift(marker_data, marker_index+14, out=marker_bits, dtype=np.uint16)
+                segment_data[0][chunk_begin:chunk_end] |= marker_bits
+    return TaborSegment(*segment_data)
+
+
+def _split_rows(rows: List[Tuple[Any, int]], min_rows: int) -> List[Tuple[Any, int]]:
+    """Split the last rows with a repetition count larger one into rows with repetition count one until there are at
+    least min_rows rows. The result is the same as of repeated Loop.split_one_child calls."""
+    deficit = min_rows - len(rows)
+    if deficit <= 0:
+        return rows
+    rows = list(rows)
+    for row_index in reversed(range(len(rows))):
+        waveform, repetition_count = rows[row_index]
+        split_count = min(repetition_count - 1, deficit)
+        if split_count > 0:
+            rows[row_index] = (waveform, repetition_count - split_count)
+            rows[row_index + 1:row_index + 1] = [(waveform, 1)] * split_count
+            deficit -= split_count
+            if deficit == 0:
+                break
+    return rows
+
+
+def _chunk_rows(rows: List[Tuple[Any, int]], min_seq_len: int, max_seq_len: int) -> List[List[Tuple[Any, int]]]:
+    """Split rows into the minimal number of sequence tables of (almost) equal length."""
+    chunk_count = -(-len(rows) // max_seq_len)
+    chunk_length, longer_chunks = divmod(len(rows), chunk_count)
+    if chunk_length < min_seq_len:
+        raise TaborException('Cannot split a sequence table of length {} into tables with {} to {} entries'.format(
+            len(rows), min_seq_len, max_seq_len))
+
+    chunks = []
+    chunk_begin = 0
+    for chunk_index in range(chunk_count):
+        chunk_end = chunk_begin + chunk_length + (chunk_index < longer_chunks)
+        chunks.append(rows[chunk_begin:chunk_end])
+        chunk_begin = chunk_end
+    return chunks
+
+
+def _pack_advanced_sequence(sequence_tables: Sequence[Tuple[int, List[Tuple[Any, int]]]],
+                            min_seq_len: int, max_seq_len: int) -> List[Tuple[int, List[Tuple[Any, int]]]]:
+    """Rearrange the sequence tables of a two level program so that each has between min_seq_len and max_seq_len rows.
+    The played waveforms stay the same and no new waveforms are created.
+
+    1. Tables played once are merged with their neighbours. Repeated tables with a single row are merged into one row.
+    2. Repeated tables that are too short are unrolled as few times as necessary.
+    3. Tables that are still too short get one repetition of a repeated neighbour.
+    4. Rows with a repetition count larger one are split to reach min_seq_len rows. Tables longer than max_seq_len are
+       split into several tables.
+
+    Args:
+        sequence_tables: Pairs of repetition count and rows. A row is a pair of waveform and repetition count.
+    Returns:
+        The entries of the advanced sequencer table as pairs of repetition count and rows.
+    """
+    # items are [repetition_count, rows] and items with repetition count one are always merged with their neighbours
+    items = []
+
+    def append_once(rows):
+        if not rows:
+            return
+        if items and items[-1][0] == 1:
+            items[-1][1].extend(rows)
+        else:
+            items.append([1, list(rows)])
+
+    for repetition_count, rows in sequence_tables:
+        if repetition_count == 1:
+            append_once(rows)
+        elif len(rows) == 1:
+            (waveform, row_repetition_count), = rows
+            append_once([(waveform, row_repetition_count * repetition_count)])
+        else:
+            total_repetition_count = sum(row_repetition_count for _, row_repetition_count in rows)
+            if len(rows) >= min_seq_len or total_repetition_count >= min_seq_len:
+                items.append([repetition_count, list(rows)])
+            else:
+                group_size = -(-min_seq_len // total_repetition_count)
+                group_count, remainder = divmod(repetition_count, group_size)
+                if group_count > 1:
+                    items.append([group_count, rows * group_size])
+                    append_once(rows * remainder)
+                else:
+                    append_once(rows * repetition_count)
+
+    item_index = 0
+    while item_index < len(items):
+        repetition_count, rows = items[item_index]
+        if repetition_count > 1 or sum(row_repetition_count for _, row_repetition_count in rows) >= min_seq_len:
+            item_index += 1
+
+        elif item_index > 0:
+            # take the last repetition of the previous table
+            previous = items[item_index - 1]
+            rows[:0] = previous[1]
+            previous[0] -= 1
+            if previous[0] == 1:
+                rows[:0] = previous[1]
+                del items[item_index - 1]
+                item_index -= 1
+                if item_index > 0 and items[item_index - 1][0] == 1:
+                    items[item_index - 1][1].extend(rows)
+                    del items[item_index]
+                    item_index -= 1
+
+        elif item_index + 1 < len(items):
+            # take the first repetition of the next table
+            following = items[item_index + 1]
+            rows.extend(following[1])
+            following[0] -= 1
+            if following[0] == 1:
+                rows.extend(following[1])
+                del items[item_index + 1]
+                if item_index + 1 < len(items) and items[item_index + 1][0] == 1:
+                    rows.extend(items[item_index + 1][1])
+                    del items[item_index + 1]
+
+        else:
+            raise TaborException('The algorithm is not smart enough to make this sequence table longer')
+
+    packed = []
+    for repetition_count, rows in items:
+        rows = _split_rows(rows, min_seq_len)
+        if len(rows) <= max_seq_len:
+            packed.append((repetition_count, rows))
+        else:
+            chunks = _chunk_rows(rows, min_seq_len, max_seq_len)
+            packed.extend((1, chunk) for _ in range(repetition_count) for chunk in chunks)
+    return packed
+
+
 class TaborSequencing(Enum):
     SINGLE = 1
     ADVANCED = 2
 
 
 class TaborProgram:
+    # maximal number of samples per channel that are converted at once by sampled_segments
+    _sampling_chunk_size = 2**18
+
     def __init__(self,
-                 program: Loop,
+                 program: Union[Loop, CompactLoop],
                  device_properties,
                  channels: Tuple[Optional[ChannelID], Optional[ChannelID]],
                  markers: Tuple[Optional[ChannelID], Optional[ChannelID]]):
@@ -67,6 +290,9 @@ class TaborProgram:
         channel_set = frozenset(channel for channel in channels if channel is not None) | frozenset(marker
                                                                                                     for marker in
                                                                                                     markers if marker is not None)
+        if isinstance(program, CompactLoop) and (program.depth() != 1 or program.repetition_count > 1):
+            # only single sequence mode is read directly from the arrays
+            program = program.to_loop()
         self._program = program
 
         self.__waveform_mode = None
@@ -99,12 +325,8 @@ class TaborProgram:
     def channels(self) -> Tuple[Optional[ChannelID], Optional[ChannelID]]:
         return self._channels
 
-    def sampled_segments(self,
-                         sample_rate: float,
-                         voltage_amplitude: Tuple[float, float],
-                         voltage_offset: Tuple[float, float],
-                         voltage_transformation: Tuple[Callable, Callable]) -> Tuple[Sequence[TaborSegment],
-                                                                                     Sequence[int]]:
+    def get_segment_lengths(self, sample_rate: float) -> np.ndarray:
+        """Number of samples of each waveform at the given sample rate in samples per second."""
         sample_rate = fractions.Fraction(sample_rate, 10**9)
 
         segment_lengths = [waveform.duration*sample_rate for waveform in self._waveforms]
@@ -115,39 +337,63 @@ class TaborProgram:
 
         if np.any(segment_lengths % 16 > 0) or np.any(segment_lengths < 192):
             raise TaborException('At least one waveform has a length that is smaller 192 or not a multiple of 16')
-        sample_rate = float(sample_rate)
-        time_array = np.arange(np.max(segment_lengths)) / sample_rate
-
-        def voltage_to_data(waveform, time, channel):
-            if self._channels[channel]:
-                return voltage_to_uint16(
-                    voltage_transformation[channel](
-                        waveform.get_sampled(channel=self._channels[channel],
-                                             sample_times=time)),
-                    voltage_amplitude[channel],
-                    voltage_offset[channel],
-                    resolution=14)
-            else:
-                return np.full_like(time, 8192, dtype=np.uint16)
+        return segment_lengths
+
+    def iter_sampled_segments(self,
+                              sample_rate: float,
+                              voltage_amplitude: Tuple[float, float],
+                              voltage_offset: Tuple[float, float],
+                              voltage_transformation: Tuple[Callable, Callable],
+                              executor: Optional[concurrent.futures.Executor]=None) -> Iterator[TaborSegment]:
+        """Sample and quantize the waveforms of the program one after another. The arguments are the same as for
+        sampled_segments."""
+        segment_lengths = self.get_segment_lengths(sample_rate)
+
+        sample_segment = functools.partial(_sample_segment,
+                                           channels=self._channels,
+                                           markers=self._markers,
+                                           sample_rate=sample_rate / 10**9,
+                                           voltage_amplitude=voltage_amplitude,
+                                           voltage_offset=voltage_offset,
+                                           voltage_transformation=voltage_transformation,
+                                           chunk_size=self._sampling_chunk_size)
+        if isinstance(executor, concurrent.futures.ProcessPoolExecutor):
+            for transformation in voltage_transformation:
+                _assert_picklable(transformation, 'voltage transformation')
+            for waveform in self._waveforms:
+                _assert_picklable(waveform, 'waveform')
+
+        segment_map = map if executor is None else executor.map
+        return segment_map(sample_segment, self._waveforms, segment_lengths.tolist())
 
-        def get_marker_data(waveform: MultiChannelWaveform, time):
-            marker_data = np.zeros(len(time), dtype=np.uint16)
-            for marker_index, markerID in enumerate(self._markers):
-                if markerID is not None:
-                    marker_data |= (waveform.get_sampled(channel=markerID, sample_times=time) != 0).\
-                                       astype(dtype=np.uint16) << marker_index+14
-            return marker_data
+    def sampled_segments(self,
+                         sample_rate: float,
+                         voltage_amplitude: Tuple[float, float],
+                         voltage_offset: Tuple[float, float],
+                         voltage_transformation: Tuple[Callable, Callable],
+                         executor: Optional[concurrent.futures.Executor]=None) -> Tuple[Sequence[TaborSegment],
+                                                                                        Sequence[int]]:
+        """Sample and quantize all waveforms of the program.
+
+        Args:
+            sample_rate: Sample rate in samples per second.
+            voltage_amplitude: Amplitude of both channels.
+            voltage_offset: Offset of both channels.
+            voltage_transformation: Applied to the sampled voltages of the respective channel before quantization.
+            executor: If given, the segments are sampled concurrently by this executor. A process pool requires
+                picklable waveforms and voltage transformations. Otherwise a TypeError is raised before sampling.
+        Returns:
+            The segments in the order of the waveforms and the segment lengths.
+        """
+        segment_lengths = self.get_segment_lengths(sample_rate)
 
         segments = np.empty_like(self._waveforms, dtype=TaborSegment)
-        for i, waveform in enumerate(self._waveforms):
-            t = time_array[:int(waveform.duration*sample_rate)]
-            segment_a = voltage_to_data(waveform, t, 0)
-            segment_b = voltage_to_data(waveform, t, 1)
-            assert (len(segment_a) == len(t))
-            assert (len(segment_b) == len(t))
-            seg_data = get_marker_data(waveform, t)
-            segment_a |= seg_data
-            segments[i] = TaborSegment(segment_a, segment_b)
+        for i, segment in enumerate(self.iter_sampled_segments(sample_rate=sample_rate,
+                                                               voltage_amplitude=voltage_amplitude,
+                                                               voltage_offset=voltage_offset,
+                                                               voltage_transformation=voltage_transformation,
+                                                               executor=executor)):
+            segments[i] = segment
         return segments, segment_lengths
 
     def setup_single_sequence_mode(self) -> None:
@@ -156,9 +402,19 @@ class TaborProgram:
         sequencer_table = []
         waveforms = OrderedDict()
 
-        for waveform, repetition_count in ((waveform_loop.waveform.get_subset_for_channels(self.__used_channels),
-                                            waveform_loop.repetition_count)
-                                           for waveform_loop in self.program):
+        if isinstance(self.program, CompactLoop):
+            waveform_subsets = [waveform.get_subset_for_channels(self.__used_channels)
+                                for waveform in self.program.waveforms]
+            children = self.program.get_children()
+            waveform_rows = zip((waveform_subsets[waveform_id]
+                                 for waveform_id in self.program.waveform_ids[children.start:children.stop].tolist()),
+                                self.program.repetition_counts[children.start:children.stop].tolist())
+        else:
+            waveform_rows = ((waveform_loop.waveform.get_subset_for_channels(self.__used_channels),
+                              waveform_loop.repetition_count)
+                             for waveform_loop in self.program)
+
+        for waveform, repetition_count in waveform_rows:
             if waveform in waveforms:
                 waveform_index = waveforms[waveform]
             else:
@@ -174,102 +430,58 @@ class TaborProgram:
         assert self.program.depth() > 1
         assert self.program.repetition_count == 1
 
-        self.program.flatten_and_balance(2)
-
-        min_seq_len = self.__device_properties['min_seq_len']
-        max_seq_len = self.__device_properties['max_seq_len']
-
-        def check_merge_with_next(program, n):
-            if (program[n].repetition_count == 1 and program[n+1].repetition_count == 1 and
-                    len(program[n]) + len(program[n+1]) < max_seq_len):
-                program[n][len(program[n]):] = program[n + 1][:]
-                program[n + 1:n + 2] = []
-                return True
-            return False
-
-        def check_partial_unroll(program, n):
-            st = program[n]
-            if sum(entry.repetition_count for entry in st) * st.repetition_count >= min_seq_len:
-                if sum(entry.repetition_count for entry in st) < min_seq_len:
-                    st.unroll_children()
-                while len(st) < min_seq_len:
-                    st.split_one_child()
-                return True
-            return False
-
-        i = 0
-        while i < len(self.program):
-            self.program[i].assert_tree_integrity()
-            if len(self.program[i]) > max_seq_len:
-                raise TaborException('The algorithm is not smart enough to make sequence tables shorter')
-            elif len(self.program[i]) < min_seq_len:
-                assert self.program[i].repetition_count > 0
-                if self.program[i].repetition_count == 1:
-                    # check if merging with neighbour is possible
-                    if i > 0 and check_merge_with_next(self.program, i-1):
-                        pass
-                    elif i+1 < len(self.program) and check_merge_with_next(self.program, i):
-                        pass
-
-                    # check if (partial) unrolling is possible
-                    elif check_partial_unroll(self.program, i):
-                        i += 1
-
-                    # check if sequence table can be extended by unrolling a neighbor
-                    elif (i > 0
-                          and self.program[i - 1].repetition_count > 1
-                          and len(self.program[i]) + len(self.program[i-1]) < max_seq_len):
-                        self.program[i][:0] = self.program[i-1].copy_tree_structure()[:]
-                        self.program[i - 1].repetition_count -= 1
-
-                    elif (i+1 < len(self.program)
-                          and self.program[i+1].repetition_count > 1
-                          and len(self.program[i]) + len(self.program[i+1]) < max_seq_len):
-                        self.program[i][len(self.program[i]):] = self.program[i+1].copy_tree_structure()[:]
-                        self.program[i+1].repetition_count -= 1
+        # unrolled repetitions share their rows so the subsets are created once per row list and waveform
+        waveform_subsets = dict()
+        subset_rows = dict()
 
-                    else:
-                        raise TaborException('The algorithm is not smart enough to make this sequence table longer')
-                elif check_partial_unroll(self.program, i):
-                    i += 1
-                else:
-                    raise TaborException('The algorithm is not smart enough to make this sequence table longer')
-            else:
-                i += 1
+        def get_subset(waveform):
+            if id(waveform) not in waveform_subsets:
+                waveform_subsets[id(waveform)] = waveform.get_subset_for_channels(self.__used_channels)
+            return waveform_subsets[id(waveform)]
 
-        for sequence_table in self.program:
-            assert len(sequence_table) >= self.__device_properties['min_seq_len']
-            assert len(sequence_table) <= self.__device_properties['max_seq_len']
+        def get_subset_rows(rows):
+            if id(rows) not in subset_rows:
+                # keep a reference to rows so the id is not reused
+                subset_rows[id(rows)] = (rows, [(get_subset(waveform), repetition_count)
+                                                for waveform, repetition_count in rows])
+            return subset_rows[id(rows)][1]
+
+        sequence_tables = [(repetition_count, get_subset_rows(rows))
+                           for repetition_count, rows in self.program.get_flattened_tables()]
+        packed_tables = _pack_advanced_sequence(sequence_tables,
+                                                min_seq_len=self.__device_properties['min_seq_len'],
+                                                max_seq_len=self.__device_properties['max_seq_len'])
+
+        # the channel pair inserts the idle sequence
+        if len(packed_tables) >= self.__device_properties['max_aseq_len']:
+            raise TaborException('The advanced sequencer table is too long', len(packed_tables))
 
         advanced_sequencer_table = []
         sequencer_tables = []
+        sequence_numbers = dict()
         waveforms = OrderedDict()
-        for sequencer_table_loop in self.program:
+        for repetition_count, rows in packed_tables:
             current_sequencer_table = []
-            for waveform, repetition_count in ((waveform_loop.waveform.get_subset_for_channels(self.__used_channels),
-                                                waveform_loop.repetition_count)
-                                               for waveform_loop in sequencer_table_loop):
+            for waveform, row_repetition_count in rows:
                 if waveform in waveforms:
                     wf_index = waveforms[waveform]
                 else:
                     wf_index = len(waveforms)
                     waveforms[waveform] = wf_index
-                current_sequencer_table.append((repetition_count, wf_index, 0))
+                current_sequencer_table.append((row_repetition_count, wf_index, 0))
 
-            if current_sequencer_table in sequencer_tables:
-                sequence_no = sequencer_tables.index(current_sequencer_table) + 1
-            else:
-                sequence_no = len(sequencer_tables) + 1
+            sequence_no = sequence_numbers.setdefault(tuple(current_sequencer_table), len(sequencer_tables) + 1)
+            if sequence_no > len(sequencer_tables):
                 sequencer_tables.append(current_sequencer_table)
 
-            advanced_sequencer_table.append((sequencer_table_loop.repetition_count, sequence_no, 0))
+            advanced_sequencer_table.append((repetition_count, sequence_no, 0))
 
         self._advanced_sequencer_table = advanced_sequencer_table
         self._sequencer_tables = sequencer_tables
         self._waveforms = tuple(waveforms.keys())
 
     @property
-    def program(self) -> Loop:
+    def program(self) -> Union[Loop, CompactLoop]:
         return self._program
 
     def get_sequencer_tables(self) -> List[Tuple[int, int, int]]:
@@ -285,6 +497,12 @@ class TaborProgram:
 
 
 class TaborAWGRepresentation:
+    # maximal length of the command strings sent by batched_commands
+    _max_batched_command_length = 1024
+
+    _select_pattern = re.compile(r':INST:SEL (\d)')
+    _state_setting_pattern = re.compile(r':RES|\*RST|:FREQ|:VOLT|:OUTP:COUP', re.IGNORECASE)
+
     def __init__(self, instr_addr=None, paranoia_level=1, external_trigger=False, reset=False, mirror_addresses=()):
         """
         :param instr_addr:        Instrument address that is forwarded to teawag
@@ -298,6 +516,19 @@ class TaborAWGRepresentation:
 
         self._clock_marker = [0, 0, 0, 0]
 
+        # results of the state queries and the number of round trips they saved
+        self._state_cache = dict()
+        self.saved_round_trips = 0
+
+        # drives the main instrument and the mirrors concurrently. It is created on demand and shut down by close, when
+        # this object is garbage collected or at interpreter exit
+        self._device_executor = None  # type: Optional[concurrent.futures.ThreadPoolExecutor]
+        self._device_executor_finalizer = None  # type: Optional[weakref.finalize]
+
+        # commands collected by batched_commands and the channel selected by them
+        self._command_batch = None  # type: Optional[List[Tuple[str, Optional[int]]]]
+        self._batch_selected_channel = None  # type: Optional[int]
+
         if external_trigger:
             raise NotImplementedError()  # pragma: no cover
 
@@ -343,30 +574,137 @@ class TaborAWGRepresentation:
         return (self._instr, ) + self._mirrors
 
     def send_cmd(self, cmd_str, paranoia_level=None):
-        for instr in self.all_devices:
-            instr.send_cmd(cmd_str=cmd_str, paranoia_level=paranoia_level)
+        self._invalidate_changed_state(cmd_str)
+        if self._command_batch is not None:
+            self._add_to_command_batch(cmd_str, paranoia_level)
+        else:
+            self._call_all_devices('send_cmd', cmd_str=cmd_str, paranoia_level=paranoia_level)
+
+    def _call_all_devices(self, method_name: str, *args, **kwargs) -> Tuple[Any, ...]:
+        """Call the method on the main instrument and all mirrors. The devices are driven concurrently by a thread pool
+        and all of them are waited for. If any device fails, a TaborDeviceError with the errors of all failed devices
+        is raised.
+
+        Returns:
+            The results of the main instrument and the mirrors
+        """
+        if not self._mirrors:
+            return getattr(self._instr, method_name)(*args, **kwargs),
+
+        if self._device_executor is None:
+            self._device_executor = concurrent.futures.ThreadPoolExecutor(max_workers=len(self.all_devices))
+            self._device_executor_finalizer = weakref.finalize(self, self._device_executor.shutdown)
+        futures = [self._device_executor.submit(getattr(instr, method_name), *args, **kwargs)
+                   for instr in self.all_devices]
+        concurrent.futures.wait(futures)
+
+        errors = OrderedDict((instr, future.exception())
+                             for instr, future in zip(self.all_devices, futures)
+                             if future.exception() is not None)
+        if errors:
+            raise TaborDeviceError(method_name, errors) from next(iter(errors.values()))
+        return tuple(future.result() for future in futures)
+
+    def close(self) -> None:
+        """Shut down the threads that drive the main instrument and the mirrors. They are restarted if the devices are
+        used again."""
+        if self._device_executor is not None:
+            self._device_executor_finalizer()
+            self._device_executor = None
+            self._device_executor_finalizer = None
+
+    @contextlib.contextmanager
+    def batched_commands(self) -> Generator[None, None, None]:
+        """Inside this context the commands of send_cmd are collected and sent joined by semicolons. Selections of the
+        already selected channel are dropped. The collected commands are sent when the context is left and before any
+        query or data transfer. Nested contexts are merged into the outermost one."""
+        if self._command_batch is not None:
+            yield
+            return
+
+        self._command_batch = []
+        self._batch_selected_channel = None
+        try:
+            try:
+                yield
+            except BaseException as err:
+                try:
+                    self._flush_command_batch()
+                except Exception as flush_error:
+                    raise flush_error from err
+                raise
+            else:
+                self._flush_command_batch()
+        finally:
+            self._command_batch = None
+            self._batch_selected_channel = None
+
+    def _add_to_command_batch(self, cmd_str: str, paranoia_level: Optional[int]) -> None:
+        cmd_str = cmd_str.strip().rstrip(';')
+        if not cmd_str:
+            return
+
+        selected_channel = self._select_pattern.fullmatch(cmd_str)
+        if selected_channel:
+            if int(selected_channel.group(1)) == self._batch_selected_channel:
+                return
+        self._update_batch_selected_channel(cmd_str)
+
+        # commands that do not start at the root of the SCPI tree would be relative to their predecessor
+        if not cmd_str.startswith((':', '*')):
+            cmd_str = ':' + cmd_str
+        self._command_batch.append((cmd_str, paranoia_level))
+
+    def _update_batch_selected_channel(self, cmd_str: str) -> None:
+        if self._command_batch is None:
+            return
+        if ':RES' in cmd_str or '*RST' in cmd_str:
+            self._batch_selected_channel = None
+        else:
+            selections = self._select_pattern.findall(cmd_str)
+            if selections:
+                self._batch_selected_channel = int(selections[-1])
+
+    def _flush_command_batch(self) -> None:
+        if not self._command_batch:
+            return
+        command_batch, self._command_batch = self._command_batch, []
+
+        joined_commands = []
+        for cmd_str, paranoia_level in command_batch:
+            if joined_commands and joined_commands[-1][1] == paranoia_level and \
+                    len(joined_commands[-1][0]) + len(cmd_str) + 2 <= self._max_batched_command_length:
+                joined_commands[-1][0] = joined_commands[-1][0] + '; ' + cmd_str
+            else:
+                joined_commands.append([cmd_str, paranoia_level])
+
+        for cmd_str, paranoia_level in joined_commands:
+            self._call_all_devices('send_cmd', cmd_str=cmd_str, paranoia_level=paranoia_level)
 
     def send_query(self, query_str, query_mirrors=False) -> Any:
+        self._flush_command_batch()
+        self._invalidate_changed_state(query_str)
+        self._update_batch_selected_channel(query_str)
         if query_mirrors:
-            return tuple(instr.send_query(query_str) for instr in self.all_devices)
+            return self._call_all_devices('send_query', query_str)
         else:
             return self._instr.send_query(query_str)
 
     def send_binary_data(self, pref, bin_dat, paranoia_level=None):
-        for instr in self.all_devices:
-            instr.send_binary_data(pref, bin_dat=bin_dat, paranoia_level=paranoia_level)
+        self._flush_command_batch()
+        self._call_all_devices('send_binary_data', pref, bin_dat=bin_dat, paranoia_level=paranoia_level)
 
     def download_segment_lengths(self, seg_len_list, pref=':SEGM:DATA', paranoia_level=None):
-        for instr in self.all_devices:
-            instr.download_segment_lengths(seg_len_list, pref=pref, paranoia_level=paranoia_level)
+        self._flush_command_batch()
+        self._call_all_devices('download_segment_lengths', seg_len_list, pref=pref, paranoia_level=paranoia_level)
 
     def download_sequencer_table(self, seq_table, pref=':SEQ:DATA', paranoia_level=None):
-        for instr in self.all_devices:
-            instr.download_sequencer_table(seq_table, pref=pref, paranoia_level=paranoia_level)
+        self._flush_command_batch()
+        self._call_all_devices('download_sequencer_table', seq_table, pref=pref, paranoia_level=paranoia_level)
 
     def download_adv_seq_table(self, seq_table, pref=':ASEQ:DATA', paranoia_level=None):
-        for instr in self.all_devices:
-            instr.download_adv_seq_table(seq_table, pref=pref, paranoia_level=paranoia_level)
+        self._flush_command_batch()
+        self._call_all_devices('download_adv_seq_table', seq_table, pref=pref, paranoia_level=paranoia_level)
 
     make_combined_wave = staticmethod(teawg.TEWXAwg.make_combined_wave)
 
@@ -419,23 +757,48 @@ class TaborAWGRepresentation:
     def sample_rate(self, channel) -> int:
         if channel not in (1, 2, 3, 4):
             raise TaborException('Invalid channel: {}'.format(channel))
-        return int(float(self.send_query(':INST:SEL {channel}; :FREQ:RAST?'.format(channel=channel))))
+        return self._query_state(('sample_rate', channel), lambda: int(float(self.send_query(
+            ':INST:SEL {channel}; :FREQ:RAST?'.format(channel=channel)))))
 
     def amplitude(self, channel) -> float:
         if channel not in (1, 2, 3, 4):
             raise TaborException('Invalid channel: {}'.format(channel))
-        coupling = self.send_query(':INST:SEL {channel}; :OUTP:COUP?'.format(channel=channel))
-        if coupling == 'DC':
-            return float(self.send_query(':VOLT?'))
-        elif coupling == 'HV':
-            return float(self.send_query(':VOLT:HV?'))
-        else:
-            raise TaborException('Unknown coupling: {}'.format(coupling))
+
+        def query_amplitude():
+            coupling = self.send_query(':INST:SEL {channel}; :OUTP:COUP?'.format(channel=channel))
+            if coupling == 'DC':
+                return float(self.send_query(':VOLT?'))
+            elif coupling == 'HV':
+                return float(self.send_query(':VOLT:HV?'))
+            else:
+                raise TaborException('Unknown coupling: {}'.format(coupling))
+        return self._query_state(('amplitude', channel), query_amplitude, round_trips=2)
 
     def offset(self, channel: int) -> float:
         if channel not in (1, 2, 3, 4):
             raise TaborException('Invalid channel: {}'.format(channel))
-        return float(self.send_query(':INST:SEL {channel}; :VOLT:OFFS?'.format(channel=channel)))
+        return self._query_state(('offset', channel), lambda: float(self.send_query(
+            ':INST:SEL {channel}; :VOLT:OFFS?'.format(channel=channel))))
+
+    def invalidate_state_cache(self) -> None:
+        """Forget the cached results of sample_rate, amplitude and offset. Required if the device settings were changed
+        by other means than this object."""
+        self._state_cache.clear()
+
+    def _query_state(self, key: Tuple[str, int], query: Callable[[], Any], round_trips: int=1) -> Any:
+        try:
+            value = self._state_cache[key]
+        except KeyError:
+            value = self._state_cache[key] = query()
+        else:
+            self.saved_round_trips += round_trips
+        return value
+
+    def _invalidate_changed_state(self, cmd_str: str) -> None:
+        """Invalidate the state cache if cmd_str resets the device or sets a cached value."""
+        if self._state_cache and any(not command.strip().endswith('?') and self._state_setting_pattern.search(command)
+                                     for command in cmd_str.split(';')):
+            self.invalidate_state_cache()
 
     def enable(self) -> None:
         self.send_cmd(':ENAB')
@@ -514,6 +877,17 @@ def with_select(function_object: Callable[['TaborChannelPair', Any], Any]) -> Ca
     return selector
 
 
+def with_command_batch(function_object: Callable[['TaborChannelPair', Any], Any]) -> Callable[['TaborChannelPair'],
+                                                                                         Any]:
+    """The commands sent by the decorated method are batched by TaborAWGRepresentation.batched_commands"""
+    @functools.wraps(function_object)
+    def batching_method(channel_pair: 'TaborChannelPair', *args, **kwargs) -> Any:
+        with channel_pair.device.batched_commands():
+            return function_object(channel_pair, *args, **kwargs)
+
+    return batching_method
+
+
 class PlottableProgram:
     TableEntry = NamedTuple('TableEntry', [('repetition_count', int),
                                            ('element_number', int),
@@ -597,9 +971,28 @@ class TaborChannelPair(AWG):
         self._segment_hashes = None
         self._segment_references = None
 
+        # full digests of the segments by segment index to detect hash collisions. None if the content is unknown
+        self._segment_digests = None  # type: np.ndarray
+
+        # host side copies of the referenced segments by segment index. They are only kept if keep_segment_data is
+        # True, because they hold the sampled data of all uploaded programs. Needed to move segments in defragment
+        self._segment_data = None  # type: Dict[int, TaborSegment]
+        self.keep_segment_data = False
+
+        # defragment the memory if fragmentation does not allow an upload. Only possible if keep_segment_data is True
+        self.auto_defragment = True
+
+        # sequencer tables in device memory by sequence index (sequence number - 1) and their reference counts. A
+        # program keeps its sequence slots after it was armed so arming it again does not require a download.
         self._sequencer_tables = None
+        self._sequence_references = None
+        self._program_sequences = None  # type: OrderedDict[str, List[int]]
         self._advanced_sequence_table = None
 
+        # if not None, upload samples the segments in a background thread and transfers them while sampling. The
+        # value limits the number of sampled segments that wait for their transfer.
+        self.upload_pipeline_depth = None  # type: Optional[int]
+
         self.clear()
 
     def select(self) -> None:
@@ -618,6 +1011,8 @@ class TaborChannelPair(AWG):
             raise TaborException('Removing "None" program is forbidden.')
         program = self._known_programs.pop(name)
         self._segment_references[program.waveform_to_segment] -= 1
+        self._drop_unreferenced_segment_data()
+        self._release_sequences(name)
         if self._current_program == name:
             self.change_armed_program(None)
         return program
@@ -628,6 +1023,18 @@ class TaborChannelPair(AWG):
         self._segment_references[program.waveform_to_segment] += 1
         self._known_programs[name] = program
 
+    def _update_segment_data(self, segment_index: int, segment: TaborSegment) -> None:
+        """Record the host side copy of the segment at segment_index if keep_segment_data is True."""
+        if self.keep_segment_data:
+            self._segment_data[segment_index] = segment
+        else:
+            self._segment_data.pop(segment_index, None)
+
+    def _drop_unreferenced_segment_data(self) -> None:
+        for segment_index in [segment_index for segment_index in self._segment_data
+                              if self._segment_references[segment_index] == 0]:
+            del self._segment_data[segment_index]
+
     @property
     def _segment_reserved(self) -> np.ndarray:
         return self._segment_references > 0
@@ -677,10 +1084,11 @@ class TaborChannelPair(AWG):
     def read_complete_program(self) -> PlottableProgram:
         return PlottableProgram(self.read_waveforms(), self.read_sequence_tables(), self.read_advanced_sequencer_table())
 
+    @with_command_batch
     @with_configuration_guard
     @with_select
     def upload(self, name: str,
-               program: Loop,
+               program: Union[Loop, CompactLoop],
                channels: Tuple[Optional[ChannelID], Optional[ChannelID]],
                markers: Tuple[Optional[ChannelID], Optional[ChannelID]],
                voltage_transformation: Tuple[Callable, Callable],
@@ -702,13 +1110,18 @@ class TaborChannelPair(AWG):
 
         # helper to restore previous state if upload is impossible
         to_restore = None
+        segment_data = None
         if name in self._known_programs:
             if force:
-                # save old program to restore in on error
+                # save old program and the host side copies of its segments to restore them on error
+                segment_data = self._segment_data.copy()
                 to_restore = (self.free_program(name), self._current_program)
             else:
                 raise ValueError('{} is already known on {}'.format(name, self.identifier))
 
+        # the segments of a program to restore are not referenced and would be discarded
+        allow_defragment = self.auto_defragment and self.keep_segment_data and not to_restore
+
         try:
             # parse to tabor program
             tabor_program = TaborProgram(program,
@@ -722,29 +1135,56 @@ class TaborChannelPair(AWG):
 
             voltage_amplitudes = (ranges[0]/2, ranges[1]/2)
             voltage_offsets = (0, 0)
-            segments, segment_lengths = tabor_program.sampled_segments(sample_rate=sample_rate,
-                                                                       voltage_amplitude=voltage_amplitudes,
-                                                                       voltage_offset=voltage_offsets,
-                                                                       voltage_transformation=voltage_transformation)
-
-            waveform_to_segment, to_amend, to_insert = self._find_place_for_segments_in_memory(segments,
-                                                                                               segment_lengths)
+            if self.upload_pipeline_depth is None:
+                segments, segment_lengths = tabor_program.sampled_segments(sample_rate=sample_rate,
+                                                                           voltage_amplitude=voltage_amplitudes,
+                                                                           voltage_offset=voltage_offsets,
+                                                                           voltage_transformation=voltage_transformation)
+
+                try:
+                    waveform_to_segment, to_amend, to_insert = self._find_place_for_segments_in_memory(segments,
+                                                                                                       segment_lengths)
+                except TaborFragmentationError:
+                    if not allow_defragment or not self.defragment():
+                        raise
+                    waveform_to_segment, to_amend, to_insert = self._find_place_for_segments_in_memory(segments,
+                                                                                                       segment_lengths)
+            else:
+                segment_lengths = tabor_program.get_segment_lengths(sample_rate)
+                segments = iterate_in_background(
+                    tabor_program.iter_sampled_segments(sample_rate=sample_rate,
+                                                        voltage_amplitude=voltage_amplitudes,
+                                                        voltage_offset=voltage_offsets,
+                                                        voltage_transformation=voltage_transformation),
+                    max_queue_size=self.upload_pipeline_depth)
+                with contextlib.closing(segments):
+                    waveform_to_segment = self._stream_segments(segments, segment_lengths,
+                                                                amend_batch_size=self.upload_pipeline_depth,
+                                                                allow_defragment=allow_defragment)
         except:
             if to_restore:
                 self._restore_program(name, to_restore[1])
                 self._current_program = to_restore[0]
+                self._segment_data.update((segment_index, segment)
+                                          for segment_index, segment in segment_data.items()
+                                          if self._segment_references[segment_index] > 0 and
+                                          self._segment_digests[segment_index] == segment.digest)
             raise
 
-        self._segment_references[waveform_to_segment[waveform_to_segment >= 0]] += 1
+        if self.upload_pipeline_depth is None:
+            known = np.flatnonzero(waveform_to_segment >= 0)
+            self._segment_references[waveform_to_segment[known]] += 1
+            for wf_index in known.tolist():
+                self._update_segment_data(int(waveform_to_segment[wf_index]), segments[wf_index])
 
-        for wf_index in np.flatnonzero(to_insert > 0):
-            segment_index = to_insert[wf_index]
-            self._upload_segment(to_insert[wf_index], segments[wf_index])
-            waveform_to_segment[wf_index] = segment_index
+            for wf_index in np.flatnonzero(to_insert > 0):
+                segment_index = to_insert[wf_index]
+                self._upload_segment(to_insert[wf_index], segments[wf_index])
+                waveform_to_segment[wf_index] = segment_index
 
-        if np.any(to_amend):
-            segments_to_amend = segments[to_amend]
-            waveform_to_segment[to_amend] = self._amend_segments(segments_to_amend)
+            if np.any(to_amend):
+                segments_to_amend = segments[to_amend]
+                waveform_to_segment[to_amend] = self._amend_segments(segments_to_amend)
 
         self._known_programs[name] = TaborProgramMemory(waveform_to_segment=waveform_to_segment,
                                                         program=tabor_program)
@@ -766,14 +1206,37 @@ class TaborChannelPair(AWG):
         self._segment_lengths = 192*np.ones(1, dtype=np.uint32)
         self._segment_capacity = 192*np.ones(1, dtype=np.uint32)
         self._segment_hashes = np.ones(1, dtype=np.int64) * hash(self._idle_segment)
+        self._segment_digests = np.array([self._idle_segment.digest], dtype=object)
+        self._segment_data = {0: self._idle_segment}
         self._segment_references = np.ones(1, dtype=np.uint32)
 
         self._advanced_sequence_table = []
         self._sequencer_tables = []
+        self._sequence_references = []
+        self._program_sequences = OrderedDict()
 
         self._known_programs = dict()
         self.change_armed_program(None)
 
+    def _is_hash_collision(self, segment: TaborSegment, segment_index: int) -> bool:
+        """True if the segment at segment_index has the same hash as segment but a different content."""
+        known_digest = self._segment_digests[segment_index]
+        return known_digest is not None and known_digest != segment.digest
+
+    def _find_segment(self, segment: TaborSegment, segment_index: int) -> int:
+        """Index of a segment in memory with the content of segment. segment_index is a segment with the same hash
+        that is checked first. If its content differs the other segments with the same hash are searched.
+
+        Returns:
+            Segment index or -1 if there is no segment with the same content
+        """
+        if not self._is_hash_collision(segment, segment_index):
+            return segment_index
+        for candidate in np.flatnonzero(self._segment_hashes == hash(segment)).tolist():
+            if not self._is_hash_collision(segment, candidate):
+                return candidate
+        return -1
+
     def _find_place_for_segments_in_memory(self, segments: Sequence, segment_lengths: Sequence) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
         """
         1. Find known segments
@@ -787,6 +1250,8 @@ class TaborChannelPair(AWG):
         segment_hashes = np.fromiter((hash(segment) for segment in segments), count=len(segments), dtype=np.int64)
 
         waveform_to_segment = find_positions(self._segment_hashes, segment_hashes)
+        for wf_index in np.flatnonzero(waveform_to_segment >= 0):
+            waveform_to_segment[wf_index] = self._find_segment(segments[wf_index], waveform_to_segment[wf_index])
 
         # separate into known and unknown
         unknown = (waveform_to_segment == -1)
@@ -813,50 +1278,135 @@ class TaborChannelPair(AWG):
         reserved_indices = np.flatnonzero(new_reference_counter > 0)
         first_free = reserved_indices[-1] + 1 if len(reserved_indices) else 0
 
-        free_segments = new_reference_counter[:first_free] == 0
-        free_segment_count = np.sum(free_segments)
+        free_segment_indices = np.flatnonzero(new_reference_counter[:first_free] == 0)
+        allocator = BestFitAllocator(zip(free_segment_indices.tolist(),
+                                         self._segment_capacity[free_segment_indices].tolist()))
 
         # look for a free segment place with the same length
         for segment_idx in np.flatnonzero(to_amend):
-            if free_segment_count == 0:
+            if not allocator:
                 break
 
-            pos_of_same_length = np.logical_and(free_segments, segment_lengths[segment_idx] == self._segment_capacity[:first_free])
-            idx_same_length = np.argmax(pos_of_same_length)
-            if pos_of_same_length[idx_same_length]:
-                free_segments[idx_same_length] = False
-                free_segment_count -= 1
-
+            segment_length = int(segment_lengths[segment_idx])
+            fitting_segment = allocator.find_best_fit(segment_length)
+            if fitting_segment is not None and allocator.capacity(fitting_segment) == segment_length:
+                allocator.remove(fitting_segment)
                 to_amend[segment_idx] = False
-                to_insert[segment_idx] = idx_same_length
+                to_insert[segment_idx] = fitting_segment
 
-        # try to find places that are larger than the segments to fit in starting with the large segments and large
-        # free spaces
-        segment_indices = np.flatnonzero(to_amend)[np.argsort(segment_lengths[to_amend])[::-1]]
-        capacities = self._segment_capacity[:first_free]
+        # place the remaining segments in the smallest free places they fit in starting with the large segments
+        segment_indices = np.flatnonzero(to_amend)[np.argsort(segment_lengths[to_amend], kind='stable')[::-1]]
         for segment_idx in segment_indices:
-            free_capacities = capacities[free_segments]
-            free_segments_indices = np.flatnonzero(free_segments)[np.argsort(free_capacities)[::-1]]
-
-            if len(free_segments_indices) == 0:
+            if not allocator:
                 break
 
-            fitting_segment = np.argmax((free_capacities >= segment_lengths[segment_idx])[::-1])
-            fitting_segment = free_segments_indices[fitting_segment]
-            if self._segment_capacity[fitting_segment] >= segment_lengths[segment_idx]:
-                free_segments[fitting_segment] = False
+            fitting_segment = allocator.allocate(int(segment_lengths[segment_idx]))
+            if fitting_segment is not None:
                 to_amend[segment_idx] = False
                 to_insert[segment_idx] = fitting_segment
 
         free_points_at_end = self.total_capacity - np.sum(self._segment_capacity[:first_free])
         if np.sum(segment_lengths[to_amend] + 16) > free_points_at_end:
-            raise MemoryError('Fragmentation does not allow upload.',
-                              np.sum(segment_lengths[to_amend] + 16),
-                              free_points_at_end,
-                              self._free_points_at_end)
+            raise TaborFragmentationError('Fragmentation does not allow upload.',
+                                          np.sum(segment_lengths[to_amend] + 16),
+                                          free_points_at_end,
+                                          self._free_points_at_end)
 
         return waveform_to_segment, to_amend, to_insert
 
+    def _stream_segments(self, segments: Iterable[TaborSegment], segment_lengths: np.ndarray,
+                         amend_batch_size: int, allow_defragment: bool=False) -> np.ndarray:
+        """Place and transfer the segments while they are produced. In contrast to
+        _find_place_for_segments_in_memory the places are chosen one segment after another:
+
+        1. Known segment
+        2. Free segment with the smallest fitting capacity
+        3. Amend. Segments to amend are collected and transferred in batches of amend_batch_size. If allow_defragment
+           is true, the memory is defragmented if the free memory at the end does not suffice
+
+        The reference counts of all used segments are increased. If an error occurs they are restored.
+        :return: waveform_to_segment
+        """
+        waveform_to_segment = np.full(len(segment_lengths), fill_value=-1, dtype=np.int64)
+        referenced = []
+        to_amend = []
+
+        # first occurrence of each hash in memory
+        known_segments = dict(zip(self._segment_hashes[::-1].tolist(),
+                                  range(len(self._segment_hashes) - 1, -1, -1)))
+
+        def free_segments() -> BestFitAllocator:
+            free_segment_indices = np.flatnonzero(self._segment_references == 0)
+            return BestFitAllocator(zip(free_segment_indices.tolist(),
+                                        self._segment_capacity[free_segment_indices].tolist()))
+        allocator = free_segments()
+
+        def amend():
+            nonlocal allocator
+            to_amend_size = sum(segment.num_points + 16 for _, segment in to_amend)
+            free_points_at_end = self.total_capacity - np.sum(self._segment_capacity)
+            if to_amend_size > free_points_at_end and allow_defragment:
+                index_map = self._defragment(to_amend_size)
+                placed = waveform_to_segment >= 0
+                waveform_to_segment[placed] = index_map[waveform_to_segment[placed]]
+                referenced[:] = index_map[referenced].tolist()
+                for known_hash, known_index in list(known_segments.items()):
+                    if known_index >= len(index_map) or index_map[known_index] < 0:
+                        del known_segments[known_hash]
+                    else:
+                        known_segments[known_hash] = int(index_map[known_index])
+                allocator = free_segments()
+                free_points_at_end = self.total_capacity - np.sum(self._segment_capacity)
+
+            if to_amend_size > free_points_at_end:
+                raise TaborFragmentationError('Fragmentation does not allow upload.',
+                                              to_amend_size,
+                                              free_points_at_end,
+                                              self._free_points_at_end)
+            segment_indices = self._amend_segments([segment for _, segment in to_amend])
+            for (wf_index, segment), segment_index in zip(to_amend, segment_indices.tolist()):
+                waveform_to_segment[wf_index] = segment_index
+                known_segments[hash(segment)] = segment_index
+                referenced.append(segment_index)
+            to_amend.clear()
+
+        try:
+            for wf_index, segment in enumerate(segments):
+                segment_hash = hash(segment)
+                segment_index = known_segments.get(segment_hash, -1)
+                if segment_index >= 0:
+                    segment_index = self._find_segment(segment, segment_index)
+
+                if segment_index < 0:
+                    segment_index = allocator.allocate(segment.num_points)
+                    if segment_index is not None:
+                        if known_segments.get(self._segment_hashes[segment_index]) == segment_index:
+                            del known_segments[self._segment_hashes[segment_index]]
+                        self._upload_segment(segment_index, segment)
+                        known_segments[segment_hash] = segment_index
+                    else:
+                        to_amend.append((wf_index, segment))
+                        if len(to_amend) >= amend_batch_size:
+                            amend()
+                        continue
+                else:
+                    if segment_index in allocator:
+                        allocator.remove(segment_index)
+                    self._segment_references[segment_index] += 1
+                    self._update_segment_data(segment_index, segment)
+                waveform_to_segment[wf_index] = segment_index
+                referenced.append(segment_index)
+
+            if to_amend:
+                amend()
+        except:
+            np.subtract.at(self._segment_references, referenced, 1)
+            self._drop_unreferenced_segment_data()
+            raise
+
+        assert len(waveform_to_segment) == 0 or np.all(waveform_to_segment >= 0)
+        return waveform_to_segment
+
     @with_select
     @with_configuration_guard
     def _upload_segment(self, segment_index: int, segment: TaborSegment) -> None:
@@ -878,6 +1428,8 @@ class TaborChannelPair(AWG):
         self.device.send_binary_data(pref=':TRAC:DATA', bin_dat=wf_data)
         self._segment_references[segment_index] = 1
         self._segment_hashes[segment_index] = hash(segment)
+        self._segment_digests[segment_index] = segment.digest
+        self._update_segment_data(segment_index, segment)
 
     @with_select
     @with_configuration_guard
@@ -899,6 +1451,9 @@ class TaborChannelPair(AWG):
         segment_lengths = np.concatenate((self._segment_lengths, new_lengths))
         segment_references = np.concatenate((self._segment_references, np.ones(len(segments), dtype=int)))
         segment_hashes = np.concatenate((self._segment_hashes, [hash(s) for s in segments]))
+        segment_digests = np.concatenate((self._segment_digests, np.array([s.digest for s in segments], dtype=object)))
+        for new_segment_index, segment in enumerate(segments, start=segment_index):
+            self._update_segment_data(new_segment_index, segment)
         if len(segments) < old_to_update:
             for i, segment in enumerate(segments):
                 current_segment_number = first_segment_number + i
@@ -914,10 +1469,129 @@ class TaborChannelPair(AWG):
         self._segment_capacity = segment_capacity
         self._segment_lengths = segment_lengths
         self._segment_hashes = segment_hashes
+        self._segment_digests = segment_digests
         self._segment_references = segment_references
 
         return segment_index + np.arange(len(segments), dtype=np.int64)
 
+    def defragment(self) -> int:
+        """Remove all free segments between referenced ones. A referenced segment at the end of the memory is moved
+        into a free segment whose capacity is between its length and its own capacity, so that one upload closes the
+        hole. The remaining free segments are removed by deleting all segments behind the first of them and amending
+        the referenced ones in their order. Every moved segment is uploaded again from its host side copy, so the cost
+        of the second step grows with the number of referenced segments behind the first hole. The host side copies
+        are only kept if keep_segment_data was True during the upload. The waveform to segment mappings of all known
+        programs are updated and the armed program is downloaded again.
+
+        Returns:
+            Number of moved segments
+        """
+        index_map = self._defragment()
+        return int(np.count_nonzero((index_map >= 0) & (index_map != np.arange(len(index_map)))))
+
+    @with_command_batch
+    @with_select
+    @with_configuration_guard
+    def _defragment(self, required_points: Optional[int]=None) -> np.ndarray:
+        """Implementation of defragment. If required_points is given, only as many segments are moved as needed to
+        have this many points free at the end of the memory.
+
+        Returns:
+            Array that maps the old segment indices to the new ones. Discarded or overwritten segments are mapped to -1.
+        """
+        old_end = len(self._segment_capacity)
+        index_map = np.arange(old_end, dtype=np.int64)
+
+        def points_at_end(end: int) -> int:
+            return self.total_capacity - int(np.sum(self._segment_capacity[:end], dtype=np.int64))
+
+        # every referenced segment behind the first hole may have to be moved. Check before anything is changed
+        holes = np.flatnonzero(self._segment_references == 0)
+        if len(holes):
+            movable = holes[0] + np.flatnonzero(self._segment_references[holes[0]:] > 0)
+            missing = [segment_index for segment_index in movable.tolist() if segment_index not in self._segment_data]
+            if missing:
+                raise TaborException('Defragmentation needs the host side copies of the segments {}. They are only '
+                                     'kept if keep_segment_data is True'.format(missing))
+
+        # close holes by moving the last referenced segment into them
+        while True:
+            reserved_indices = np.flatnonzero(self._segment_references > 0)
+            last = int(reserved_indices[-1]) if len(reserved_indices) else -1
+            if required_points is not None and points_at_end(last + 1) >= required_points:
+                break
+
+            holes = np.flatnonzero(self._segment_references[:max(last, 0)] == 0)
+            holes = holes[(self._segment_capacity[holes] >= self._segment_lengths[last]) &
+                          (self._segment_capacity[holes] <= self._segment_capacity[last])]
+            if len(holes) == 0:
+                break
+            hole = int(holes[np.argmin(self._segment_capacity[holes])])
+
+            references = self._segment_references[last]
+            self._segment_references[last] = 0
+            self._upload_segment(hole, self._segment_data[last])
+            self._segment_references[hole] = references
+            index_map[index_map == hole] = -1
+            index_map[index_map == last] = hole
+
+        reserved = self._segment_references > 0
+        new_end = int(np.flatnonzero(reserved)[-1]) + 1 if np.any(reserved) else 0
+
+        # remove the remaining holes by amending the segments behind them again
+        holes = np.flatnonzero(~reserved[:new_end])
+        start = new_end
+        if len(holes) and (required_points is None or points_at_end(new_end) < required_points):
+            start = int(holes[0])
+            if required_points is not None:
+                moved_lengths = np.where(reserved[:new_end], self._segment_lengths[:new_end], 0).astype(np.int64)
+                moved_points = np.cumsum(moved_lengths[::-1])[::-1]
+                capacity_in_front = np.cumsum(self._segment_capacity[:new_end], dtype=np.int64) - \
+                                    self._segment_capacity[:new_end]
+                sufficient = holes[self.total_capacity - capacity_in_front[holes] - moved_points[holes]
+                                   >= required_points]
+                if len(sufficient):
+                    start = int(sufficient[-1])
+
+        if start == old_end:
+            return index_map
+
+        to_move = start + np.flatnonzero(reserved[start:new_end])
+        segments = [self._segment_data[segment_index] for segment_index in to_move]
+        references = self._segment_references[to_move]
+
+        delete_cmd = ';'.join('TRAC:DEL {}'.format(i+1) for i in range(start, old_end))
+        self.device.send_cmd(delete_cmd)
+        for segment_index in range(start, old_end):
+            self._segment_data.pop(segment_index, None)
+
+        self._segment_lengths = self._segment_lengths[:start]
+        self._segment_capacity = self._segment_capacity[:start]
+        self._segment_hashes = self._segment_hashes[:start]
+        self._segment_digests = self._segment_digests[:start]
+        self._segment_references = self._segment_references[:start]
+
+        current_to_new = np.arange(old_end, dtype=np.int64)
+        current_to_new[start:] = -1
+        if segments:
+            new_indices = self._amend_segments(segments)
+            self._segment_references[new_indices] = references
+            current_to_new[to_move] = new_indices
+        index_map[index_map >= 0] = current_to_new[index_map[index_map >= 0]]
+
+        for name, program_memory in self._known_programs.items():
+            self._known_programs[name] = program_memory._replace(
+                waveform_to_segment=index_map[program_memory.waveform_to_segment])
+
+        # all sequencer tables refer to the old segment numbers
+        for name in list(self._program_sequences):
+            self._release_sequences(name)
+        self._sequencer_tables = []
+        self._sequence_references = []
+        self.change_armed_program(self._current_program)
+        return index_map
+
+    @with_command_batch
     @with_select
     @with_configuration_guard
     def cleanup(self) -> None:
@@ -928,7 +1602,10 @@ class TaborChannelPair(AWG):
         self._segment_lengths = self._segment_lengths[:new_end]
         self._segment_capacity = self._segment_capacity[:new_end]
         self._segment_hashes = self._segment_hashes[:new_end]
+        self._segment_digests = self._segment_digests[:new_end]
         self._segment_references = self._segment_references[:new_end]
+        for segment_index in range(new_end, old_end):
+            self._segment_data.pop(segment_index, None)
 
         delete_cmd = ';'.join('TRAC:DEL {}'.format(i+1) for i in range(new_end, old_end))
         self.device.send_cmd(delete_cmd)
@@ -955,6 +1632,7 @@ class TaborChannelPair(AWG):
         command_string = ':INST:SEL {}; :OUTP {}'.format(self._channels[channel], 'ON' if active else 'OFF')
         self.device.send_cmd(command_string)
 
+    @with_command_batch
     @with_select
     def arm(self, name: str) -> None:
         if self._current_program == name:
@@ -962,55 +1640,124 @@ class TaborChannelPair(AWG):
         else:
             self.change_armed_program(name)
 
+    @with_command_batch
     @with_select
     @with_configuration_guard
     def change_armed_program(self, name: Optional[str]) -> None:
+        """Arm the program identified by name. Sequencer tables are only downloaded if the program does not own
+        sequence slots yet and the advanced sequencer table only if it changed."""
+        if not self._sequencer_tables or self._sequencer_tables[0] != self._idle_sequence_table:
+            self._download_sequencer_table(0, self._idle_sequence_table)
+        if not self._sequence_references:
+            self._sequence_references = [1]
+
         if name is None:
-            sequencer_tables = [self._idle_sequence_table]
             advanced_sequencer_table = [(1, 1, 0)]
         else:
-            waveform_to_segment_index, program = self._known_programs[name]
-            waveform_to_segment_number = waveform_to_segment_index + 1
-
-            # translate waveform number to actual segment
-            sequencer_tables = [[(rep_count, waveform_to_segment_number[wf_index], jump_flag)
-                                 for (rep_count, wf_index, jump_flag) in sequencer_table]
-                                 for sequencer_table in program.get_sequencer_tables()]
-
-            # insert idle sequence
-            sequencer_tables = [self._idle_sequence_table] + sequencer_tables
+            if name in self._program_sequences:
+                self._program_sequences.move_to_end(name)
+            else:
+                self._program_sequences[name] = self._acquire_sequences(self._get_sequencer_tables(name))
+            # the sequence numbers of the program start at one
+            sequence_numbers = [None] + [sequence_index + 1 for sequence_index in self._program_sequences[name]]
 
-            # adjust advanced sequence table entries by idle sequence table offset
-            advanced_sequencer_table = [(rep_count, seq_no + 1, jump_flag)
+            program = self._known_programs[name].program
+            advanced_sequencer_table = [(rep_count, sequence_numbers[seq_no], jump_flag)
                                         for rep_count, seq_no, jump_flag in program.get_advanced_sequencer_table()]
 
-            if program.waveform_mode == TaborSequencing.SINGLE:
-                assert len(advanced_sequencer_table) == 1
-                assert len(sequencer_tables) == 2
-
-                while len(sequencer_tables[1]) < self.device.dev_properties['min_seq_len']:
-                    assert advanced_sequencer_table[0][0] == 1
-                    sequencer_tables[1].append((1, 1, 0))
-
         # insert idle sequence in advanced sequence table
         advanced_sequencer_table = [(1, 1, 1)] + advanced_sequencer_table
 
         while len(advanced_sequencer_table) < self.device.dev_properties['min_aseq_len']:
             advanced_sequencer_table.append((1, 1, 0))
 
-        # download all sequence tables
-        for i, sequencer_table in enumerate(sequencer_tables):
-            if i >= len(self._sequencer_tables) or self._sequencer_tables[i] != sequencer_table:
-                self.device.send_cmd('SEQ:SEL {}'.format(i+1))
-                self.device.download_sequencer_table(sequencer_table)
-        self._sequencer_tables = sequencer_tables
         self.device.send_cmd('SEQ:SEL 1')
 
-        self.device.download_adv_seq_table(advanced_sequencer_table)
-        self._advanced_sequence_table = advanced_sequencer_table
+        if advanced_sequencer_table != self._advanced_sequence_table:
+            self.device.download_adv_seq_table(advanced_sequencer_table)
+            self._advanced_sequence_table = advanced_sequencer_table
 
         self._current_program = name
 
+    def _get_sequencer_tables(self, name: str) -> List[List[Tuple[int, int, int]]]:
+        """Sequencer tables of the program with the waveform indices translated to segment numbers."""
+        waveform_to_segment_index, program = self._known_programs[name]
+        waveform_to_segment_number = waveform_to_segment_index + 1
+
+        # translate waveform number to actual segment
+        sequencer_tables = [[(rep_count, waveform_to_segment_number[wf_index], jump_flag)
+                             for (rep_count, wf_index, jump_flag) in sequencer_table]
+                            for sequencer_table in program.get_sequencer_tables()]
+
+        if program.waveform_mode == TaborSequencing.SINGLE:
+            assert len(program.get_advanced_sequencer_table()) == 1
+            assert len(sequencer_tables) == 1
+
+            while len(sequencer_tables[0]) < self.device.dev_properties['min_seq_len']:
+                assert program.get_advanced_sequencer_table()[0][0] == 1
+                sequencer_tables[0].append((1, 1, 0))
+        return sequencer_tables
+
+    def _acquire_sequences(self, sequencer_tables: List[List[Tuple[int, int, int]]]) -> List[int]:
+        """Find a sequence slot for each table and increase its reference count. Identical tables that are already in
+        device memory are reused. Other tables are downloaded to unreferenced slots or appended. If the device runs out
+        of sequence slots, the slots of the least recently armed programs are released.
+
+        :return: The sequence indices of the tables
+        """
+        max_sequence_count = int(self.device.dev_properties.get('max_num_seq', sys.maxsize))
+        known_tables = {tuple(table): sequence_index
+                        for sequence_index, table in enumerate(self._sequencer_tables) if table is not None}
+
+        sequence_indices = []
+        try:
+            for sequencer_table in sequencer_tables:
+                sequence_index = known_tables.get(tuple(sequencer_table))
+
+                if sequence_index is None:
+                    free_indices = [i for i, references in enumerate(self._sequence_references) if references == 0]
+                    while not free_indices and len(self._sequence_references) >= max_sequence_count:
+                        unarmed = [name for name in self._program_sequences if name != self._current_program]
+                        if not unarmed:
+                            raise TaborException('Not enough sequence slots', len(sequencer_tables),
+                                                 max_sequence_count)
+                        self._release_sequences(unarmed[0])
+                        free_indices = [i for i, references in enumerate(self._sequence_references)
+                                        if references == 0]
+
+                    if free_indices:
+                        sequence_index = free_indices[0]
+                        if self._sequencer_tables[sequence_index] is not None:
+                            del known_tables[tuple(self._sequencer_tables[sequence_index])]
+                    else:
+                        sequence_index = len(self._sequence_references)
+                        self._sequence_references.append(0)
+                        self._sequencer_tables.append(None)
+                    self._download_sequencer_table(sequence_index, sequencer_table)
+                    known_tables[tuple(sequencer_table)] = sequence_index
+
+                self._sequence_references[sequence_index] += 1
+                sequence_indices.append(sequence_index)
+        except:
+            for sequence_index in sequence_indices:
+                self._sequence_references[sequence_index] -= 1
+            raise
+        return sequence_indices
+
+    def _release_sequences(self, name: str) -> None:
+        """Decrease the reference counts of the sequence slots of the program. The tables stay in device memory and
+        are reused if an identical one is required."""
+        for sequence_index in self._program_sequences.pop(name, ()):
+            self._sequence_references[sequence_index] -= 1
+
+    def _download_sequencer_table(self, sequence_index: int, sequencer_table: List[Tuple[int, int, int]]) -> None:
+        self.device.send_cmd('SEQ:SEL {}'.format(sequence_index + 1))
+        self.device.download_sequencer_table(sequencer_table)
+        if sequence_index < len(self._sequencer_tables):
+            self._sequencer_tables[sequence_index] = sequencer_table
+        else:
+            self._sequencer_tables.append(sequencer_table)
+
     @with_select
     def run_current_program(self) -> None:
         if self._current_program:
@@ -1082,3 +1829,17 @@ class TaborChannelPair(AWG):
 
 class TaborException(Exception):
     pass
+
+
+class TaborFragmentationError(TaborException, MemoryError):
+    """There is enough free memory but it is not contiguous."""
+
+
+class TaborDeviceError(TaborException):
+    """An operation failed on at least one of the mirrored devices. The errors are stored per device."""
+    def __init__(self, operation: str, errors: Dict[Any, BaseException]):
+        super().__init__('{} failed on {} device(s): {}'.format(operation,
+                                                                 len(errors),
+                                                                 '; '.join(repr(error) for error in errors.values())))
+        self.operation = operation
+        self.errors = errors
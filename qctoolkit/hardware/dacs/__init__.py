@@ -1,5 +1,5 @@
 from abc import ABCMeta, abstractmethod
-from typing import Dict, Tuple
+from typing import Dict, Tuple, Union
 
 import numpy
 
@@ -10,9 +10,15 @@ class DAC(metaclass=ABCMeta):
     """Representation of a data acquisition card"""
 
     @abstractmethod
-    def register_measurement_windows(self, program_name: str, windows: Dict[str, Tuple['numpy.ndarray',
-                                                                                       'numpy.ndarray']]) -> None:
-        """"""
+    def register_measurement_windows(self, program_name: str,
+                                     windows: Dict[str, Union[Tuple['numpy.ndarray', 'numpy.ndarray'],
+                                                              'qctoolkit.hardware.program.PeriodicWindows']]) -> None:
+        """The windows are only given as PeriodicWindows if supports_periodic_windows is True"""
+
+    @property
+    def supports_periodic_windows(self) -> bool:
+        """Whether register_measurement_windows accepts PeriodicWindows instead of begins and lengths"""
+        return False
 
     @abstractmethod
     def register_operations(self, program_name: str, operations) -> None:
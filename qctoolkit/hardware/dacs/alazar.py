@@ -1,5 +1,6 @@
-from typing import Dict, Any, Optional, Tuple
+from typing import Dict, Any, Optional, Tuple, Union, List
 from collections import defaultdict
+import functools
 
 import numpy as np
 
@@ -7,6 +8,7 @@ from atsaverage.config import ScanlineConfiguration
 from atsaverage.masks import CrossBufferMask, Mask
 
 from qctoolkit.hardware.dacs import DAC
+from qctoolkit.hardware.program import PeriodicWindows
 
 
 class AlazarProgram:
@@ -14,6 +16,19 @@ class AlazarProgram:
         self.masks = masks
         self.operations = operations
         self.total_length = total_length
+
+    @property
+    def masks(self) -> List[Mask]:
+        """Masks given as functools.partial are only created here, i.e. when the program is armed. This keeps the
+        expanded windows of periodic measurements out of memory while the program is only registered."""
+        if not any(isinstance(mask, functools.partial) for mask in self._masks):
+            return self._masks
+        return [mask() if isinstance(mask, functools.partial) else mask for mask in self._masks]
+
+    @masks.setter
+    def masks(self, masks: List[Union[Mask, functools.partial]]) -> None:
+        self._masks = masks
+
     def __iter__(self):
         yield self.masks
         yield self.operations
@@ -38,13 +53,17 @@ class AlazarCard(DAC):
     def card(self) -> Any:
         return self.__card
 
-    def _make_mask(self, mask_id: str, begins, lengths) -> Mask:
+    @property
+    def supports_periodic_windows(self) -> bool:
+        return True
+
+    def _make_mask(self, mask_id: str, begins, lengths, check_overlaps: bool=True) -> Mask:
         if mask_id not in self._mask_prototypes:
             raise KeyError('Measurement window {} can not be converted as it is not registered.'.format(mask_id))
 
         hardware_channel, mask_type = self._mask_prototypes[mask_id]
 
-        if np.any(begins[:-1]+lengths[:-1] > begins[1:]):
+        if check_overlaps and np.any(begins[:-1]+lengths[:-1] > begins[1:]):
             raise ValueError('Found overlapping windows in begins')
 
         mask = CrossBufferMask()
@@ -54,16 +73,83 @@ class AlazarCard(DAC):
         mask.channel = hardware_channel
         return mask
 
+    def _check_periodic_windows(self, mask_id: str, windows: PeriodicWindows) -> None:
+        """Checks of _make_mask that can be done without expanding the windows."""
+        if mask_id not in self._mask_prototypes:
+            raise KeyError('Measurement window {} can not be converted as it is not registered.'.format(mask_id))
+
+        if windows.has_overlaps():
+            raise ValueError('Found overlapping windows in begins')
+
+    def _make_periodic_mask(self, mask_id: str, windows: PeriodicWindows) -> Mask:
+        """The CrossBufferMask needs explicit begins and lengths, so the windows are expanded here. The checks are done
+        on the periodic windows by _check_periodic_windows."""
+        return self._make_mask(mask_id, *self._expand_sample_windows(windows), check_overlaps=False)
+
+    @staticmethod
+    def _periodic_windows_to_samples(windows: PeriodicWindows, sample_factor: float) -> PeriodicWindows:
+        """Convert the windows of each level to samples without expanding them. The period stays fractional if it is
+        not a whole number of samples. The tolerance is absolute because the rounding error would accumulate over the
+        repetitions."""
+        period = windows.period*sample_factor
+        if np.isclose(period, np.rint(period), rtol=0):
+            period = int(np.rint(period))
+
+        begins = np.rint(windows.begins*sample_factor).astype(dtype=np.uint64)
+        lengths = np.floor(windows.lengths*sample_factor).astype(dtype=np.uint64)
+
+        nested = None
+        if windows.nested is not None:
+            nested = AlazarCard._periodic_windows_to_samples(windows.nested, sample_factor)
+        return PeriodicWindows(begins, lengths, period=period, count=windows.count, nested=nested)
+
+    @staticmethod
+    def _expand_sample_windows(windows: PeriodicWindows) -> Tuple[np.ndarray, np.ndarray]:
+        """Begins and lengths of all windows in samples. The begins of the repetitions are rounded to samples, so only
+        the levels with a fractional period differ from a strictly periodic pattern."""
+        begins, lengths = windows.begins, windows.lengths
+        if windows.nested is not None:
+            nested_begins, nested_lengths = AlazarCard._expand_sample_windows(windows.nested)
+            begins = np.concatenate((begins, nested_begins))
+            sorting_indices = np.argsort(begins, kind='stable')
+            begins, lengths = begins[sorting_indices], np.concatenate((lengths, nested_lengths))[sorting_indices]
+
+        repetition_begins = np.rint(np.arange(windows.count) * windows.period).astype(dtype=np.uint64)
+        return (repetition_begins[:, np.newaxis] + begins).ravel(), np.tile(lengths, windows.count)
+
+    @staticmethod
+    def _get_sample_windows_end(windows: PeriodicWindows) -> Optional[int]:
+        """End of the last window of _expand_sample_windows without expanding the windows."""
+        ends = [] if len(windows.begins) == 0 else [int(np.max(windows.begins + windows.lengths))]
+        if windows.nested is not None:
+            nested_end = AlazarCard._get_sample_windows_end(windows.nested)
+            if nested_end is not None:
+                ends.append(nested_end)
+        if not ends:
+            return None
+        return max(ends) + int(np.rint((windows.count - 1) * windows.period))
+
     def register_measurement_windows(self,
                                      program_name: str,
-                                     windows: Dict[str, Tuple[np.ndarray, np.ndarray]]) -> None:
+                                     windows: Dict[str, Union[Tuple[np.ndarray, np.ndarray], PeriodicWindows]]) -> None:
         if not windows:
             self._registered_programs[program_name].masks = []
         total_length = 0
-        for mask_id, (begins, lengths) in windows.items():
+        for mask_id, mask_windows in windows.items():
 
             sample_factor = self.config.captureClockConfiguration.numeric_sample_rate(self.__card.model) / 10**9
 
+            if isinstance(mask_windows, PeriodicWindows):
+                mask_windows = self._periodic_windows_to_samples(mask_windows, sample_factor)
+                self._check_periodic_windows(mask_id, mask_windows)
+                windows[mask_id] = mask_windows
+                end = self._get_sample_windows_end(mask_windows)
+                if end is not None:
+                    total_length = max(total_length, end)
+                continue
+
+            begins, lengths = mask_windows
+
             begins = np.rint(begins*sample_factor).astype(dtype=np.uint64)
             lengths = np.floor(lengths*sample_factor).astype(dtype=np.uint64)
 
@@ -76,9 +162,12 @@ class AlazarCard(DAC):
 
         total_length = np.ceil(total_length/self.__card.minimum_record_size) * self.__card.minimum_record_size
 
+        # the masks of periodic windows are created when the program is armed
         self._registered_programs[program_name].masks = [
-            self._make_mask(mask_id, *window_begin_length)
-            for mask_id, window_begin_length in windows.items()]
+            functools.partial(self._make_periodic_mask, mask_id, mask_windows)
+            if isinstance(mask_windows, PeriodicWindows)
+            else self._make_mask(mask_id, *mask_windows)
+            for mask_id, mask_windows in windows.items()]
         self._registered_programs[program_name].total_length = total_length
 
     def register_operations(self, program_name: str, operations) -> None:
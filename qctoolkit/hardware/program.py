@@ -1,5 +1,6 @@
 import itertools
-from typing import Union, Dict, Set, Iterable, FrozenSet, Tuple, cast, List, Optional, DefaultDict
+from typing import Union, Dict, Set, Iterable, FrozenSet, Tuple, cast, List, Optional, Sequence, Callable, \
+    NamedTuple
 from collections import defaultdict
 from copy import deepcopy
 from enum import Enum
@@ -16,8 +17,11 @@ from qctoolkit.utils import checked_int_cast, is_integer
 
 from qctoolkit.pulses.sequence_pulse_template import SequenceWaveform
 from qctoolkit.pulses.repetition_pulse_template import RepetitionWaveform
+from qctoolkit.pulses.multi_channel_pulse_template import MultiChannelWaveform
+from qctoolkit.pulses.table_pulse_template import TableWaveform
+from qctoolkit.pulses.interpolation import HoldInterpolationStrategy
 
-__all__ = ['Loop', 'MultiChannelProgram', 'make_compatible']
+__all__ = ['Loop', 'CompactLoop', 'PeriodicWindows', 'MultiChannelProgram', 'make_compatible']
 
 
 TimeType = float
@@ -101,9 +105,11 @@ class Loop(Comparable, Node):
     def unroll(self) -> None:
         for i, e in enumerate(self.parent):
             if id(e) == id(self):
-                self.parent[i:i+1] = (child.copy_tree_structure(new_parent=self.parent)
-                                      for _ in range(self.repetition_count)
-                                      for child in self)
+                # the last repetition reuses the children
+                self.parent[i:i+1] = itertools.chain((child.copy_tree_structure(new_parent=self.parent)
+                                                      for _ in range(self.repetition_count - 1)
+                                                      for child in self),
+                                                     self.children if self.repetition_count > 0 else ())
                 self.parent.assert_tree_integrity()
                 return
         raise Exception('self not found in parent')
@@ -114,9 +120,11 @@ class Loop(Comparable, Node):
 
     def unroll_children(self) -> None:
         old_children = self.children
-        self[:] = (child.copy_tree_structure()
-                   for _ in range(self.repetition_count)
-                   for child in old_children)
+        # the last repetition reuses the children
+        self[:] = itertools.chain((child.copy_tree_structure()
+                                   for _ in range(self.repetition_count - 1)
+                                   for child in old_children),
+                                  old_children if self.repetition_count > 0 else ())
         self.repetition_count = 1
         self.assert_tree_integrity()
 
@@ -151,45 +159,46 @@ class Loop(Comparable, Node):
                           measurements=self._measurements,
                           children=(child.copy_tree_structure() for child in self))
 
-    def _get_measurement_windows(self) -> DefaultDict[str, np.ndarray]:
-        temp_meas_windows = defaultdict(list)
-        if self._measurements:
-            for (mw_name, begin, length) in self._measurements:
-                temp_meas_windows[mw_name].append((begin, length))
-
-            for mw_name, begin_length_list in temp_meas_windows.items():
-                temp_meas_windows[mw_name] = [np.asarray(begin_length_list)]
-
-        # calculate duration together with meas windows in the same iteration
-        if self.is_leaf():
-            body_duration = self.waveform.duration
-        else:
-            offset = TimeType(0)
-            for child in self:
-                for mw_name, begins_length_array in child._get_measurement_windows().items():
-                    begins_length_array[:, 0] += offset
-                    temp_meas_windows[mw_name].append(begins_length_array)
-                offset += child.duration
-
-            body_duration = offset
-
-        # repeat and add repetition based offset
-        for mw_name, begin_length_list in temp_meas_windows.items():
-            temp_begin_length_array = np.concatenate(begin_length_list)
-
-            begin_length_array = np.tile(temp_begin_length_array, (self.repetition_count, 1))
-
-            shaped_begin_length_array = np.reshape(begin_length_array, (self.repetition_count, -1, 2))
-
-            shaped_begin_length_array[:, :, 0] += (np.arange(self.repetition_count) * body_duration)[:, np.newaxis]
-
-            temp_meas_windows[mw_name] = begin_length_array
-
-        return temp_meas_windows
-
-    def get_measurement_windows(self) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
-        return {mw_name: (begin_length_list[:, 0], begin_length_list[:, 1])
-                for mw_name, begin_length_list in self._get_measurement_windows().items()}
+    def _get_measurement_entries(self) -> Tuple[List[int], List[TimeType], List[int], List[TimeType],
+                                                List[Tuple[int, str, TimeType, TimeType]]]:
+        """Collect the repetition structure and the measurements of the tree in a single pass. Each node gets an entry
+        index that is referenced by the measurement triples."""
+        parents = [-1]
+        offsets = [TimeType(0)]
+        repetition_counts = [self.repetition_count]
+        body_durations = [TimeType(0)]
+        measurements = []
+
+        stack = [(self, 0)]
+        while stack:
+            node, entry = stack.pop()
+            if node._measurements:
+                measurements.extend((entry, mw_name, begin, length) for mw_name, begin, length in node._measurements)
+
+            if node.is_leaf():
+                body_durations[entry] = node.waveform.duration if node.waveform else TimeType(0)
+            else:
+                offset = TimeType(0)
+                for child in node:
+                    stack.append((child, len(parents)))
+                    parents.append(entry)
+                    offsets.append(offset)
+                    repetition_counts.append(child.repetition_count)
+                    body_durations.append(TimeType(0))
+                    offset += child.duration
+                body_durations[entry] = offset
+        return parents, offsets, repetition_counts, body_durations, measurements
+
+    def get_measurement_windows(self, periodic: bool=False) -> Dict[str, Union[Tuple[np.ndarray, np.ndarray],
+                                                                              'PeriodicWindows']]:
+        """Measurement windows of the program sorted by their begin.
+
+        Args:
+            periodic: Return a PeriodicWindows object per measurement name instead of the expanded begins and lengths
+        """
+        parents, offsets, repetition_counts, body_durations, measurements = self._get_measurement_entries()
+        return _calculate_measurement_windows(parents, offsets.__getitem__, repetition_counts, body_durations,
+                                              measurements, periodic=periodic)
 
     def split_one_child(self, child_index=None) -> None:
         """Take the last child that has a repetition count larger one, decrease it's repetition count and insert a copy
@@ -212,6 +221,36 @@ class Loop(Comparable, Node):
         self[child_index+1:child_index+1] = (new_child,)
         self.assert_tree_integrity()
 
+    def get_flattened_tables(self) -> List[Tuple[int, List[Tuple[Waveform, int]]]]:
+        """Two level representation of the children like after flatten_and_balance(2) without modifying or copying the
+        tree. The repetition count of this loop is not included.
+
+        Returns:
+            Pairs of repetition count and rows, a row being a pair of waveform and repetition count. The repetitions of
+            unrolled subtrees share the same row lists which must therefore not be modified.
+        """
+        return [table for child in self for table in child._get_flattened_tables()]
+
+    def _get_flattened_tables(self) -> List[Tuple[int, List[Tuple[Waveform, int]]]]:
+        if self.is_leaf():
+            return [(1, [(self.waveform, self.repetition_count)])]
+
+        # a chain of single children is collapsed into one loop
+        repetition_count, body = self.repetition_count, self
+        while body.is_balanced() and body.depth() > 1 and len(body) == 1 and len(body[0]) == 1:
+            body = body[0]
+            repetition_count *= body.repetition_count
+
+        if not body.is_balanced() or body.depth() == 1:
+            return [(repetition_count, [row for child in body for row in child._get_flattened_rows()])]
+        else:
+            return [table for child in body for table in child._get_flattened_tables()] * repetition_count
+
+    def _get_flattened_rows(self) -> List[Tuple[Waveform, int]]:
+        if self.is_leaf():
+            return [(self.waveform, self.repetition_count)]
+        return [row for child in self for row in child._get_flattened_rows()] * self.repetition_count
+
     def flatten_and_balance(self, depth: int) -> None:
         """
         Modifies the program so all tree branches have the same depth
@@ -243,6 +282,350 @@ class Loop(Comparable, Node):
                 sub_program.unroll()
 
 
+class CompactLoop:
+    """Array based representation of a loop tree that needs much less memory than Loop for large programs.
+
+    The nodes are stored in breadth first order so the children of each node are contiguous and node 0 is the root.
+    Each node is described by its parent index, the index of its first child, the number of children, the repetition
+    count and the index of its waveform in the waveform table (-1 for no waveform). The measurements are stored in a
+    dictionary that maps node indices to measurement windows.
+
+    Use from_loop and to_loop for a lossless conversion.
+    """
+    def __init__(self,
+                 parent_indices: Sequence[int],
+                 first_child_indices: Sequence[int],
+                 child_counts: Sequence[int],
+                 repetition_counts: Sequence[int],
+                 waveform_ids: Sequence[int],
+                 waveforms: Sequence[Waveform],
+                 measurements: Optional[Dict[int, List[MeasurementWindow]]]=None):
+        self._parent_indices = np.asarray(parent_indices, dtype=np.int64)
+        self._first_child_indices = np.asarray(first_child_indices, dtype=np.int64)
+        self._child_counts = np.asarray(child_counts, dtype=np.int64)
+        self._repetition_counts = np.asarray(repetition_counts, dtype=np.int64)
+        self._waveform_ids = np.asarray(waveform_ids, dtype=np.int64)
+        self._waveforms = tuple(waveforms)
+        self._measurements = dict() if measurements is None else dict(measurements)
+
+        if len(self._parent_indices) == 0:
+            raise ValueError('A CompactLoop needs a root node')
+        if not (len(self._parent_indices) == len(self._first_child_indices) == len(self._child_counts) ==
+                len(self._repetition_counts) == len(self._waveform_ids)):
+            raise ValueError('The node arrays differ in length')
+
+        self._level_bounds = self._calculate_level_bounds()
+        self._body_durations, self._durations = self._calculate_durations()
+        self._sibling_offsets = self._calculate_sibling_offsets()
+
+    def _calculate_level_bounds(self) -> List[Tuple[int, int]]:
+        """Node index ranges of the tree levels. They follow from the breadth first order."""
+        level_bounds = [(0, 1)]
+        while True:
+            level_begin, level_end = level_bounds[-1]
+            has_children = self._child_counts[level_begin:level_end] > 0
+            if not np.any(has_children):
+                return level_bounds
+            next_level_end = np.max((self._first_child_indices[level_begin:level_end] +
+                                     self._child_counts[level_begin:level_end])[has_children])
+            level_bounds.append((level_end, int(next_level_end)))
+
+    def _calculate_durations(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Duration of a single repetition and total duration of each node. The children are summed up in order like in
+        Loop.duration."""
+        waveform_durations = np.array([0 if waveform is None else waveform.duration for waveform in self._waveforms]
+                                      + [0], dtype=float)
+        leaf_durations = waveform_durations[self._waveform_ids]
+
+        body_durations = np.zeros(len(self._parent_indices))
+        durations = np.zeros(len(self._parent_indices))
+        child_sums = np.zeros(len(self._parent_indices))
+        for level_begin, level_end in reversed(self._level_bounds):
+            level = slice(level_begin, level_end)
+            body_durations[level] = np.where(self._child_counts[level] > 0, child_sums[level], leaf_durations[level])
+            durations[level] = self._repetition_counts[level] * body_durations[level]
+            if level_begin > 0:
+                np.add.at(child_sums, self._parent_indices[level], durations[level])
+        return body_durations, durations
+
+    def _calculate_sibling_offsets(self) -> np.ndarray:
+        """Begin of each node relative to the begin of its parent's body. The siblings are contiguous, so this is the
+        exclusive cumulative sum of the durations minus its value at the first sibling."""
+        exclusive_sums = np.concatenate(([0.], np.cumsum(self._durations[:-1])))
+        sibling_offsets = np.zeros(len(self._durations))
+        sibling_offsets[1:] = exclusive_sums[1:] - exclusive_sums[self._first_child_indices[self._parent_indices[1:]]]
+        return sibling_offsets
+
+    @classmethod
+    def from_loop(cls, loop: Loop) -> 'CompactLoop':
+        parent_indices = [-1]
+        first_child_indices = []
+        child_counts = []
+        repetition_counts = []
+        waveform_ids = []
+        waveforms = []
+        waveform_to_id = dict()
+        measurements = dict()
+
+        nodes = [loop]
+        for node_index, node in enumerate(nodes):
+            children = node.children
+            first_child_indices.append(len(nodes) if children else -1)
+            child_counts.append(len(children))
+            parent_indices.extend(itertools.repeat(node_index, len(children)))
+            nodes.extend(children)
+
+            repetition_counts.append(node.repetition_count)
+            if node.waveform is None:
+                waveform_ids.append(-1)
+            else:
+                # waveforms are identified by identity to keep the conversion lossless
+                waveform_id = waveform_to_id.setdefault(id(node.waveform), len(waveforms))
+                if waveform_id == len(waveforms):
+                    waveforms.append(node.waveform)
+                waveform_ids.append(waveform_id)
+            if node._measurements is not None:
+                measurements[node_index] = node._measurements.copy()
+
+        return cls(parent_indices=parent_indices,
+                   first_child_indices=first_child_indices,
+                   child_counts=child_counts,
+                   repetition_counts=repetition_counts,
+                   waveform_ids=waveform_ids,
+                   waveforms=waveforms,
+                   measurements=measurements)
+
+    def to_loop(self) -> Loop:
+        loops = [None] * len(self._parent_indices)
+        for node_index in reversed(range(len(loops))):
+            first_child = self._first_child_indices[node_index]
+            waveform_id = self._waveform_ids[node_index]
+            measurements = self._measurements.get(node_index)
+            loops[node_index] = Loop(children=loops[first_child:first_child + self._child_counts[node_index]]
+                                     if first_child >= 0 else [],
+                                     waveform=None if waveform_id < 0 else self._waveforms[waveform_id],
+                                     measurements=None if measurements is None else measurements.copy(),
+                                     repetition_count=self._repetition_counts[node_index])
+        return loops[0]
+
+    def _replace_by(self, other: 'CompactLoop') -> None:
+        self.__dict__.update(other.__dict__)
+
+    @property
+    def parent_indices(self) -> np.ndarray:
+        return self._parent_indices
+
+    @property
+    def first_child_indices(self) -> np.ndarray:
+        return self._first_child_indices
+
+    @property
+    def child_counts(self) -> np.ndarray:
+        return self._child_counts
+
+    @property
+    def repetition_counts(self) -> np.ndarray:
+        return self._repetition_counts
+
+    @property
+    def waveform_ids(self) -> np.ndarray:
+        return self._waveform_ids
+
+    @property
+    def durations(self) -> np.ndarray:
+        """Total duration of each node including its repetitions."""
+        return self._durations
+
+    @property
+    def waveforms(self) -> Tuple[Waveform, ...]:
+        return self._waveforms
+
+    @property
+    def measurements(self) -> Dict[int, List[MeasurementWindow]]:
+        return self._measurements
+
+    @property
+    def repetition_count(self) -> int:
+        return int(self._repetition_counts[0])
+
+    @property
+    def duration(self) -> TimeType:
+        return self._durations[0]
+
+    def __len__(self) -> int:
+        return int(self._child_counts[0])
+
+    def is_leaf(self) -> bool:
+        return self._child_counts[0] == 0
+
+    def depth(self) -> int:
+        return len(self._level_bounds) - 1
+
+    def get_children(self, node_index: int=0) -> range:
+        """Node indices of the children of the given node."""
+        first_child = self._first_child_indices[node_index]
+        return range(first_child, first_child + self._child_counts[node_index]) if first_child >= 0 else range(0)
+
+    def get_leaf_indices(self) -> np.ndarray:
+        return np.flatnonzero(self._child_counts == 0)
+
+    def get_measurement_windows(self, periodic: bool=False) -> Dict[str, Union[Tuple[np.ndarray, np.ndarray],
+                                                                              'PeriodicWindows']]:
+        """Same windows as Loop.get_measurement_windows"""
+        measurements = [(node_index, mw_name, begin, length)
+                        for node_index, node_measurements in self._measurements.items()
+                        for mw_name, begin, length in node_measurements]
+        return _calculate_measurement_windows(self._parent_indices, self._sibling_offsets.__getitem__,
+                                              self._repetition_counts, self._body_durations,
+                                              measurements, periodic=periodic)
+
+
+class PeriodicWindows(NamedTuple('PeriodicWindows', [('begins', np.ndarray),
+                                                     ('lengths', np.ndarray),
+                                                     ('period', TimeType),
+                                                     ('count', int),
+                                                     ('nested', Optional['PeriodicWindows'])])):
+    """Measurement windows of one period that are repeated count times. One period consists of the given windows and
+    the windows described by nested. All begins are relative to the program begin and the begins of one period are
+    sorted."""
+    def __new__(cls, begins: np.ndarray, lengths: np.ndarray, period: TimeType, count: int,
+                nested: Optional['PeriodicWindows']=None):
+        return super().__new__(cls, begins, lengths, period, count, nested)
+
+    def _get_period_windows(self) -> Tuple[np.ndarray, np.ndarray]:
+        if self.nested is None:
+            return self.begins, self.lengths
+        nested_begins, nested_lengths = self.nested.expand()
+        if len(self.begins) == 0:
+            return nested_begins, nested_lengths
+        begins = np.concatenate((self.begins, nested_begins))
+        order = np.argsort(begins, kind='stable')
+        return begins[order], np.concatenate((self.lengths, nested_lengths))[order]
+
+    def expand(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Begins and lengths of all windows"""
+        begins, lengths = self._get_period_windows()
+        period_offsets = (np.arange(self.count) * self.period).astype(begins.dtype)
+        return (period_offsets[:, np.newaxis] + begins).ravel(), np.tile(lengths, self.count)
+
+    @property
+    def begin(self) -> Optional[TimeType]:
+        """Begin of the first window"""
+        begins = [] if len(self.begins) == 0 else [self.begins[0]]
+        if self.nested is not None and self.nested.begin is not None:
+            begins.append(self.nested.begin)
+        return min(begins) if begins else None
+
+    @property
+    def period_end(self) -> Optional[TimeType]:
+        """End of the last window in the first period"""
+        ends = [] if len(self.begins) == 0 else [np.max(self.begins + self.lengths)]
+        if self.nested is not None and self.nested.end is not None:
+            ends.append(self.nested.end)
+        return max(ends) if ends else None
+
+    @property
+    def end(self) -> Optional[TimeType]:
+        """End of the last window"""
+        period_end = self.period_end
+        return None if period_end is None else period_end + (self.count - 1) * self.period
+
+    def has_overlaps(self) -> bool:
+        """Check for overlapping windows. Nested windows are only expanded if they share a period with other windows."""
+        if self.nested is not None and len(self.begins) == 0:
+            if self.nested.has_overlaps():
+                return True
+        else:
+            begins, lengths = self._get_period_windows()
+            if np.any(begins[:-1] + lengths[:-1] > begins[1:]):
+                return True
+        return self.count > 1 and self.period_end is not None and self.period_end - self.begin > self.period
+
+
+def _calculate_measurement_windows(parents: Sequence[int],
+                                   get_offset: Callable[[int], TimeType],
+                                   repetition_counts: Sequence[int],
+                                   body_durations: Sequence[TimeType],
+                                   measurements: Iterable[Tuple[int, str, TimeType, TimeType]],
+                                   periodic: bool) -> Dict[str, Union[Tuple[np.ndarray, np.ndarray], PeriodicWindows]]:
+    """Calculate the absolute measurement windows from the repetition structure of a program.
+
+    Entry 0 is the root and every other entry references its parent entry. The begins of every played repetition of a
+    measured entry are computed from the begins of its parent with one broadcast per entry and cached, so each level is
+    only expanded once.
+
+    If periodic is True the repeated entries that contain all windows of a name are only played once and the windows
+    are returned as PeriodicWindows that are nested in the same order as these entries."""
+    windows_by_name = defaultdict(list)
+    for entry, mw_name, begin, length in measurements:
+        windows_by_name[mw_name].append((entry, begin, length))
+
+    # begin caches depending on the entries that are treated as played once
+    begin_caches = defaultdict(dict)
+
+    def get_begins(entry: int, single_entries: Tuple[int, ...]) -> np.ndarray:
+        """Begin of each played repetition of the entry"""
+        begin_cache = begin_caches[single_entries]
+        if entry not in begin_cache:
+            repetition_count = 1 if entry in single_entries else repetition_counts[entry]
+            repetition_offsets = np.arange(repetition_count) * body_durations[entry]
+            parent = parents[entry]
+            if parent < 0:
+                begins = repetition_offsets
+            else:
+                parent_begins = get_begins(parent, single_entries)
+                begins = ((parent_begins + get_offset(entry))[:, np.newaxis] + repetition_offsets).ravel()
+            begin_cache[entry] = begins
+        return begin_cache[entry]
+
+    def get_ancestors(entry: int) -> List[int]:
+        ancestors = [entry]
+        while parents[ancestors[-1]] >= 0:
+            ancestors.append(parents[ancestors[-1]])
+        ancestors.reverse()
+        return ancestors
+
+    meas_windows = dict()
+    for mw_name, windows in windows_by_name.items():
+        periodic_entries = ()
+        if periodic:
+            # the windows are periodic in all repeated entries that are ancestors of all measured entries
+            common_ancestors = None
+            for entry in set(entry for entry, _, _ in windows):
+                ancestors = get_ancestors(entry)
+                if common_ancestors is None:
+                    common_ancestors = ancestors
+                else:
+                    common_ancestors = [a for a, b in zip(common_ancestors, ancestors) if a == b]
+            periodic_entries = tuple(entry for entry in common_ancestors if repetition_counts[entry] > 1)
+
+        begins = []
+        lengths = []
+        for entry, begin, length in windows:
+            entry_begins = get_begins(entry, periodic_entries)
+            begins.append(entry_begins + begin)
+            lengths.append(np.full(len(entry_begins), length, dtype=float))
+        begins = np.concatenate(begins)
+        order = np.argsort(begins, kind='stable')
+        begins, lengths = begins[order], np.concatenate(lengths)[order]
+
+        if not periodic:
+            meas_windows[mw_name] = (begins, lengths)
+        elif not periodic_entries:
+            meas_windows[mw_name] = PeriodicWindows(begins, lengths, period=TimeType(0), count=1)
+        else:
+            # the innermost period holds the windows and every outer period only repeats the nested one
+            nested = None
+            for entry in reversed(periodic_entries):
+                nested = PeriodicWindows(begins, lengths,
+                                         period=body_durations[entry],
+                                         count=int(repetition_counts[entry]),
+                                         nested=nested)
+                begins, lengths = np.zeros(0), np.zeros(0)
+            meas_windows[mw_name] = nested
+    return meas_windows
+
+
 class ChannelSplit(Exception):
     def __init__(self, channel_sets):
         self.channel_sets = channel_sets
@@ -298,19 +681,29 @@ class MultiChannelProgram:
             try:
                 while True:
                     loop = next(iterable)
-                    if len(loop) == 1:
-                        loop.waveform = loop[0].waveform
-                        loop.repetition_count = loop.repetition_count * loop[0].repetition_count
-                        loop[:] = loop[0][:]
+                    # the measurements of the loop would be repeated if the child's repetitions were merged into it
+                    if len(loop) == 1 and (not loop._measurements or loop[0].repetition_count == 1):
+                        child = loop[0]
+                        if child._measurements:
+                            loop._measurements = (loop._measurements or []) + child._measurements
+                        loop.waveform = child.waveform
+                        loop.repetition_count = loop.repetition_count * child.repetition_count
+                        loop[:] = child[:]
                         if len(loop):
                             iterable = itertools.chain((loop,), iterable)
             except StopIteration:
                 pass
 
     @property
-    def programs(self) -> Dict[FrozenSet[ChannelID], Loop]:
+    def programs(self) -> Dict[FrozenSet[ChannelID], Union[Loop, CompactLoop]]:
         return self._programs
 
+    def compact(self) -> None:
+        """Replace the programs by their CompactLoop representation."""
+        for channels, program in self._programs.items():
+            if isinstance(program, Loop):
+                self._programs[channels] = CompactLoop.from_loop(program)
+
     @property
     def channels(self) -> Set[ChannelID]:
         return set(itertools.chain(*self._programs.keys()))
@@ -358,7 +751,7 @@ class MultiChannelProgram:
                     raise Exception('Encountered unhandled instruction {} on channel(s) {}'.format(instruction, channels))
         return root_loop
 
-    def __getitem__(self, item: Union[ChannelID, Set[ChannelID], FrozenSet[ChannelID]]) -> Loop:
+    def __getitem__(self, item: Union[ChannelID, Set[ChannelID], FrozenSet[ChannelID]]) -> Union[Loop, CompactLoop]:
         if not isinstance(item, (set, frozenset)):
             item = frozenset((item,))
         elif isinstance(item, set):
@@ -444,7 +837,126 @@ def _make_compatible(program: Loop, min_len: int, quantum: int, sample_rate: flo
                     _make_compatible(sub_program, min_len, quantum, sample_rate)
 
 
-def make_compatible(program: Loop, minimal_waveform_length: int, waveform_quantum: int, sample_rate: float):
+def _make_constant_waveform(values: Dict[ChannelID, float], duration: float) -> Waveform:
+    """Waveform that holds the given channel values for duration"""
+    channel_waveforms = [TableWaveform(channel, [(0, value, HoldInterpolationStrategy()),
+                                                 (duration, value, HoldInterpolationStrategy())])
+                         for channel, value in values.items()]
+    if len(channel_waveforms) == 1:
+        return channel_waveforms[0]
+    return MultiChannelWaveform(channel_waveforms)
+
+
+def _compress_constant_waveforms(program: Loop, min_len: int, quantum: int, sample_rate: float) -> None:
+    """Replace leaves with long constant waveforms by a waveform of minimal length that is repeated. The program is
+    assumed to be compatible. If the length is no multiple of the minimal length, the remainder is put into a sibling
+    leaf which requires the original leaf to be played only once.
+
+    Leaves with measurements are not changed as the measurements would be repeated."""
+    # smallest waveform length that fulfills both restrictions
+    segment_length = -(-min_len // quantum) * quantum
+
+    for leaf in list(program.get_depth_first_iterator()):
+        if not leaf.is_leaf() or leaf._measurements or leaf.waveform is None:
+            continue
+
+        waveform = leaf.waveform
+        waveform_length = checked_int_cast(waveform.duration * sample_rate)
+        if waveform_length < 2 * segment_length:
+            continue
+
+        values = {channel: waveform.constant_value(channel) for channel in waveform.defined_channels}
+        if None in values.values():
+            continue
+
+        repetition_count, remainder = divmod(waveform_length, segment_length)
+        constant_waveform = _make_constant_waveform(values, segment_length / sample_rate)
+        if remainder == 0:
+            leaf.waveform = constant_waveform
+            leaf.repetition_count = leaf.repetition_count * repetition_count
+
+        elif leaf.repetition_count == 1 and leaf.parent is not None:
+            # the last repetition is merged with the remainder to keep the minimal length
+            remainder_waveform = _make_constant_waveform(values, (segment_length + remainder) / sample_rate)
+            leaf.waveform = constant_waveform
+            leaf.repetition_count = repetition_count - 1
+
+            leaf_index = next(i for i, sibling in enumerate(leaf.parent) if sibling is leaf)
+            leaf.parent[leaf_index + 1:leaf_index + 1] = (Loop(waveform=remainder_waveform),)
+
+
+def _is_compatible_compact(program: CompactLoop, min_len: int, quantum: int, sample_rate: float) -> _CompatibilityLevel:
+    """Vectorized _is_compatible. If all leaves are compatible, all nodes are."""
+    try:
+        program_duration = checked_int_cast(program.duration * sample_rate)
+    except ValueError:
+        return _CompatibilityLevel.incompatible
+
+    if program_duration < min_len or program_duration % quantum > 0:
+        return _CompatibilityLevel.incompatible
+
+    waveform_ids = program.waveform_ids[program.get_leaf_indices()]
+    if np.any(waveform_ids < 0):
+        return _CompatibilityLevel.action_required
+    waveform_durations = np.array([waveform.duration for waveform in program.waveforms]) * sample_rate
+    waveform_quanta = waveform_durations / quantum
+    compatible_waveforms = np.logical_and(np.abs(waveform_quanta - np.round(waveform_quanta)) < 1e-6,
+                                          waveform_durations >= min_len)
+    if np.all(compatible_waveforms[waveform_ids]):
+        return _CompatibilityLevel.compatible
+    else:
+        return _CompatibilityLevel.action_required
+
+
+def _has_compressible_waveforms(program: CompactLoop, min_len: int, quantum: int, sample_rate: float) -> bool:
+    """True if _compress_constant_waveforms would change the program."""
+    segment_length = -(-min_len // quantum) * quantum
+
+    leaf_indices = [leaf_index for leaf_index in program.get_leaf_indices().tolist()
+                    if not program.measurements.get(leaf_index) and program.waveform_ids[leaf_index] >= 0]
+    for waveform_id in set(program.waveform_ids[leaf_indices].tolist()):
+        waveform = program.waveforms[waveform_id]
+        if checked_int_cast(waveform.duration * sample_rate) >= 2 * segment_length and all(
+                waveform.constant_value(channel) is not None for channel in waveform.defined_channels):
+            return True
+    return False
+
+
+def make_compatible(program: Union[Loop, CompactLoop], minimal_waveform_length: int, waveform_quantum: int,
+                    sample_rate: float, compress_constant_waveforms: bool=True) -> None:
+    """Modify the program so all waveforms fulfill the given restrictions on their length in samples.
+
+    Args:
+        program: The program is modified in place. A CompactLoop is only converted to a Loop if it needs to be changed.
+        minimal_waveform_length: Minimal number of samples of a waveform
+        waveform_quantum: The number of samples of a waveform must be a multiple of this
+        sample_rate: Samples per time unit
+        compress_constant_waveforms: If true, long waveforms that are constant are replaced by a repetition of a
+            waveform of minimal length.
+    """
+    if isinstance(program, CompactLoop):
+        comp_level = _is_compatible_compact(program,
+                                            min_len=minimal_waveform_length,
+                                            quantum=waveform_quantum,
+                                            sample_rate=sample_rate)
+        if comp_level == _CompatibilityLevel.incompatible:
+            raise ValueError('The program cannot be made compatible to restrictions')
+
+        if comp_level == _CompatibilityLevel.action_required or (compress_constant_waveforms and
+                                                                 _has_compressible_waveforms(
+                                                                     program,
+                                                                     min_len=minimal_waveform_length,
+                                                                     quantum=waveform_quantum,
+                                                                     sample_rate=sample_rate)):
+            loop = program.to_loop()
+            make_compatible(loop,
+                            minimal_waveform_length=minimal_waveform_length,
+                            waveform_quantum=waveform_quantum,
+                            sample_rate=sample_rate,
+                            compress_constant_waveforms=compress_constant_waveforms)
+            program._replace_by(CompactLoop.from_loop(loop))
+        return
+
     comp_level = _is_compatible(program,
                                 min_len=minimal_waveform_length,
                                 quantum=waveform_quantum,
@@ -456,3 +968,9 @@ def make_compatible(program: Loop, minimal_waveform_length: int, waveform_quantu
                          min_len=minimal_waveform_length,
                          quantum=waveform_quantum,
                          sample_rate=sample_rate)
+
+    if compress_constant_waveforms:
+        _compress_constant_waveforms(program,
+                                     min_len=minimal_waveform_length,
+                                     quantum=waveform_quantum,
+                                     sample_rate=sample_rate)
@@ -4,7 +4,7 @@ import warnings
 
 from qctoolkit.hardware.awgs.base import AWG
 from qctoolkit.hardware.dacs import DAC
-from qctoolkit.hardware.program import MultiChannelProgram
+from qctoolkit.hardware.program import MultiChannelProgram, PeriodicWindows
 
 from qctoolkit.utils.types import ChannelID
 
@@ -64,7 +64,8 @@ class MarkerChannel(_SingleChannel):
 
 
 RegisteredProgram = NamedTuple('RegisteredProgram', [('program', MultiChannelProgram),
-                                                     ('measurement_windows', Dict[str, Tuple[float, float]]),
+                                                     ('measurement_windows',
+                                                      Dict[str, Union[Tuple[np.ndarray, np.ndarray], PeriodicWindows]]),
                                                      ('run_callback', Callable),
                                                      ('awgs_to_upload_to', Set[AWG]),
                                                      ('dacs_to_arm', Set[DAC])])
@@ -95,8 +96,8 @@ class HardwareSetup:
 
         temp_measurement_windows = defaultdict(list)
         for program in mcp.programs.values():
-            for mw_name, begins_lengths in program.get_measurement_windows().items():
-                temp_measurement_windows[mw_name].append(begins_lengths)
+            for mw_name, windows in program.get_measurement_windows(periodic=True).items():
+                temp_measurement_windows[mw_name].append(windows)
 
         if set(temp_measurement_windows.keys()) - set(self._measurement_map.keys()):
             raise KeyError('The following measurements are not registered: {}\nUse set_measurement for that.'.format(
@@ -105,18 +106,28 @@ class HardwareSetup:
 
         measurement_windows = dict()
         while temp_measurement_windows:
-            mw_name, begins_lengths_deque = temp_measurement_windows.popitem()
+            mw_name, windows_list = temp_measurement_windows.popitem()
 
-            begins, lengths = zip(*begins_lengths_deque)
-            measurement_windows[mw_name] = (
-                np.concatenate(begins),
-                np.concatenate(lengths)
-            )
+            if len(windows_list) == 1:
+                measurement_windows[mw_name] = windows_list[0]
+            else:
+                # windows of different programs are not periodic together
+                begins, lengths = zip(*(windows.expand() for windows in windows_list))
+                measurement_windows[mw_name] = (
+                    np.concatenate(begins),
+                    np.concatenate(lengths)
+                )
 
         affected_dacs = defaultdict(dict)
-        for measurement_name, begins_lengths in measurement_windows.items():
+        for measurement_name, windows in measurement_windows.items():
+            expanded_windows = None
             for dac, mask_name in self._measurement_map[measurement_name]:
-                affected_dacs[dac][mask_name] = begins_lengths
+                if isinstance(windows, PeriodicWindows) and not dac.supports_periodic_windows:
+                    if expanded_windows is None:
+                        expanded_windows = windows.expand()
+                    affected_dacs[dac][mask_name] = expanded_windows
+                else:
+                    affected_dacs[dac][mask_name] = windows
 
         handled_awgs = set()
         for channels, program in mcp.programs.items():
@@ -1,31 +1,43 @@
-from typing import List, Sequence
+from typing import List, Optional, Sequence, Iterable, Generator, Any, Tuple
+import bisect
+import queue
+import threading
 
 import numpy as np
 
 __all__ = ['voltage_to_uint16']
 
 
-def voltage_to_uint16(voltage: np.ndarray, output_amplitude: float, output_offset: float, resolution: int) -> np.ndarray:
+def voltage_to_uint16(voltage: np.ndarray, output_amplitude: float, output_offset: float, resolution: int,
+                      output_array: Optional[np.ndarray]=None,
+                      scratch_array: Optional[np.ndarray]=None) -> np.ndarray:
     """
 
     :param voltage:
     :param output_amplitude:
     :param output_offset:
     :param resolution:
+    :param output_array: Integer array the result is written to. A new uint16 array is created if None.
+    :param scratch_array: Float array of the same length that holds the intermediate results. A new array is created if
+        None. Passing voltage itself converts without any temporary arrays but overwrites the voltage.
     :return:
     """
     if resolution < 1 or not isinstance(resolution, int):
         raise ValueError('The resolution must be an integer > 0')
-    non_dc_voltage = voltage - output_offset
+    non_dc_voltage = np.subtract(voltage, output_offset, out=scratch_array)
 
-    if np.any(np.abs(non_dc_voltage) > output_amplitude):
+    # min and max reduce without the temporaries of np.abs and the comparison
+    if non_dc_voltage.size and (non_dc_voltage.min() < -output_amplitude or non_dc_voltage.max() > output_amplitude):
         raise ValueError('Voltage of range', dict(voltage=voltage,
                                                   output_offset=output_offset,
                                                   output_amplitude=output_amplitude))
     non_dc_voltage += output_amplitude
     non_dc_voltage *= (2**resolution - 1) / (2*output_amplitude)
     np.rint(non_dc_voltage, out=non_dc_voltage)
-    return non_dc_voltage.astype(np.uint16)
+    if output_array is None:
+        return non_dc_voltage.astype(np.uint16)
+    output_array[...] = non_dc_voltage
+    return output_array
 
 
 def make_combined_wave(segments: List['TaborSegment'], destination_array=None, fill_value=None) -> np.ndarray:
@@ -81,3 +93,117 @@ def find_positions(data: Sequence, to_find: Sequence) -> np.ndarray:
     positions[found] = data_sorter[pos_left[found]]
 
     return positions
+
+
+def iterate_in_background(iterable: Iterable, max_queue_size: int) -> Generator[Any, None, None]:
+    """Iterate over iterable in a background thread. The consumer receives the elements in order through a queue of
+    at most max_queue_size elements, i.e. the producer runs at most that many elements ahead. Exceptions of the
+    producer are raised in the consumer and closing the generator stops the producer."""
+    if max_queue_size < 1:
+        raise ValueError('The queue size has to be at least one')
+    elements = queue.Queue(maxsize=max_queue_size)
+    stopped = threading.Event()
+    end = object()
+
+    def put(item) -> bool:
+        while not stopped.is_set():
+            try:
+                elements.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce() -> None:
+        try:
+            for element in iterable:
+                if not put((element, None)):
+                    return
+        except BaseException as exception:
+            put((end, exception))
+        else:
+            put((end, None))
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        while True:
+            element, exception = elements.get()
+            if element is end:
+                if exception is not None:
+                    raise exception
+                return
+            yield element
+    finally:
+        stopped.set()
+        producer.join()
+
+
+class BestFitAllocator:
+    """Free list of memory holes that is indexed by the hole capacity.
+
+    The holes are kept in an array sorted by (capacity, key), so the best fitting hole for a requested size, i.e. the
+    smallest one that is large enough, is found by bisection. Ties are resolved by the smallest key.
+    """
+
+    def __init__(self, holes: Iterable[Tuple[int, int]]=()) -> None:
+        """Create a new BestFitAllocator instance.
+
+        Args:
+            holes: Pairs of key and capacity of the initially free holes. The key identifies a hole, e.g. by its
+                segment index.
+        """
+        self._capacities = dict(holes)
+        self._sorted_holes = sorted((capacity, key) for key, capacity in self._capacities.items())
+        self._free_total = sum(self._capacities.values())
+
+    def __len__(self) -> int:
+        return len(self._sorted_holes)
+
+    def __contains__(self, key: int) -> bool:
+        return key in self._capacities
+
+    def capacity(self, key: int) -> int:
+        return self._capacities[key]
+
+    def add(self, key: int, capacity: int) -> None:
+        if key in self._capacities:
+            raise ValueError('Hole {} is already free'.format(key))
+        self._capacities[key] = capacity
+        bisect.insort(self._sorted_holes, (capacity, key))
+        self._free_total += capacity
+
+    def remove(self, key: int) -> None:
+        capacity = self._capacities.pop(key)
+        del self._sorted_holes[bisect.bisect_left(self._sorted_holes, (capacity, key))]
+        self._free_total -= capacity
+
+    def find_best_fit(self, size: int) -> Optional[int]:
+        """Key of the smallest hole with a capacity of at least size or None if there is no such hole."""
+        position = bisect.bisect_left(self._sorted_holes, (size,))
+        if position == len(self._sorted_holes):
+            return None
+        return self._sorted_holes[position][1]
+
+    def allocate(self, size: int) -> Optional[int]:
+        """Remove the best fitting hole for size and return its key. Returns None if no hole is large enough."""
+        key = self.find_best_fit(size)
+        if key is not None:
+            self.remove(key)
+        return key
+
+    @property
+    def free_total(self) -> int:
+        """Summed capacity of all holes."""
+        return self._free_total
+
+    @property
+    def largest_hole(self) -> int:
+        return self._sorted_holes[-1][0] if self._sorted_holes else 0
+
+    @property
+    def fragmentation(self) -> float:
+        """Fraction of the free capacity that is not part of the largest hole. Zero means no fragmentation."""
+        if self._free_total == 0:
+            return 0.
+        return 1. - self.largest_hole / self._free_total
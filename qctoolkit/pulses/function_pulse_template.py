@@ -7,7 +7,7 @@ Classes:
 """
 
 
-from typing import Any, Dict, List, Set, Optional, Union
+from typing import Any, Dict, List, Set, Optional, Union, Sequence
 import numbers
 
 import numpy as np
@@ -17,7 +17,8 @@ from qctoolkit.serialization import Serializer
 
 from qctoolkit.utils.types import MeasurementWindow, ChannelID
 from qctoolkit.pulses.conditions import Condition
-from qctoolkit.pulses.parameters import Parameter, ParameterConstrainer, ParameterConstraint
+from qctoolkit.pulses.parameters import Parameter, ParameterConstrainer, ParameterConstraint, \
+    ParameterNotProvidedException
 from qctoolkit.pulses.pulse_template import AtomicPulseTemplate, MeasurementDeclaration
 from qctoolkit.pulses.instructions import Waveform
 from qctoolkit.pulses.measurement import MeasurementDefiner
@@ -105,12 +106,18 @@ class FunctionPulseTemplate(AtomicPulseTemplate, ParameterConstrainer):
         if 't' in parameters:
             parameters = {k: v for k, v in parameters.items() if k != 't'}
 
-        expression = self.__expression.evaluate_symbolic(substitutions=parameters)
+        missing = set(self.__expression.variables) - {'t'} - set(parameters.keys())
+        if missing:
+            raise ParameterNotProvidedException(missing.pop())
+
         duration = self.__duration_expression.evaluate_numeric(**parameters)
 
-        return FunctionWaveform(expression=expression,
+        # all waveforms share the compiled expression of this template
+        return FunctionWaveform(expression=self.__expression,
                                 duration=duration,
-                                channel=channel_mapping[self.__channel])
+                                channel=channel_mapping[self.__channel],
+                                parameters={name: parameters[name]
+                                            for name in self.__expression.variables if name != 't'})
 
     def requires_stop(self,
                       parameters: Dict[str, Parameter],
@@ -152,23 +159,32 @@ class FunctionWaveform(Waveform):
 
     def __init__(self, expression: ExpressionScalar,
                  duration: float,
-                 channel: ChannelID) -> None:
+                 channel: ChannelID,
+                 parameters: Optional[Dict[str, numbers.Real]]=None) -> None:
         """Creates a new FunctionWaveform instance.
 
         Args:
             expression: The function represented by this FunctionWaveform
-                as a mathematical expression where 't' denotes the time variable. It must not have other variables
+                as a mathematical expression where 't' denotes the time variable. All other variables have to be
+                provided in parameters
             duration: The duration of the waveform
-            measurement_windows: A list of measurement windows
             channel: The channel this waveform is played on
+            parameters: Values of the variables of expression other than 't'. The expression is not substituted so
+                waveforms with the same expression object share its compiled lambda.
         """
         super().__init__()
-        if set(expression.variables) - set('t'):
-            raise ValueError('FunctionWaveforms may not depend on anything but "t"')
+        parameters = dict() if parameters is None else parameters
+        if set(expression.variables) - set('t') - set(parameters.keys()):
+            raise ValueError('FunctionWaveforms may not depend on anything but "t" and the provided parameters')
 
         self._expression = expression
         self._duration = duration
         self._channel_id = channel
+        self._parameters = tuple(sorted((name, parameters[name]) for name in expression.variables if name != 't'))
+
+        # positional arguments of the compiled expression with a placeholder for the sample times
+        self._arguments = [None if name == 't' else parameters[name] for name in expression.variables]
+        self._time_index = expression.variables.index('t') if 't' in expression.variables else None
 
     @property
     def defined_channels(self) -> Set[ChannelID]:
@@ -176,7 +192,7 @@ class FunctionWaveform(Waveform):
     
     @property
     def compare_key(self) -> Any:
-        return self._channel_id, self._expression, self._duration
+        return self._channel_id, self._expression.underlying_expression, self._duration, self._parameters
 
     @property
     def duration(self) -> float:
@@ -188,7 +204,25 @@ class FunctionWaveform(Waveform):
                       output_array: Union[np.ndarray, None] = None) -> np.ndarray:
         if output_array is None:
             output_array = np.empty(len(sample_times))
-        output_array[:] = self._expression.evaluate_numeric(t=sample_times)
+        arguments = self._arguments
+        if self._time_index is not None:
+            arguments = arguments.copy()
+            arguments[self._time_index] = sample_times
+        result = self._expression.evaluate_numeric_positional(arguments)
+        if np.ndim(result) != 0 and np.shape(result) != np.shape(sample_times):
+            raise ValueError('The expression {} evaluated to shape {} instead of {}'.format(
+                self._expression, np.shape(result), np.shape(sample_times)))
+        output_array[:] = result
+        return output_array
+
+    def unsafe_sample_channels(self,
+                               channels: Sequence[ChannelID],
+                               sample_times: np.ndarray,
+                               output_array: np.ndarray) -> np.ndarray:
+        # single channel waveform -> the expression is evaluated only once
+        if len(channels):
+            self.unsafe_sample(self._channel_id, sample_times, output_array[0])
+            output_array[1:] = output_array[0]
         return output_array
 
     def unsafe_get_subset_for_channels(self, channels: Set[ChannelID]) -> Waveform:
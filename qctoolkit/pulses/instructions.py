@@ -18,12 +18,13 @@ Classes:
 
 from abc import ABCMeta, abstractmethod, abstractproperty
 from typing import List, Any, Dict, Iterable, Optional, Sequence, Union, Set, Tuple
-from weakref import WeakValueDictionary
+import hashlib
 
 import numpy
 
 from qctoolkit.utils.types import ChannelID, MeasurementWindow
 from qctoolkit.comparable import Comparable
+from qctoolkit.pulses.sample_cache import SampleCache
 
 __all__ = ["Waveform", "Trigger",
            "InstructionPointer", "Instruction", "CJMPInstruction", "EXECInstruction",
@@ -32,11 +33,19 @@ __all__ = ["Waveform", "Trigger",
            ]
 
 
+# deviation in units of samples that is attributed to rounding errors when converting times to sample indices
+_sample_index_tolerance = 1e-7
+
+
 class Waveform(Comparable, metaclass=ABCMeta):
     """Represents an instantiated PulseTemplate which can be sampled to retrieve arrays of voltage
     values for the hardware."""
 
-    __sampled_cache = WeakValueDictionary()
+    # shared by all waveforms for the results of sampling calls without output array
+    sample_cache = SampleCache()
+
+    # waveforms are immutable so the structural hash is computed only once
+    _cached_hash = None
 
     @abstractproperty
     def duration(self) -> float:
@@ -71,7 +80,9 @@ class Waveform(Comparable, metaclass=ABCMeta):
         Args/Result:
             sample_times: Times at which this Waveform will be sampled.
             output_array: Has to be either None or an array of the same size and type as sample_times.
-                 - If None, a new array will be created and cached to save memory.
+                 - If None, the result is looked up in or added to Waveform.sample_cache. The returned array is
+                   read only and may be shared with other callers, so copy it before modifying it. Waveforms with an
+                   unhashable compare key are sampled without caching.
                  - If not None, the sampled values will be written here and this array will be returned.
         Result:
             The sampled values of this Waveform at the provided sample times.
@@ -84,21 +95,14 @@ class Waveform(Comparable, metaclass=ABCMeta):
             else:
                 raise ValueError('Output array length and sample time length are different')
 
-        if numpy.any(sample_times[:-1] >= sample_times[1:]):
-            raise ValueError('The sample times are not monotonously increasing')
-        if sample_times[0] < 0 or sample_times[-1] > self.duration:
-            raise ValueError('The sample times are not in the range [0, duration]')
+        self._check_sample_times(sample_times)
         if channel not in self.defined_channels:
             raise KeyError('Channel not defined in this waveform: {}'.format(channel))
 
         if output_array is None:
-            # cache the result to save memory
-            result = self.unsafe_sample(channel, sample_times)
-            result.flags.writeable = False
-            key = hash(bytes(result))
-            if key not in self.__sampled_cache:
-                self.__sampled_cache[key] = result
-            return self.__sampled_cache[key]
+            # equal waveforms sampled on equal sample times share the result
+            key = (self, channel, self._get_sample_times_key(sample_times))
+            return self.sample_cache.get_or_sample(key, lambda: self.unsafe_sample(channel, sample_times))
         else:
             if len(output_array) != len(sample_times):
                 raise ValueError('Output array length and sample time length are different')
@@ -107,6 +111,222 @@ class Waveform(Comparable, metaclass=ABCMeta):
                                       sample_times=sample_times,
                                       output_array=output_array)
 
+    def unsafe_sample_channels(self,
+                               channels: Sequence[ChannelID],
+                               sample_times: numpy.ndarray,
+                               output_array: numpy.ndarray) -> numpy.ndarray:
+        """Sample several channels of the waveform at the same sample times.
+
+        The same restrictions as for unsafe_sample apply. This default implementation samples each channel separately.
+        Waveforms that can share work between channels (e.g. the partitioning of the sample times) override it.
+
+        Args:
+            channels: The channels to sample. A channel may occur multiple times.
+            sample_times: Times at which this Waveform will be sampled.
+            output_array: Array of shape (len(channels), len(sample_times)). The samples of channels[i] are written to
+                output_array[i].
+        Result:
+            output_array
+        """
+        for channel, channel_output in zip(channels, output_array):
+            self.unsafe_sample(channel=channel, sample_times=sample_times, output_array=channel_output)
+        return output_array
+
+    def sample_channels(self,
+                        channels: Sequence[ChannelID],
+                        sample_times: numpy.ndarray,
+                        output_array: Union[numpy.ndarray, None]=None) -> numpy.ndarray:
+        """Sample several channels with one traversal of the waveform. This method enforces the constrains
+        unsafe_sample_channels expects.
+
+        Args:
+            channels: The channels to sample.
+            sample_times: Times at which this Waveform will be sampled.
+            output_array: Has to be either None or an array of shape (len(channels), len(sample_times)). If not None,
+                the sampled values will be written here and this array will be returned. If None, the result is looked
+                up in or added to Waveform.sample_cache and the returned array is read only.
+        Result:
+            The sampled values of the channels as a two dimensional array with one row per channel.
+        """
+        shape = (len(channels), len(sample_times))
+        if output_array is not None and output_array.shape != shape:
+            raise ValueError('Output array has shape {} instead of {}'.format(output_array.shape, shape))
+
+        if not set(channels) <= self.defined_channels:
+            raise KeyError('Channels not defined in this waveform: {}'.format(set(channels) - self.defined_channels))
+        if len(sample_times) == 0:
+            return numpy.empty(shape) if output_array is None else output_array
+        self._check_sample_times(sample_times)
+
+        if output_array is None:
+            key = (self, tuple(channels), self._get_sample_times_key(sample_times))
+            return self.sample_cache.get_or_sample(key, lambda: self.unsafe_sample_channels(
+                channels=channels, sample_times=sample_times, output_array=numpy.empty(shape)))
+        return self.unsafe_sample_channels(channels=channels, sample_times=sample_times, output_array=output_array)
+
+    def unsafe_sample_channels_uniform(self,
+                                       channels: Sequence[ChannelID],
+                                       n_samples: int,
+                                       sample_rate: float,
+                                       t0: float,
+                                       output_array: numpy.ndarray) -> numpy.ndarray:
+        """Sample several channels on the uniform grid t0 + i / sample_rate for i in range(n_samples).
+
+        The grid is assumed to lie in the range of [0, waveform.duration]. This default implementation creates the
+        sample times explicitly. Waveforms that are composed of parts override it and compute the part boundaries as
+        sample indices (see :func:`~Waveform._get_sample_indices`).
+
+        Args:
+            channels: The channels to sample.
+            n_samples: Number of samples.
+            sample_rate: Number of samples per time unit.
+            t0: Time of the first sample.
+            output_array: Array of shape (len(channels), n_samples).
+        Result:
+            output_array
+        """
+        sample_times = numpy.arange(n_samples) / sample_rate
+        if t0:
+            sample_times += t0
+        return self.unsafe_sample_channels(channels=channels, sample_times=sample_times, output_array=output_array)
+
+    def sample_channels_uniform(self,
+                                channels: Sequence[ChannelID],
+                                n_samples: int,
+                                sample_rate: float,
+                                t0: float=0,
+                                output_array: Union[numpy.ndarray, None]=None) -> numpy.ndarray:
+        """Sample several channels on a uniform grid. In contrast to sample_channels neither a sample time array
+        has to be provided nor its monotony is checked.
+
+        Args:
+            channels: The channels to sample.
+            n_samples: Number of samples.
+            sample_rate: Number of samples per time unit.
+            t0: Time of the first sample.
+            output_array: Has to be either None or an array of shape (len(channels), n_samples). If None, the result
+                is looked up in or added to Waveform.sample_cache and the returned array is read only.
+        Result:
+            The sampled values of the channels as a two dimensional array with one row per channel.
+        """
+        shape = (len(channels), n_samples)
+        if output_array is not None and output_array.shape != shape:
+            raise ValueError('Output array has shape {} instead of {}'.format(output_array.shape, shape))
+
+        if not set(channels) <= self.defined_channels:
+            raise KeyError('Channels not defined in this waveform: {}'.format(set(channels) - self.defined_channels))
+        if sample_rate <= 0:
+            raise ValueError('The sample rate has to be positive')
+        if n_samples == 0:
+            return numpy.empty(shape) if output_array is None else output_array
+        if t0 < 0 or t0 + (n_samples - 1) / sample_rate > self.duration:
+            raise ValueError('The sample times are not in the range [0, duration]')
+
+        if output_array is None:
+            # the grid is fully described by its parameters
+            key = (self, tuple(channels), (n_samples, sample_rate, t0))
+            return self.sample_cache.get_or_sample(key, lambda: self.unsafe_sample_channels_uniform(
+                channels=channels, n_samples=n_samples, sample_rate=sample_rate, t0=t0,
+                output_array=numpy.empty(shape)))
+        return self.unsafe_sample_channels_uniform(channels=channels,
+                                                   n_samples=n_samples,
+                                                   sample_rate=sample_rate,
+                                                   t0=t0,
+                                                   output_array=output_array)
+
+    def sample_uniform(self,
+                       channel: ChannelID,
+                       n_samples: int,
+                       sample_rate: float,
+                       t0: float=0,
+                       output_array: Union[numpy.ndarray, None]=None) -> numpy.ndarray:
+        """Sample one channel on the uniform grid t0 + i / sample_rate for i in range(n_samples).
+
+        Args:
+            channel: The channel to sample.
+            n_samples: Number of samples.
+            sample_rate: Number of samples per time unit.
+            t0: Time of the first sample.
+            output_array: Has to be either None or an array of length n_samples.
+        Result:
+            The sampled values.
+        """
+        if output_array is None:
+            return self.sample_channels_uniform(channels=(channel,),
+                                                n_samples=n_samples,
+                                                sample_rate=sample_rate,
+                                                t0=t0)[0]
+        elif output_array.shape != (n_samples,):
+            raise ValueError('Output array length and sample count are different')
+        self.sample_channels_uniform(channels=(channel,),
+                                     n_samples=n_samples,
+                                     sample_rate=sample_rate,
+                                     t0=t0,
+                                     output_array=output_array[numpy.newaxis, :])
+        return output_array
+
+    @staticmethod
+    def _get_sample_indices(times: numpy.ndarray, n_samples: int, sample_rate: float, t0: float) -> numpy.ndarray:
+        """Index of the first sample of the grid t0 + i / sample_rate that is not before the respective time. Rounding
+        errors of times that lie on the grid are tolerated. The result is clipped to [0, n_samples]."""
+        indices = numpy.ceil((numpy.asarray(times, dtype=float) - t0) * sample_rate - _sample_index_tolerance)
+        return numpy.clip(indices, 0, n_samples).astype(numpy.int64)
+
+    @staticmethod
+    def _get_sample_times_key(sample_times: numpy.ndarray) -> Tuple[int, bytes]:
+        """Compact cache key of arbitrary sample times"""
+        sample_times = numpy.ascontiguousarray(sample_times, dtype=float)
+        return len(sample_times), hashlib.blake2b(sample_times, digest_size=16).digest()
+
+    def _check_sample_times(self, sample_times: numpy.ndarray) -> None:
+        if numpy.any(sample_times[:-1] >= sample_times[1:]):
+            raise ValueError('The sample times are not monotonously increasing')
+        if sample_times[0] < 0 or sample_times[-1] > self.duration:
+            raise ValueError('The sample times are not in the range [0, duration]')
+
+    def __hash__(self) -> int:
+        if self._cached_hash is None:
+            self._cached_hash = self._compute_hash()
+        return self._cached_hash
+
+    def _compute_hash(self) -> int:
+        """Waveforms that are composed of other waveforms override this to combine the cached hashes of their
+        parts instead of hashing the nested compare key."""
+        return hash(self.compare_key)
+
+    def __eq__(self, other: Any) -> bool:
+        if self is other:
+            return True
+        if isinstance(other, Waveform):
+            try:
+                if hash(self) != hash(other):
+                    return False
+            except TypeError:
+                # the compare key of one of the waveforms is not hashable
+                pass
+        return super().__eq__(other)
+
+    def constant_value(self, channel: ChannelID) -> Optional[float]:
+        """The value of the channel if it is constant on [0, duration) and None if it is not constant or this is
+        unknown. The default implementation makes no assumptions about the waveform."""
+        return None
+
+    def constant_intervals(self, channel: ChannelID) -> List[Tuple[float, float, float]]:
+        """Maximal intervals [begin, end) of positive length on which the channel is constant.
+
+        Returns:
+            A list of (begin, end, value) tuples sorted by begin
+        """
+        value = self.constant_value(channel)
+        if value is None:
+            return []
+        return [(0, self.duration, value)]
+
+    @property
+    def is_constant(self) -> bool:
+        """True if all defined channels are constant"""
+        return all(self.constant_value(channel) is not None for channel in self.defined_channels)
+
     @abstractproperty
     def defined_channels(self) -> Set[ChannelID]:
         """The channels this waveform should played on. Use
@@ -9,7 +9,7 @@ Classes:
 
 
 from abc import ABCMeta, abstractmethod
-from typing import Any, Tuple
+from typing import Any, Tuple, Optional
 import numpy as np
 
 
@@ -37,6 +37,27 @@ class InterpolationStrategy(metaclass=ABCMeta):
             A numpy.ndarray containing the interpolated values.
         """
 
+    def unsafe_interpolate(self,
+                           start: Tuple[float, float],
+                           end: Tuple[float, float],
+                           times: np.ndarray,
+                           output_array: np.ndarray) -> np.ndarray:
+        """Write the interpolated values into output_array. The times are not checked against the boundaries.
+
+        The default implementation copies the result of __call__. Strategies override this to write into
+        output_array directly.
+
+        Args:
+            start ((float, float)): The start point of the interpolation as (time, value) pair.
+            end ((float, float)): The end point of the interpolation as (time, value) pair.
+            times (numpy.ndarray): An array of sample times for which values will be computed.
+            output_array (numpy.ndarray): Array of the same size as times.
+        Returns:
+            output_array
+        """
+        output_array[:] = self(start, end, times)
+        return output_array
+
     @abstractmethod
     def __repr__(self) -> str:
         """String representation of the Interpolation Strategy Class"""
@@ -58,9 +79,22 @@ class LinearInterpolationStrategy(InterpolationStrategy):
     def __call__(self,
                  start: Tuple[float, float],
                  end: Tuple[float, float],
-                 times: np.ndarray) -> np.ndarray:
+                 times: np.ndarray,
+                 output_array: Optional[np.ndarray]=None) -> np.ndarray:
+        if output_array is None:
+            output_array = np.empty_like(times, dtype=float)
+        return self.unsafe_interpolate(start, end, times, output_array)
+
+    def unsafe_interpolate(self,
+                           start: Tuple[float, float],
+                           end: Tuple[float, float],
+                           times: np.ndarray,
+                           output_array: np.ndarray) -> np.ndarray:
         m = (end[1] - start[1])/(end[0] - start[0])
-        return m * (times - start[0]) + start[1]
+        np.subtract(times, start[0], out=output_array)
+        output_array *= m
+        output_array += start[1]
+        return output_array
 
     def __str__(self) -> str:
         return 'linear'
@@ -76,14 +110,25 @@ class HoldInterpolationStrategy(InterpolationStrategy):
     def __call__(self,
                  start: Tuple[float, float],
                  end: Tuple[float, float],
-                 times: np.ndarray) -> np.ndarray:
+                 times: np.ndarray,
+                 output_array: Optional[np.ndarray]=None) -> np.ndarray:
         if np.any(times < start[0]) or np.any(times > end[0]):
             raise ValueError(
                 "Time Value for interpolation out of bounds. Must be between {0} and {1}.".format(
                     start[0], end[0]
                 )
             )
-        return np.full_like(times, fill_value=start[1], dtype=float)
+        if output_array is None:
+            output_array = np.empty_like(times, dtype=float)
+        return self.unsafe_interpolate(start, end, times, output_array)
+
+    def unsafe_interpolate(self,
+                           start: Tuple[float, float],
+                           end: Tuple[float, float],
+                           times: np.ndarray,
+                           output_array: np.ndarray) -> np.ndarray:
+        output_array.fill(start[1])
+        return output_array
 
     def __str__(self) -> str:
         return 'hold'
@@ -99,14 +144,25 @@ class JumpInterpolationStrategy(InterpolationStrategy):
     def __call__(self,
                  start: Tuple[float, float],
                  end: Tuple[float, float],
-                 times: np.ndarray) -> np.ndarray:
+                 times: np.ndarray,
+                 output_array: Optional[np.ndarray]=None) -> np.ndarray:
         if np.any(times < start[0]) or np.any(times > end[0]):
             raise ValueError(
                 "Time Value for interpolation out of bounds. Must be between {0} and {1}.".format(
                     start[0], end[0]
                 )
             )
-        return np.full_like(times, fill_value=end[1], dtype=float)
+        if output_array is None:
+            output_array = np.empty_like(times, dtype=float)
+        return self.unsafe_interpolate(start, end, times, output_array)
+
+    def unsafe_interpolate(self,
+                           start: Tuple[float, float],
+                           end: Tuple[float, float],
+                           times: np.ndarray,
+                           output_array: np.ndarray) -> np.ndarray:
+        output_array.fill(end[1])
+        return output_array
 
     def __str__(self) -> str:
         return 'jump'
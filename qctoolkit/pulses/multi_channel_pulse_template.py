@@ -7,7 +7,7 @@ Classes:
     - MultiChannelWaveform: A waveform defined for several channels by combining waveforms
 """
 
-from typing import Dict, List, Optional, Any, Iterable, Union, Set, Sequence
+from typing import Dict, List, Optional, Any, Iterable, Union, Set, Sequence, Tuple
 import itertools
 import numbers
 
@@ -84,8 +84,8 @@ class MultiChannelWaveform(Waveform):
             return tuple(sorted(tuple('{}_stringified_numeric_channel'.format(ch) if isinstance(ch, int) else ch
                                       for ch in waveform.defined_channels)))
 
-        self._sub_waveforms = sorted(flatten_sub_waveforms(sub_waveforms),
-                                     key=get_sub_waveform_sort_key)
+        self._sub_waveforms = tuple(sorted(flatten_sub_waveforms(sub_waveforms),
+                                           key=get_sub_waveform_sort_key))
 
         if not all(waveform.duration == self._sub_waveforms[0].duration for waveform in self._sub_waveforms[1:]):
             raise ValueError(
@@ -113,9 +113,9 @@ class MultiChannelWaveform(Waveform):
         return self.__defined_channels
 
     @property
-    def compare_key(self) -> Any:
-        # sort with channels
-        return tuple(sub_waveform.compare_key for sub_waveform in self._sub_waveforms)
+    def compare_key(self) -> Tuple[Waveform, ...]:
+        # sorted with channels
+        return self._sub_waveforms
 
     def unsafe_sample(self,
                       channel: ChannelID,
@@ -123,6 +123,50 @@ class MultiChannelWaveform(Waveform):
                       output_array: Union[numpy.ndarray, None]=None) -> numpy.ndarray:
         return self[channel].unsafe_sample(channel, sample_times, output_array)
 
+    def unsafe_sample_channels(self,
+                               channels: Sequence[ChannelID],
+                               sample_times: numpy.ndarray,
+                               output_array: numpy.ndarray) -> numpy.ndarray:
+        for sub_waveform, sub_channels, sub_output in self._get_sub_waveform_outputs(channels, output_array):
+            sub_waveform.unsafe_sample_channels(sub_channels, sample_times, sub_output)
+        return output_array
+
+    def unsafe_sample_channels_uniform(self,
+                                       channels: Sequence[ChannelID],
+                                       n_samples: int,
+                                       sample_rate: float,
+                                       t0: float,
+                                       output_array: numpy.ndarray) -> numpy.ndarray:
+        for sub_waveform, sub_channels, sub_output in self._get_sub_waveform_outputs(channels, output_array):
+            sub_waveform.unsafe_sample_channels_uniform(sub_channels, n_samples, sample_rate, t0, sub_output)
+        return output_array
+
+    def _get_sub_waveform_outputs(self,
+                                  channels: Sequence[ChannelID],
+                                  output_array: numpy.ndarray) -> Iterable[Tuple[Waveform,
+                                                                                 List[ChannelID],
+                                                                                 numpy.ndarray]]:
+        """Yield the sub waveforms with their requested channels and the array to sample them into. The data is copied
+        to output_array after the sampling if the rows of a sub waveform are not contiguous."""
+        for sub_waveform in self._sub_waveforms:
+            rows = [row for row, channel in enumerate(channels) if channel in sub_waveform.defined_channels]
+            if not rows:
+                continue
+            sub_channels = [channels[row] for row in rows]
+            if rows == list(range(rows[0], rows[-1] + 1)):
+                # contiguous rows can be written in place
+                yield sub_waveform, sub_channels, output_array[rows[0]:rows[-1] + 1]
+            else:
+                sub_output = numpy.empty((len(rows), output_array.shape[1]))
+                yield sub_waveform, sub_channels, sub_output
+                output_array[rows] = sub_output
+
+    def constant_value(self, channel: ChannelID) -> Optional[float]:
+        return self[channel].constant_value(channel)
+
+    def constant_intervals(self, channel: ChannelID) -> List[Tuple[float, float, float]]:
+        return self[channel].constant_intervals(channel)
+
     def get_measurement_windows(self) -> Iterable[MeasurementWindow]:
         return itertools.chain.from_iterable(sub_waveform.get_measurement_windows()
                                              for sub_waveform in self._sub_waveforms)
@@ -56,18 +56,18 @@ def render(sequence: InstructionSequence, sample_rate: int=10) -> Tuple[np.ndarr
     # move the last sample inside the waveform
     times[-1] = np.nextafter(times[-1], times[-2])
 
-    voltages = dict((ch, np.empty(len(times))) for ch in channels)
-    offsets = {ch: 0 for ch in channels}
+    # fixed channel order so each waveform samples all channels in one batch
+    channels = tuple(channels)
+    voltages = np.empty((len(channels), len(times)))
+    offset = 0
     for waveform in waveforms:
-        for channel in channels:
-            offset = offsets[channel]
-            indices = slice(*np.searchsorted(times, (offset, offset+waveform.duration)))
-            sample_times = times[indices] - offset
-            output_array = voltages[channel][indices]
-            waveform.get_sampled(channel=channel,
+        indices = slice(*np.searchsorted(times, (offset, offset+waveform.duration)))
+        sample_times = times[indices] - offset
+        waveform.sample_channels(channels=channels,
                                  sample_times=sample_times,
-                                 output_array=output_array)
-            offsets[channel] += waveform.duration
+                                 output_array=voltages[:, indices])
+        offset += waveform.duration
+    voltages = dict(zip(channels, voltages))
     return times, voltages
 
 
@@ -1,7 +1,7 @@
 """This module defines RepetitionPulseTemplate, a higher-order hierarchical pulse template that
 represents the n-times repetition of another PulseTemplate."""
 
-from typing import Dict, List, Set, Optional, Union, Any, Iterable, Tuple, cast
+from typing import Dict, List, Set, Optional, Union, Any, Iterable, Tuple, Sequence, cast
 from numbers import Real
 from warnings import warn
 
@@ -26,6 +26,10 @@ __all__ = ["RepetitionPulseTemplate", "ParameterNotIntegerException"]
 
 class RepetitionWaveform(Waveform):
     """This class allows putting multiple PulseTemplate together in one waveform on the hardware."""
+
+    # relative deviation of the sample times between repetitions that still allows sampling the body only once
+    _commensurability_tolerance = 1e-10
+
     def __init__(self, body: Waveform, repetition_count: int):
         self._body = body
         self._repetition_count = checked_int_cast(repetition_count)
@@ -42,17 +46,152 @@ class RepetitionWaveform(Waveform):
                       output_array: Union[np.ndarray, None]=None) -> np.ndarray:
         if output_array is None:
             output_array = np.empty(len(sample_times))
+        self.unsafe_sample_channels(channels=(channel,),
+                                    sample_times=sample_times,
+                                    output_array=output_array[np.newaxis, :])
+        return output_array
+
+    def unsafe_sample_channels(self,
+                               channels: Sequence[ChannelID],
+                               sample_times: np.ndarray,
+                               output_array: np.ndarray) -> np.ndarray:
         body_duration = self._body.duration
-        for i in range(self._repetition_count):
-            indices = slice(*np.searchsorted(sample_times, (i*body_duration, (i+1)*body_duration)))
-            self._body.unsafe_sample(channel=channel,
-                                     sample_times=sample_times[indices],
-                                     output_array=output_array[indices])
+
+        samples_per_body = self._get_samples_per_body(sample_times)
+        if samples_per_body:
+            # the sample times repeat with the body -> sample the body once and tile it
+            tiled_count = samples_per_body * self._repetition_count
+            body_output = output_array[:, :samples_per_body]
+            self._body.unsafe_sample_channels(channels=channels,
+                                              sample_times=sample_times[:samples_per_body],
+                                              output_array=body_output)
+            output_array[:, samples_per_body:tiled_count].reshape(
+                (len(channels), -1, samples_per_body))[:] = body_output[:, np.newaxis, :]
+
+            if tiled_count < len(sample_times):
+                # remaining samples at the very end of the last repetition
+                last_start = (self._repetition_count - 1) * body_duration
+                self._body.unsafe_sample_channels(channels=channels,
+                                                  sample_times=sample_times[tiled_count:] - last_start,
+                                                  output_array=output_array[:, tiled_count:])
+            return output_array
+
+        repetition_starts = np.arange(self._repetition_count + 1) * body_duration
+        boundaries = np.searchsorted(sample_times, repetition_starts, 'left')
+        # the last repetition includes the end of the waveform
+        boundaries[-1] = len(sample_times)
+        for repetition_start, begin, end in zip(repetition_starts, boundaries[:-1], boundaries[1:]):
+            if begin == end:
+                continue
+            self._body.unsafe_sample_channels(channels=channels,
+                                              sample_times=sample_times[begin:end] - repetition_start,
+                                              output_array=output_array[:, begin:end])
         return output_array
 
+    def unsafe_sample_channels_uniform(self,
+                                       channels: Sequence[ChannelID],
+                                       n_samples: int,
+                                       sample_rate: float,
+                                       t0: float,
+                                       output_array: np.ndarray) -> np.ndarray:
+        body_duration = self._body.duration
+        samples_per_body = body_duration * sample_rate
+        rounding_error = abs(samples_per_body - round(samples_per_body))
+
+        first_sample = t0 * sample_rate
+        first_sample_error = abs(first_sample - round(first_sample))
+
+        if rounding_error < self._commensurability_tolerance * samples_per_body and \
+                first_sample_error < self._commensurability_tolerance * max(first_sample, 1.):
+            # every repetition starts exactly on a sample -> sample the body once and tile it
+            samples_per_body = int(round(samples_per_body))
+            first_sample = int(round(first_sample))
+            repeated_samples = min(n_samples, self._repetition_count * samples_per_body - first_sample)
+
+            # remainder of the repetition the grid starts in
+            head_count = min(-first_sample % samples_per_body, n_samples)
+            if head_count:
+                self._body.unsafe_sample_channels_uniform(channels=channels,
+                                                          n_samples=head_count,
+                                                          sample_rate=sample_rate,
+                                                          t0=(first_sample % samples_per_body) / sample_rate,
+                                                          output_array=output_array[:, :head_count])
+
+            tiled_repetitions = max(repeated_samples - head_count, 0) // samples_per_body
+            tiled_end = head_count + tiled_repetitions * samples_per_body
+            if tiled_repetitions:
+                body_output = output_array[:, head_count:head_count + samples_per_body]
+                self._body.unsafe_sample_channels_uniform(channels=channels,
+                                                          n_samples=samples_per_body,
+                                                          sample_rate=sample_rate,
+                                                          t0=0.,
+                                                          output_array=body_output)
+                output_array[:, head_count + samples_per_body:tiled_end].reshape(
+                    (len(channels), -1, samples_per_body))[:] = body_output[:, np.newaxis, :]
+
+            if tiled_end < n_samples:
+                # partial repetition or the very end of the last repetition
+                tail_sample = first_sample + tiled_end
+                repetition_start = min(tail_sample // samples_per_body,
+                                       self._repetition_count - 1) * samples_per_body
+                self._body.unsafe_sample_channels_uniform(channels=channels,
+                                                          n_samples=n_samples - tiled_end,
+                                                          sample_rate=sample_rate,
+                                                          t0=(tail_sample - repetition_start) / sample_rate,
+                                                          output_array=output_array[:, tiled_end:])
+            return output_array
+
+        repetition_starts = np.arange(self._repetition_count) * body_duration
+        boundaries = self._get_sample_indices(repetition_starts, n_samples, sample_rate, t0)
+        # the last repetition includes the end of the waveform
+        boundaries = np.append(boundaries, n_samples)
+        for repetition_start, begin, end in zip(repetition_starts, boundaries[:-1], boundaries[1:]):
+            if begin == end:
+                continue
+            self._body.unsafe_sample_channels_uniform(channels=channels,
+                                                      n_samples=end - begin,
+                                                      sample_rate=sample_rate,
+                                                      t0=max(t0 + begin / sample_rate - repetition_start, 0.),
+                                                      output_array=output_array[:, begin:end])
+        return output_array
+
+    def _get_samples_per_body(self, sample_times: np.ndarray) -> Optional[int]:
+        """Number of samples per repetition if the sample times are the same in each repetition (up to the offset by
+        the body duration) and None otherwise.
+
+        The sample times are assumed to be increasing. Comparing all of them would need a temporary array as large as
+        the sample times, so only the first and last sample of each repetition and the complete last repetition are
+        compared to the first repetition."""
+        samples_per_body = len(sample_times) // self._repetition_count
+        if self._repetition_count < 2 or samples_per_body == 0:
+            return None
+
+        body_duration = self._body.duration
+        body_sample_times = sample_times[:samples_per_body]
+        if body_sample_times[0] < 0 or body_sample_times[-1] >= body_duration:
+            return None
+
+        tolerance = body_duration * self._commensurability_tolerance
+        tiled_count = samples_per_body * self._repetition_count
+        repetition_starts = np.arange(self._repetition_count) * body_duration
+        for sample_index in (0, samples_per_body - 1):
+            if not np.allclose(sample_times[sample_index:tiled_count:samples_per_body] - repetition_starts,
+                               body_sample_times[sample_index], rtol=0, atol=tolerance):
+                return None
+        if not np.allclose(sample_times[tiled_count - samples_per_body:tiled_count] - repetition_starts[-1],
+                           body_sample_times, rtol=0, atol=tolerance):
+            return None
+        return samples_per_body
+
+    def constant_value(self, channel: ChannelID) -> Optional[float]:
+        return self._body.constant_value(channel)
+
     @property
-    def compare_key(self) -> Tuple[Any, int]:
-        return self._body.compare_key, self._repetition_count
+    def compare_key(self) -> Tuple[Waveform, int]:
+        return self._body, self._repetition_count
+
+    def _compute_hash(self) -> int:
+        return hash((hash(self._body), self._repetition_count))
 
     @property
     def duration(self) -> float:
@@ -0,0 +1,117 @@
+"""This module defines the cache for sampled waveform data.
+
+Classes:
+    - SampleCache: Least recently used cache of sampled arrays with a bounded total size.
+"""
+
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+import threading
+
+import numpy
+
+__all__ = ["SampleCache"]
+
+
+class SampleCache:
+    """Least recently used cache for sampled waveform data.
+
+    The total size of the cached arrays is bounded by max_bytes. If an insertion exceeds the budget, the least recently
+    used entries are evicted. Cached arrays are made read only because they are shared between all callers.
+
+    The attributes hits, misses and evictions count the respective events since the creation or the last call of
+    reset_statistics.
+    """
+
+    def __init__(self, max_bytes: int=2**28) -> None:
+        """Create a new SampleCache instance.
+
+        Args:
+            max_bytes: Upper bound for the summed size of all cached arrays in bytes.
+        """
+        if max_bytes < 0:
+            raise ValueError('The byte budget must not be negative')
+        self._max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.RLock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def max_bytes(self) -> int:
+        return self._max_bytes
+
+    @max_bytes.setter
+    def max_bytes(self, max_bytes: int) -> None:
+        if max_bytes < 0:
+            raise ValueError('The byte budget must not be negative')
+        with self._lock:
+            self._max_bytes = max_bytes
+            self._evict()
+
+    @property
+    def size(self) -> int:
+        """Summed size of all cached arrays in bytes."""
+        return self._size
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Any) -> bool:
+        return key in self._entries
+
+    def get(self, key: Any) -> Optional[numpy.ndarray]:
+        """Return the cached array or None if there is no entry for key."""
+        with self._lock:
+            try:
+                result = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def put(self, key: Any, data: numpy.ndarray) -> numpy.ndarray:
+        """Insert data and return it. Data that is larger than the byte budget is not cached."""
+        data.flags.writeable = False
+        with self._lock:
+            if key in self._entries:
+                self._size -= self._entries.pop(key).nbytes
+            if data.nbytes <= self._max_bytes:
+                self._entries[key] = data
+                self._size += data.nbytes
+                self._evict()
+        return data
+
+    def get_or_sample(self, key: Any, sample: Callable[[], numpy.ndarray]) -> numpy.ndarray:
+        """Return the cached array for key. On a miss the array is created by calling sample and inserted. Data with
+        an unhashable key is sampled but not cached."""
+        try:
+            hash(key)
+        except TypeError:
+            return sample()
+        result = self.get(key)
+        if result is None:
+            result = self.put(key, sample())
+        return result
+
+    def clear(self) -> None:
+        """Remove all entries. The statistics are kept."""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def reset_statistics(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _evict(self) -> None:
+        while self._size > self._max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= evicted.nbytes
+            self.evictions += 1
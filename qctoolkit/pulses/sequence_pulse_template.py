@@ -2,7 +2,7 @@
 combines several other PulseTemplate objects for sequential execution."""
 
 import numpy as np
-from typing import Dict, List, Tuple, Set, Optional, Any, Iterable, Union, cast
+from typing import Dict, List, Tuple, Set, Optional, Any, Iterable, Union, Sequence, cast
 from numbers import Real
 
 from qctoolkit.serialization import Serializer
@@ -58,17 +58,59 @@ class SequenceWaveform(Waveform):
                       output_array: Union[np.ndarray, None]=None) -> np.ndarray:
         if output_array is None:
             output_array = np.empty(len(sample_times))
-        time = 0
-        for subwaveform in self._sequenced_waveforms:
+        self.unsafe_sample_channels(channels=(channel,),
+                                    sample_times=sample_times,
+                                    output_array=output_array[np.newaxis, :])
+        return output_array
+
+    def unsafe_sample_channels(self,
+                               channels: Sequence[ChannelID],
+                               sample_times: np.ndarray,
+                               output_array: np.ndarray) -> np.ndarray:
+        start_times = np.cumsum([0] + [subwaveform.duration for subwaveform in self._sequenced_waveforms[:-1]])
+        boundaries = np.searchsorted(sample_times, start_times, 'left')
+        # the last waveform includes the end of the sequence
+        boundaries = np.append(boundaries, len(sample_times))
+
+        for subwaveform, start_time, begin, end in zip(self._sequenced_waveforms,
+                                                       start_times, boundaries[:-1], boundaries[1:]):
+            if begin == end:
+                continue
             # before you change anything here, make sure to understand the difference between basic and advanced
             # indexing in numpy and their copy/reference behaviour
-            indices = slice(*np.searchsorted(sample_times, (time, time+subwaveform.duration), 'left'))
-            subwaveform.unsafe_sample(channel=channel,
-                                      sample_times=sample_times[indices],
-                                      output_array=output_array[indices])
-            time += subwaveform.duration
+            subwaveform.unsafe_sample_channels(channels=channels,
+                                               sample_times=sample_times[begin:end] - start_time,
+                                               output_array=output_array[:, begin:end])
         return output_array
 
+    def unsafe_sample_channels_uniform(self,
+                                       channels: Sequence[ChannelID],
+                                       n_samples: int,
+                                       sample_rate: float,
+                                       t0: float,
+                                       output_array: np.ndarray) -> np.ndarray:
+        start_times = np.cumsum([0] + [subwaveform.duration for subwaveform in self._sequenced_waveforms[:-1]])
+        boundaries = self._get_sample_indices(start_times, n_samples, sample_rate, t0)
+        # the last waveform includes the end of the sequence
+        boundaries = np.append(boundaries, n_samples)
+
+        for subwaveform, start_time, begin, end in zip(self._sequenced_waveforms,
+                                                       start_times, boundaries[:-1], boundaries[1:]):
+            if begin == end:
+                continue
+            subwaveform.unsafe_sample_channels_uniform(channels=channels,
+                                                       n_samples=end - begin,
+                                                       sample_rate=sample_rate,
+                                                       t0=max(t0 + begin / sample_rate - start_time, 0.),
+                                                       output_array=output_array[:, begin:end])
+        return output_array
+
+    def constant_value(self, channel: ChannelID) -> Optional[float]:
+        values = {subwaveform.constant_value(channel) for subwaveform in self._sequenced_waveforms}
+        if len(values) == 1:
+            return values.pop()
+        return None
+
     @property
     def compare_key(self) -> Tuple[Waveform]:
         return self._sequenced_waveforms
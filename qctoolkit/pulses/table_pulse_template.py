@@ -41,6 +41,11 @@ class TableWaveformEntry(NamedTuple('TableWaveformEntry', [('t', float),
 
 TableWaveformEntryInInit = Union[TableWaveformEntry, Tuple[float, float, InterpolationStrategy]]
 
+_HOLD, _LINEAR, _JUMP = range(3)
+_INTERPOLATION_CODES = {HoldInterpolationStrategy: _HOLD,
+                        LinearInterpolationStrategy: _LINEAR,
+                        JumpInterpolationStrategy: _JUMP}
+
 
 class TableWaveform(Waveform):
     """Waveform obtained from instantiating a TablePulseTemplate."""
@@ -58,6 +63,42 @@ class TableWaveform(Waveform):
         self._table = self._validate_input(waveform_table)
         self._channel_id = channel
 
+        self._entry_times, self._entry_values, self._interpolation_codes = self._compile_table(self._table)
+        if self._interpolation_codes is not None:
+            self._segment_slopes, self._segment_offsets = self._get_segment_coefficients(self._entry_times,
+                                                                                         self._entry_values,
+                                                                                         self._interpolation_codes)
+
+    @staticmethod
+    def _compile_table(table: Sequence[TableWaveformEntry]) -> Tuple[np.ndarray, np.ndarray, Optional[np.ndarray]]:
+        """Store the table as flat arrays of times, values and interpolation strategy codes. The code of segment i is
+        the code of the interpolation strategy of entry i+1. If the table contains an interpolation strategy that has
+        no code the returned codes are None."""
+        times = np.fromiter((entry.t for entry in table), dtype=float, count=len(table))
+        values = np.fromiter((entry.v for entry in table), dtype=float, count=len(table))
+        try:
+            codes = np.fromiter((_INTERPOLATION_CODES[type(entry.interp)] for entry in table[1:]),
+                                dtype=np.uint8, count=len(table) - 1)
+        except KeyError:
+            codes = None
+        return times, values, codes
+
+    @staticmethod
+    def _get_segment_coefficients(times: np.ndarray,
+                                  values: np.ndarray,
+                                  codes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Express every segment as v(t) = slope * (t - t_start) + offset"""
+        durations = np.diff(times)
+        is_linear = codes == _LINEAR
+        is_ramp = is_linear & (durations > 0)
+
+        slopes = np.zeros(len(codes))
+        slopes[is_ramp] = np.diff(values)[is_ramp] / durations[is_ramp]
+
+        # a linear segment of zero length can only be sampled at its end
+        offsets = np.where((codes == _JUMP) | (is_linear & ~is_ramp), values[1:], values[:-1])
+        return slopes, offsets
+
     @staticmethod
     def _validate_input(input_waveform_table: Sequence[TableWaveformEntryInInit]) -> Tuple[TableWaveformEntry, ...]:
         """ Checks that:
@@ -112,13 +153,87 @@ class TableWaveform(Waveform):
         if output_array is None:
             output_array = np.empty_like(sample_times)
 
+        if self._interpolation_codes is not None:
+            # a sample on an entry time belongs to the segment that starts there
+            segment_indices = np.searchsorted(self._entry_times[:-1], sample_times, 'right') - 1
+
+            np.subtract(sample_times, self._entry_times[segment_indices], out=output_array)
+            output_array *= self._segment_slopes[segment_indices]
+            output_array += self._segment_offsets[segment_indices]
+            return output_array
+
         for entry1, entry2 in zip(self._table[:-1], self._table[1:]):
             indices = slice(np.searchsorted(sample_times, entry1.t, 'left'),
                             np.searchsorted(sample_times, entry2.t, 'right'))
-            output_array[indices] = \
-                entry2.interp((entry1.t, entry1.v), (entry2.t, entry2.v), sample_times[indices])
+            if isinstance(entry2.interp, InterpolationStrategy):
+                entry2.interp.unsafe_interpolate((entry1.t, entry1.v), (entry2.t, entry2.v),
+                                                 sample_times[indices], output_array[indices])
+            else:
+                # plain callable
+                output_array[indices] = entry2.interp((entry1.t, entry1.v), (entry2.t, entry2.v), sample_times[indices])
         return output_array
 
+    def unsafe_sample_channels(self,
+                               channels: Sequence[ChannelID],
+                               sample_times: np.ndarray,
+                               output_array: np.ndarray) -> np.ndarray:
+        # single channel waveform -> all requested channels are identical
+        if len(channels):
+            self.unsafe_sample(self._channel_id, sample_times, output_array[0])
+            output_array[1:] = output_array[0]
+        return output_array
+
+    def unsafe_sample_channels_uniform(self,
+                                       channels: Sequence[ChannelID],
+                                       n_samples: int,
+                                       sample_rate: float,
+                                       t0: float,
+                                       output_array: np.ndarray) -> np.ndarray:
+        if self._interpolation_codes is None:
+            return super().unsafe_sample_channels_uniform(channels, n_samples, sample_rate, t0, output_array)
+        if not len(channels):
+            return output_array
+
+        channel_output = output_array[0]
+        boundaries = self._get_sample_indices(self._entry_times[:-1], n_samples, sample_rate, t0)
+        # the last segment includes the end of the waveform
+        boundaries = np.append(boundaries, n_samples)
+        for segment_start, slope, offset, begin, end in zip(self._entry_times, self._segment_slopes,
+                                                            self._segment_offsets, boundaries[:-1], boundaries[1:]):
+            if begin == end:
+                continue
+            if slope:
+                segment_output = channel_output[begin:end]
+                np.divide(np.arange(begin, end), sample_rate, out=segment_output)
+                segment_output += t0 - segment_start
+                segment_output *= slope
+                segment_output += offset
+            else:
+                channel_output[begin:end] = offset
+        output_array[1:] = channel_output
+        return output_array
+
+    def constant_value(self, channel: ChannelID) -> Optional[float]:
+        intervals = self.constant_intervals(channel)
+        if len(intervals) == 1 and intervals[0][1] - intervals[0][0] == self.duration:
+            return intervals[0][2]
+        return None
+
+    def constant_intervals(self, channel: ChannelID) -> List[Tuple[float, float, float]]:
+        if self._interpolation_codes is None:
+            return []
+
+        intervals = []
+        for begin, end, slope, value in zip(self._entry_times[:-1], self._entry_times[1:],
+                                            self._segment_slopes, self._segment_offsets):
+            if begin == end or slope != 0:
+                continue
+            if intervals and intervals[-1][1] == begin and intervals[-1][2] == value:
+                intervals[-1] = (intervals[-1][0], float(end), intervals[-1][2])
+            else:
+                intervals.append((float(begin), float(end), float(value)))
+        return intervals
+
     @property
     def defined_channels(self) -> Set[ChannelID]:
         return {self._channel_id}
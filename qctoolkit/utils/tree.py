@@ -24,6 +24,10 @@ class Node:
         self.__children = [] if children is None else [self.parse_child(child) for child in children]
         self.__parent_index = None
 
+        # cached depth and balance of the subtree. If they are valid for a node, they are valid for all its children.
+        self.__depth = None
+        self.__balanced = None
+
         for i, child in enumerate(self.__children):
             self.__children[i].__parent_index = i
 
@@ -40,12 +44,41 @@ class Node:
         return len(self.__children) == 0
 
     def depth(self) -> int:
-        return 0 if self.is_leaf() else (1 + max(e.depth() for e in self.__children))
+        if self.__depth is None:
+            self.__update_depth()
+        return self.__depth
 
     def is_balanced(self) -> bool:
-        if self.is_leaf():
-            return True
-        return all((e.depth() == self.__children[0].depth() and e.is_balanced()) for e in self.__children)
+        if self.__depth is None:
+            self.__update_depth()
+        return self.__balanced
+
+    def __update_depth(self) -> None:
+        """Calculate depth and balance of all nodes in the subtree whose cache is invalid without recursion."""
+        stack = [self]
+        while stack:
+            node = stack[-1]
+            invalid_children = [child for child in node.__children if child.__depth is None]
+            if invalid_children:
+                stack.extend(invalid_children)
+                continue
+
+            stack.pop()
+            if node.__children:
+                child_depths = {child.__depth for child in node.__children}
+                node.__depth = 1 + max(child_depths)
+                node.__balanced = len(child_depths) == 1 and all(child.__balanced for child in node.__children)
+            else:
+                node.__depth = 0
+                node.__balanced = True
+
+    def __invalidate_depth(self) -> None:
+        """Invalidate the cached depth of this node and its ancestors."""
+        node = self
+        while node is not None and node.__depth is not None:
+            node.__depth = None
+            node.__balanced = None
+            node = node.parent
 
     def __iter__(self: _NodeType) -> Iterable[_NodeType]:
         return iter(self.__children)
@@ -70,6 +103,7 @@ class Node:
             value = self.parse_child(value)
             value.__parent_index = idx
             self.__children.__setitem__(idx, value)
+        self.__invalidate_depth()
 
     def __getitem__(self: _NodeType, *args, **kwargs) ->Union[_NodeType, List[_NodeType]]:
         return self.__children.__getitem__(*args, **kwargs)
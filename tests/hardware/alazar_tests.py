@@ -1,9 +1,11 @@
 import unittest
+import tracemalloc
 
 import numpy as np
 
 from ..hardware import *
 from qctoolkit.hardware.dacs.alazar import AlazarCard, AlazarProgram
+from qctoolkit.hardware.program import PeriodicWindows
 
 
 class AlazarProgramTest(unittest.TestCase):
@@ -78,6 +80,90 @@ class AlazarTest(unittest.TestCase):
         self.assertEqual(card._registered_programs['otto'].masks[0].channel, 3)
         self.assertEqual(card._registered_programs['otto'].masks[0].identifier, 'A')
 
+    def test_register_periodic_measurement_windows(self):
+        card = AlazarCard(dummy_modules.dummy_atsaverage.core.AlazarCard())
+        card.register_mask_for_channel('A', 3, 'auto')
+        card.register_mask_for_channel('B', 1, 'auto')
+        card.config = dummy_modules.dummy_atsaverage.config.ScanlineConfiguration()
+
+        self.assertTrue(card.supports_periodic_windows)
+
+        windows = dict(A=PeriodicWindows(np.array([0., 100.]), np.array([50., 50.]), period=400., count=1000),
+                       B=PeriodicWindows(np.array([0.]), np.array([20.]), period=405., count=3))
+        card.register_measurement_windows('otto', windows)
+
+        # the period of A is a whole number of samples
+        self.assertIsInstance(windows['A'], PeriodicWindows)
+        np.testing.assert_equal(windows['A'].begins, [0, 10])
+        np.testing.assert_equal(windows['A'].lengths, [5, 5])
+        self.assertEqual((windows['A'].period, windows['A'].count), (40, 1000))
+
+        # the period of B is not. The begins of its repetitions are rounded when the mask is created
+        self.assertIsInstance(windows['B'], PeriodicWindows)
+        self.assertEqual((windows['B'].period, windows['B'].count), (40.5, 3))
+
+        mask_a, mask_b = card._registered_programs['otto'].masks
+        self.assertEqual((mask_a.identifier, mask_a.channel), ('A', 3))
+        np.testing.assert_equal(mask_a.begin, (np.arange(1000)[:, np.newaxis] * 40 + [0, 10]).ravel())
+        np.testing.assert_equal(mask_a.length, np.full(2000, 5))
+        self.assertEqual(mask_a.begin.dtype, np.uint64)
+        np.testing.assert_equal(mask_b.begin, [0, 40, 81])
+
+        # 999 * 40 + 15 rounded up to the minimum record size
+        self.assertEqual(card._registered_programs['otto'].total_length, 40192)
+
+        with self.assertRaises(ValueError):
+            card.register_measurement_windows('overlapping',
+                                              dict(A=PeriodicWindows(np.array([0.]), np.array([500.]),
+                                                                     period=400., count=2)))
+
+        nested = PeriodicWindows(np.array([10.]), np.array([10.]), period=30., count=4)
+        card.register_measurement_windows('nested', dict(A=PeriodicWindows(np.zeros(0), np.zeros(0),
+                                                                           period=150., count=2, nested=nested)))
+        mask, = card._registered_programs['nested'].masks
+        np.testing.assert_equal(mask.begin, [1, 4, 7, 10, 16, 19, 22, 25])
+        np.testing.assert_equal(mask.length, np.ones(8))
+
+    def test_register_periodic_measurement_windows_long_period(self):
+        card = AlazarCard(dummy_modules.dummy_atsaverage.core.AlazarCard())
+        card.register_mask_for_channel('A', 3, 'auto')
+        card.config = dummy_modules.dummy_atsaverage.config.ScanlineConfiguration()
+
+        # the period of 100000.04 samples is relatively close to a whole number
+        windows = dict(A=PeriodicWindows(np.array([0.]), np.array([10.]), period=1000000.4, count=10000))
+        card.register_measurement_windows('otto', windows)
+        self.assertAlmostEqual(windows['A'].period, 100000.04)
+
+        mask, = card._registered_programs['otto'].masks
+        np.testing.assert_equal(mask.begin, np.rint(np.arange(10000) * 100000.04))
+        np.testing.assert_equal(mask.length, np.ones(10000))
+
+    def test_register_periodic_measurement_windows_lazily(self):
+        card = AlazarCard(dummy_modules.dummy_atsaverage.core.AlazarCard())
+        card.register_mask_for_channel('A', 3, 'auto')
+        card.config = dummy_modules.dummy_atsaverage.config.ScanlineConfiguration()
+
+        count = 10**6
+        windows = dict(A=PeriodicWindows(np.array([0., 100.]), np.array([50., 50.]), period=400.5, count=count,
+                                         nested=PeriodicWindows(np.array([300.]), np.array([10.]),
+                                                                period=20., count=3)))
+        # an array with one entry per shot would take at least 8 MB
+        tracemalloc.start()
+        try:
+            card.register_measurement_windows('otto', windows)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertLess(peak, 10**6)
+        self.assertEqual(card._registered_programs['otto'].total_length,
+                         np.ceil((np.rint((count - 1) * 40.05) + 35) / 256) * 256)
+
+        mask, = card._registered_programs['otto'].masks
+        self.assertEqual(len(mask.begin), 5 * count)
+        np.testing.assert_equal(mask.begin[:10], [0, 10, 30, 32, 34, 40, 50, 70, 72, 74])
+        np.testing.assert_equal(mask.length[:5], [5, 5, 1, 1, 1])
+        self.assertEqual(mask.begin[-1], np.rint((count - 1) * 40.05) + 34)
+
     def test_register_operations(self):
         card = AlazarCard(None)
 
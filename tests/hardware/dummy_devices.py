@@ -1,7 +1,8 @@
-from typing import Tuple, Set, Dict
+from typing import Tuple, Set, Dict, Union
 
 from qctoolkit.hardware.awgs.base import AWG, ProgramOverwriteException
 from qctoolkit.hardware.dacs import DAC
+from qctoolkit.hardware.program import PeriodicWindows
 
 class DummyDAC(DAC):
     def __init__(self):
@@ -14,8 +15,13 @@ class DummyDAC(DAC):
     def armed_program(self):
         return self._armed_program
 
-    def register_measurement_windows(self, program_name: str, windows: Dict[str, Tuple['numpy.ndarray',
-                                                                                       'numpy.ndarray']]):
+    @property
+    def supports_periodic_windows(self) -> bool:
+        return True
+
+    def register_measurement_windows(self, program_name: str, windows: Dict[str, Union[Tuple['numpy.ndarray',
+                                                                                             'numpy.ndarray'],
+                                                                                       PeriodicWindows]]):
         self._measurement_windows[program_name] = windows
 
     def register_operations(self, program_name: str, operations):
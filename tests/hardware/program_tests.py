@@ -6,10 +6,12 @@ import numpy as np
 
 from string import Formatter, ascii_uppercase
 
-from qctoolkit.hardware.program import Loop, MultiChannelProgram, make_compatible, _make_compatible, _is_compatible, _CompatibilityLevel, RepetitionWaveform, SequenceWaveform
+from qctoolkit.hardware.program import Loop, CompactLoop, PeriodicWindows, MultiChannelProgram, make_compatible, _make_compatible, _is_compatible, _CompatibilityLevel, RepetitionWaveform, SequenceWaveform
 from qctoolkit.pulses.instructions import REPJInstruction, InstructionBlock, ImmutableInstructionBlock
 from tests.pulses.sequencing_dummies import DummyWaveform
 from qctoolkit.pulses.multi_channel_pulse_template import MultiChannelWaveform
+from qctoolkit.pulses.table_pulse_template import TableWaveform
+from qctoolkit.pulses.interpolation import HoldInterpolationStrategy, LinearInterpolationStrategy
 
 
 class WaveformGenerator:
@@ -289,6 +291,137 @@ LOOP 1 times:
 
         self.assertEqual(expected_after_repr, repr(after))
 
+    def test_get_flattened_tables(self):
+        before = LoopTests.get_test_loop(lambda: DummyWaveform())
+        before[1][0].encapsulate()
+        before_repr = repr(before)
+
+        after = before.copy_tree_structure()
+        after.flatten_and_balance(2)
+
+        tables = before.get_flattened_tables()
+        self.assertEqual(repr(before), before_repr)
+        self.assertEqual(tables, [(table_loop.repetition_count, [(loop.waveform, loop.repetition_count)
+                                                                 for loop in table_loop])
+                                  for table_loop in after])
+        # unrolled repetitions share their rows
+        self.assertIs(tables[5][1], tables[7][1])
+
+        # nested unbalanced loops are expanded into rows
+        wf_a, wf_b, wf_c = (DummyWaveform() for _ in range(3))
+        program = Loop(children=[Loop(children=[Loop(waveform=wf_a),
+                                                Loop(children=[Loop(waveform=wf_b),
+                                                               Loop(children=[Loop(waveform=wf_c)],
+                                                                    repetition_count=2)])],
+                                      repetition_count=3)])
+        self.assertEqual(program.get_flattened_tables(), [(3, [(wf_a, 1), (wf_b, 1), (wf_c, 1), (wf_c, 1)])])
+
+    def test_unroll(self):
+        wf_a, wf_b = DummyWaveform(), DummyWaveform()
+        program = Loop(children=[Loop(children=[Loop(waveform=wf_a), Loop(waveform=wf_b, repetition_count=2)],
+                                      repetition_count=3)])
+        children = program[0].children
+
+        program[0].unroll()
+        self.assertEqual([(loop.waveform, loop.repetition_count) for loop in program], [(wf_a, 1), (wf_b, 2)] * 3)
+        # the last repetition reuses the children
+        self.assertIs(program[4], children[0])
+        self.assertIs(program[5], children[1])
+        self.assertIsNot(program[0], children[0])
+        for loop in program:
+            self.assertIs(loop.parent, program)
+
+        program = Loop(children=[Loop(waveform=wf_a), Loop(waveform=wf_b)], repetition_count=2)
+        children = program.children
+        program.unroll_children()
+        self.assertEqual(program.repetition_count, 1)
+        self.assertEqual([loop.waveform for loop in program], [wf_a, wf_b, wf_a, wf_b])
+        self.assertIs(program[2], children[0])
+        self.assertIs(program[3], children[1])
+
+
+    def test_get_measurement_windows(self):
+        program = Loop(children=[Loop(children=[Loop(waveform=DummyWaveform(duration=1.), measurements=[('m', 0., .5)]),
+                                                Loop(waveform=DummyWaveform(duration=2.), measurements=[('m', .5, 1.)])],
+                                      repetition_count=3),
+                                 Loop(waveform=DummyWaveform(duration=4.), measurements=[('n', 1., 1.)])])
+
+        measurement_windows = program.get_measurement_windows()
+        self.assertEqual(set(measurement_windows), {'m', 'n'})
+        np.testing.assert_equal(measurement_windows['m'][0], [0., 1.5, 3., 4.5, 6., 7.5])
+        np.testing.assert_equal(measurement_windows['m'][1], [.5, 1., .5, 1., .5, 1.])
+        np.testing.assert_equal(measurement_windows['n'], ([10.], [1.]))
+
+        periodic_windows = program.get_measurement_windows(periodic=True)
+        m_windows = periodic_windows['m']
+        self.assertIsInstance(m_windows, PeriodicWindows)
+        np.testing.assert_equal(m_windows.begins, [0., 1.5])
+        np.testing.assert_equal(m_windows.lengths, [.5, 1.])
+        self.assertEqual((m_windows.period, m_windows.count), (3., 3))
+        np.testing.assert_equal(m_windows.expand(), measurement_windows['m'])
+
+        n_windows = periodic_windows['n']
+        self.assertEqual(n_windows.count, 1)
+        np.testing.assert_equal(n_windows.expand(), measurement_windows['n'])
+
+        # the root repetition is the outermost period
+        program.repetition_count = 2
+        measurement_windows = program.get_measurement_windows()
+        np.testing.assert_equal(measurement_windows['m'][0], [0., 1.5, 3., 4.5, 6., 7.5,
+                                                              13., 14.5, 16., 17.5, 19., 20.5])
+        np.testing.assert_equal(measurement_windows['n'][0], [10., 23.])
+
+        periodic_windows = program.get_measurement_windows(periodic=True)
+        m_windows = periodic_windows['m']
+        self.assertEqual(len(m_windows.begins), 0)
+        self.assertEqual((m_windows.period, m_windows.count), (13., 2))
+        np.testing.assert_equal(m_windows.nested.begins, [0., 1.5])
+        self.assertEqual((m_windows.nested.period, m_windows.nested.count), (3., 3))
+        self.assertIsNone(m_windows.nested.nested)
+        np.testing.assert_equal(m_windows.expand(), measurement_windows['m'])
+
+        n_windows = periodic_windows['n']
+        np.testing.assert_equal(n_windows.begins, [10.])
+        self.assertEqual((n_windows.period, n_windows.count, n_windows.nested), (13., 2, None))
+        np.testing.assert_equal(n_windows.expand(), measurement_windows['n'])
+
+        self.assertEqual(Loop(waveform=DummyWaveform()).get_measurement_windows(), dict())
+
+
+
+class PeriodicWindowsTests(unittest.TestCase):
+    def test_expand(self):
+        windows = PeriodicWindows(np.array([1., 4.]), np.array([1., 2.]), period=10., count=3)
+        self.assertIsNone(windows.nested)
+        np.testing.assert_equal(windows.expand(), ([1., 4., 11., 14., 21., 24.], [1., 2., 1., 2., 1., 2.]))
+        self.assertEqual((windows.begin, windows.period_end, windows.end), (1., 6., 26.))
+
+        nested = PeriodicWindows(np.array([0.5]), np.array([.5]), period=1., count=2)
+        windows = PeriodicWindows(np.array([1.]), np.array([1.]), period=3., count=2, nested=nested)
+        np.testing.assert_equal(windows.expand(), ([.5, 1., 1.5, 3.5, 4., 4.5], [.5, 1., .5, .5, 1., .5]))
+        self.assertEqual((windows.begin, windows.period_end, windows.end), (.5, 2., 5.))
+
+        windows = PeriodicWindows(np.zeros(0), np.zeros(0), period=3., count=2)
+        self.assertEqual(windows.expand()[0].size, 0)
+        self.assertIsNone(windows.end)
+        self.assertFalse(windows.has_overlaps())
+
+    def test_has_overlaps(self):
+        self.assertFalse(PeriodicWindows(np.array([1., 4.]), np.array([3., 2.]), period=5., count=3).has_overlaps())
+        # overlap inside of a period
+        self.assertTrue(PeriodicWindows(np.array([1., 3.]), np.array([3., 2.]), period=10., count=3).has_overlaps())
+        # overlap with the next period
+        self.assertTrue(PeriodicWindows(np.array([1., 4.]), np.array([3., 2.1]), period=5., count=3).has_overlaps())
+        self.assertFalse(PeriodicWindows(np.array([1., 4.]), np.array([3., 2.1]), period=5., count=1).has_overlaps())
+
+        nested = PeriodicWindows(np.array([0.]), np.array([1.]), period=1., count=4)
+        self.assertFalse(PeriodicWindows(np.zeros(0), np.zeros(0), period=4., count=2, nested=nested).has_overlaps())
+        self.assertTrue(PeriodicWindows(np.zeros(0), np.zeros(0), period=3., count=2, nested=nested).has_overlaps())
+        self.assertTrue(PeriodicWindows(np.array([.5]), np.array([.1]), period=4., count=2,
+                                        nested=nested).has_overlaps())
+        self.assertTrue(PeriodicWindows(np.zeros(0), np.zeros(0), period=10., count=2,
+                                        nested=nested._replace(period=.5)).has_overlaps())
+
 
 class MultiChannelTests(unittest.TestCase):
     def __init__(self, *args, **kwargs):
@@ -414,6 +547,31 @@ LOOP 1 times:
         self.assertEqual(root_loopB.__repr__(), reprB)
 
 
+    def test_merged_loop_measurements(self):
+        wf = DummyWaveform(duration=1.1, defined_channels={'A'})
+        body = InstructionBlock()
+        body.add_instruction_meas([('m', 0.1, 0.2)])
+        body.add_instruction_exec(wf)
+
+        block = InstructionBlock()
+        block.add_instruction_repj(3, ImmutableInstructionBlock(body))
+
+        program = MultiChannelProgram(block).programs[frozenset('A')]
+        self.assertEqual(program.repetition_count, 3)
+        begins, lengths = program.get_measurement_windows()['m']
+        np.testing.assert_allclose(begins, [0.1, 1.2, 2.3])
+        np.testing.assert_equal(lengths, [0.2, 0.2, 0.2])
+
+        # the measurements of the outer loop must not be repeated with the child
+        block = InstructionBlock()
+        block.add_instruction_meas([('n', 0., 1.)])
+        block.add_instruction_repj(3, ImmutableInstructionBlock(body))
+
+        program = MultiChannelProgram(block).programs[frozenset('A')]
+        np.testing.assert_equal(program.get_measurement_windows()['n'], ([0.], [1.]))
+        np.testing.assert_allclose(program.get_measurement_windows()['m'][0], [0.1, 1.2, 2.3])
+
+
 class ProgramWaveformCompatibilityTest(unittest.TestCase):
     def test_is_compatible_incompatible(self):
         wf = DummyWaveform(duration=1.1)
@@ -475,3 +633,176 @@ class ProgramWaveformCompatibilityTest(unittest.TestCase):
         self.assertIs(program.waveform._sequenced_waveforms[0]._body, wf1)
         self.assertEqual(program.waveform._sequenced_waveforms[0]._repetition_count, 2)
         self.assertIs(program.waveform._sequenced_waveforms[1], wf2)
+
+    def test_make_compatible_constant_waveforms(self):
+        hold = HoldInterpolationStrategy()
+        constant_wf = MultiChannelWaveform([TableWaveform('A', [(0, 1., hold), (1008, 1., hold)]),
+                                            TableWaveform('B', [(0, 2., hold), (1008, 2., hold)])])
+        ramp_wf = TableWaveform('A', [(0, 0., hold), (1008, 1., LinearInterpolationStrategy())])
+        short_wf = TableWaveform('A', [(0, 0., hold), (192, 0., hold)])
+
+        program = Loop(children=[Loop(waveform=constant_wf, repetition_count=2),
+                                 Loop(waveform=constant_wf['A']),
+                                 Loop(waveform=ramp_wf),
+                                 Loop(waveform=short_wf),
+                                 Loop(waveform=constant_wf, measurements=[('m', 0, 1)])])
+        make_compatible(program, minimal_waveform_length=192, waveform_quantum=16, sample_rate=1.)
+
+        # 1008 = 5*192 + 48 -> 4*192 and one waveform of 240 samples
+        self.assertEqual(len(program), 6)
+        self.assertEqual(program[0].duration, 2016)
+        self.assertEqual(program[0].repetition_count, 2)
+        self.assertIs(program[0].waveform, constant_wf)
+
+        self.assertEqual(program[1].repetition_count, 4)
+        self.assertEqual(program[1].waveform.duration, 192)
+        self.assertEqual(program[1].waveform.constant_value('A'), 1.)
+        self.assertEqual(program[2].repetition_count, 1)
+        self.assertEqual(program[2].waveform.duration, 240)
+        self.assertEqual(program[2].waveform.constant_value('A'), 1.)
+
+        self.assertIs(program[3].waveform, ramp_wf)
+        self.assertIs(program[4].waveform, short_wf)
+        self.assertIs(program[5].waveform, constant_wf)
+
+        program = Loop(children=[Loop(waveform=constant_wf, repetition_count=2)])
+        make_compatible(program, minimal_waveform_length=252, waveform_quantum=1, sample_rate=1.)
+        self.assertEqual(program[0].repetition_count, 2*1008//252)
+        self.assertEqual(program[0].waveform.duration, 252)
+        self.assertEqual(program[0].waveform.defined_channels, {'A', 'B'})
+        self.assertEqual(program[0].waveform.constant_value('B'), 2.)
+
+        program = Loop(children=[Loop(waveform=constant_wf)])
+        make_compatible(program, minimal_waveform_length=200, waveform_quantum=1, sample_rate=1.,
+                        compress_constant_waveforms=False)
+        self.assertIs(program[0].waveform, constant_wf)
+
+
+class CompactLoopTests(unittest.TestCase):
+    @staticmethod
+    def get_test_loop():
+        wf_gen = WaveformGenerator(num_channels=1, duration_generator=itertools.count(1))
+        loop = LoopTests.get_test_loop(wf_gen)
+        loop.add_measurements([('m', 0., 1.)])
+        loop[1].add_measurements([('n', 0.5, 1.)])
+        loop[2][0][1].add_measurements([('m', 0.25, 0.5), ('n', 0., 2.)])
+        loop[4][1].add_measurements([])
+        return loop
+
+    def test_round_trip(self):
+        loop = self.get_test_loop()
+        compact = CompactLoop.from_loop(loop)
+
+        nodes = list(loop.get_breadth_first_iterator())
+        self.assertEqual(len(compact.parent_indices), len(nodes))
+        self.assertEqual(len(compact.waveforms), 11)
+        self.assertEqual(compact.depth(), loop.depth())
+        self.assertEqual(len(compact), len(loop))
+        self.assertEqual(compact.repetition_count, loop.repetition_count)
+        self.assertEqual(compact.duration, loop.duration)
+        self.assertEqual(compact.durations.tolist(), [node.duration for node in nodes])
+        self.assertEqual(compact.repetition_counts.tolist(), [node.repetition_count for node in nodes])
+        self.assertEqual(list(compact.get_children(2)), [6])
+        self.assertEqual(compact.get_leaf_indices().tolist(),
+                         [i for i, node in enumerate(nodes) if node.is_leaf()])
+
+        converted = compact.to_loop()
+        self.assertEqual(converted, loop)
+        converted_nodes = list(converted.get_breadth_first_iterator())
+        for node, converted_node in zip(nodes, converted_nodes):
+            self.assertIs(node.waveform, converted_node.waveform)
+            self.assertEqual(node._measurements, converted_node._measurements)
+            for child in converted_node:
+                self.assertIs(child.parent, converted_node)
+
+        leaf = CompactLoop.from_loop(Loop(waveform=DummyWaveform(duration=3.), repetition_count=2))
+        self.assertTrue(leaf.is_leaf())
+        self.assertEqual(leaf.depth(), 0)
+        self.assertEqual(leaf.duration, 6.)
+        self.assertEqual(leaf.to_loop(), Loop(waveform=leaf.waveforms[0], repetition_count=2))
+
+    def test_invalid_arrays(self):
+        with self.assertRaises(ValueError):
+            CompactLoop([], [], [], [], [], [])
+        with self.assertRaises(ValueError):
+            CompactLoop([-1, 0], [1], [1, 0], [1, 1], [-1, 0], [DummyWaveform()])
+
+    def test_sibling_offsets(self):
+        loop = self.get_test_loop()
+        compact = CompactLoop.from_loop(loop)
+
+        expected = [0]
+        for node in list(loop.get_breadth_first_iterator())[1:]:
+            siblings = node.parent.children
+            node_index = next(i for i, sibling in enumerate(siblings) if sibling is node)
+            expected.append(sum(sibling.duration for sibling in siblings[:node_index]))
+        np.testing.assert_allclose(compact._sibling_offsets, expected)
+
+    def test_get_measurement_windows(self):
+        loop = self.get_test_loop()
+        compact = CompactLoop.from_loop(loop)
+
+        expected = loop.get_measurement_windows()
+        measurement_windows = compact.get_measurement_windows()
+        self.assertEqual(set(measurement_windows), set(expected))
+        for mw_name, (begins, lengths) in measurement_windows.items():
+            expected_begins, expected_lengths = expected[mw_name]
+            order = np.argsort(expected_begins, kind='stable')
+            np.testing.assert_allclose(begins, expected_begins[order])
+            np.testing.assert_equal(lengths, expected_lengths[order])
+
+        self.assertEqual(CompactLoop.from_loop(Loop(waveform=DummyWaveform())).get_measurement_windows(), dict())
+
+    def test_get_periodic_measurement_windows(self):
+        loop = self.get_test_loop()
+        loop.repetition_count = 3
+        compact = CompactLoop.from_loop(loop)
+
+        expected = loop.get_measurement_windows(periodic=True)
+        measurement_windows = compact.get_measurement_windows(periodic=True)
+        self.assertEqual(set(measurement_windows), set(expected))
+        for mw_name, periodic_windows in measurement_windows.items():
+            self.assertEqual(periodic_windows.count, 3)
+            self.assertEqual(periodic_windows.count, expected[mw_name].count)
+            self.assertAlmostEqual(periodic_windows.period, expected[mw_name].period)
+            np.testing.assert_allclose(periodic_windows.begins, expected[mw_name].begins)
+
+            begins, lengths = periodic_windows.expand()
+            expected_begins, expected_lengths = compact.get_measurement_windows()[mw_name]
+            order = np.argsort(begins, kind='stable')
+            np.testing.assert_allclose(begins[order], expected_begins)
+            np.testing.assert_equal(lengths[order], expected_lengths)
+
+    def test_make_compatible(self):
+        program = CompactLoop.from_loop(Loop(children=[Loop(waveform=DummyWaveform(duration=1.5), repetition_count=2),
+                                                       Loop(waveform=DummyWaveform(duration=2.0))]))
+        parent_indices = program.parent_indices
+        make_compatible(program, minimal_waveform_length=1, waveform_quantum=1, sample_rate=2.)
+        self.assertIs(program.parent_indices, parent_indices)
+
+        loop = program.to_loop()
+        make_compatible(loop, minimal_waveform_length=1, waveform_quantum=1, sample_rate=1.)
+        make_compatible(program, minimal_waveform_length=1, waveform_quantum=1, sample_rate=1.)
+        self.assertIsInstance(program, CompactLoop)
+        self.assertEqual(program.to_loop(), loop)
+
+        with self.assertRaises(ValueError):
+            make_compatible(program, minimal_waveform_length=1, waveform_quantum=1, sample_rate=0.3)
+
+        hold = HoldInterpolationStrategy()
+        constant_wf = TableWaveform('A', [(0, 1., hold), (768, 1., hold)])
+        program = CompactLoop.from_loop(Loop(children=[Loop(waveform=constant_wf)]))
+        make_compatible(program, minimal_waveform_length=192, waveform_quantum=16, sample_rate=1.)
+        self.assertEqual(program.repetition_counts.tolist(), [1, 4])
+        self.assertEqual(program.waveforms[0].duration, 192)
+
+    def test_multi_channel_program(self):
+        mcp = MultiChannelProgram(get_two_chan_test_block(), ['A', 'B'])
+        loops = {channels: program.copy_tree_structure() for channels, program in mcp.programs.items()}
+
+        mcp.compact()
+        self.assertEqual(set(mcp.programs), set(loops))
+        for channels, program in mcp.programs.items():
+            self.assertIsInstance(program, CompactLoop)
+            self.assertEqual(program.to_loop(), loops[channels])
+        self.assertIsInstance(mcp['A'], CompactLoop)
@@ -3,8 +3,9 @@ import itertools
 
 import numpy as np
 
-from qctoolkit.pulses.instructions import InstructionBlock, EXECInstruction, MEASInstruction
+from qctoolkit.pulses.instructions import InstructionBlock, EXECInstruction, MEASInstruction, ImmutableInstructionBlock
 from qctoolkit.hardware.setup import HardwareSetup, ChannelID, PlaybackChannel, _SingleChannel, MarkerChannel, MeasurementMask
+from qctoolkit.hardware.program import PeriodicWindows
 
 from tests.pulses.sequencing_dummies import DummyWaveform
 
@@ -232,6 +233,42 @@ class HardwareSetupTests(unittest.TestCase):
         np.testing.assert_equal(dac._measurement_windows,
                                 expected_measurement_windows)
 
+    def test_register_periodic_program(self):
+        class ExpandingDAC(DummyDAC):
+            @property
+            def supports_periodic_windows(self):
+                return False
+
+        wf = DummyWaveform(duration=1.1, defined_channels={'A'})
+        body = InstructionBlock()
+        body.add_instruction_meas([('m1', 0.1, 0.2)])
+        body.add_instruction_exec(wf)
+
+        block = InstructionBlock()
+        block.add_instruction_repj(1000, ImmutableInstructionBlock(body))
+
+        awg = DummyAWG()
+        dac = DummyDAC()
+        expanding_dac = ExpandingDAC()
+
+        setup = HardwareSetup()
+        setup.set_channel('A', PlaybackChannel(awg, 0))
+        setup.set_measurement('m1', [MeasurementMask(dac, 'DAC'), MeasurementMask(expanding_dac, 'DAC')])
+
+        setup.register_program('p1', block)
+
+        windows = dac._measurement_windows['p1']['DAC']
+        self.assertIsInstance(windows, PeriodicWindows)
+        self.assertIs(setup.registered_programs['p1'].measurement_windows['m1'], windows)
+        self.assertEqual(windows.count, 1000)
+        self.assertAlmostEqual(windows.period, 1.1)
+        np.testing.assert_allclose(windows.begins, [0.1])
+        np.testing.assert_equal(windows.lengths, [0.2])
+
+        begins, lengths = expanding_dac._measurement_windows['p1']['DAC']
+        np.testing.assert_allclose(begins, 0.1 + np.arange(1000) * 1.1)
+        np.testing.assert_equal(lengths, np.full(1000, 0.2))
+
     def test_remove_program(self):
         wf_1 = DummyWaveform(duration=1.1, defined_channels={'A', 'B'})
         wf_2 = DummyWaveform(duration=1.1, defined_channels={'A', 'C'})
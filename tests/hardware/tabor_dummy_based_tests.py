@@ -1,6 +1,7 @@
 import sys
 import unittest
 import importlib
+from unittest import mock
 
 from typing import List
 from copy import copy, deepcopy
@@ -41,6 +42,11 @@ class DummyTaborProgramClass:
             def sampled_segments(self, sample_rate, voltage_amplitude, voltage_offset, voltage_transformation):
                 self.sampled_segments_calls.append((sample_rate, voltage_amplitude, voltage_offset, voltage_transformation))
                 return self.class_obj.segments, self.class_obj.segment_lengths
+            def get_segment_lengths(self, sample_rate):
+                return self.class_obj.segment_lengths
+            def iter_sampled_segments(self, sample_rate, voltage_amplitude, voltage_offset, voltage_transformation):
+                self.sampled_segments_calls.append((sample_rate, voltage_amplitude, voltage_offset, voltage_transformation))
+                return iter(self.class_obj.segments)
             def get_sequencer_tables(self):
                 return self.class_obj.sequencer_tables
             def get_advanced_sequencer_table(self):
@@ -156,6 +162,140 @@ class TaborAWGRepresentationDummyBasedTests(TaborDummyBasedTest):
         self.assertAllCommandLogsEqual(expected_log)
 
 
+    def test_state_cache(self):
+        visa_inst = self.instrument.main_instrument.visa_inst
+        visa_inst.logged_asks = []
+
+        self.assertEqual(self.instrument.sample_rate(1), 10**9)
+        self.assertEqual(self.instrument.amplitude(1), 1.0)
+        self.assertEqual(len(visa_inst.logged_asks), 3)
+        self.assertEqual(self.instrument.saved_round_trips, 0)
+
+        self.assertEqual(self.instrument.sample_rate(1), 10**9)
+        self.assertEqual(self.instrument.amplitude(1), 1.0)
+        self.assertEqual(len(visa_inst.logged_asks), 3)
+        self.assertEqual(self.instrument.saved_round_trips, 3)
+
+        # other channels and commands that do not change the state
+        self.instrument.sample_rate(3)
+        self.instrument.send_cmd(':INST:SEL 1; :OUTP OFF')
+        self.instrument.send_query(':VOLT?')
+        self.instrument.amplitude(1)
+        self.assertEqual(len(visa_inst.logged_asks), 5)
+
+        visa_inst.answers[':VOLT'] = '0.5'
+        self.instrument.send_cmd(':INST:SEL 1; :VOLT 0.5')
+        self.assertEqual(self.instrument.amplitude(1), 0.5)
+
+        visa_inst.answers[':FREQ:RAST'] = '2e9'
+        self.instrument.reset()
+        self.assertEqual(self.instrument.sample_rate(1), 2*10**9)
+
+        visa_inst.answers[':FREQ:RAST'] = '1e9'
+        self.assertEqual(self.instrument.sample_rate(1), 2*10**9)
+        self.instrument.invalidate_state_cache()
+        self.assertEqual(self.instrument.sample_rate(1), 10**9)
+
+    def test_mirror_error(self):
+        from qctoolkit.hardware.awgs.tabor import TaborDeviceError
+        self.reset_instrument_logs()
+
+        mirror = self.instrument.mirrored_instruments[0]
+        error = RuntimeError('mirror failed')
+        with mock.patch.object(mirror, 'send_cmd', side_effect=error):
+            with self.assertRaises(TaborDeviceError) as context:
+                self.instrument.send_cmd(':TRIG')
+        self.assertEqual(context.exception.errors, {mirror: error})
+        self.assertEqual(context.exception.operation, 'send_cmd')
+        self.assertEqual(self.instrument.main_instrument.logged_commands,
+                         [((), dict(cmd_str=':TRIG', paranoia_level=None))])
+
+        with mock.patch.object(mirror, 'send_query', return_value='mirror_answer'):
+            self.assertEqual(self.instrument.send_query(':VOLT?', query_mirrors=True), ('1.0', 'mirror_answer'))
+
+    def test_batched_commands(self):
+        self.reset_instrument_logs()
+
+        with self.instrument.batched_commands():
+            self.instrument.select_channel(1)
+            self.instrument.send_cmd(':TRAC:DEF 1, 192')
+            self.instrument.select_channel(1)
+            self.instrument.send_cmd('SEQ:SEL 1')
+            with self.instrument.batched_commands():
+                self.instrument.send_cmd(':INST:SEL 1; :OUTP ON; :INST:SEL 2; :OUTP ON')
+                self.instrument.select_channel(2)
+                self.instrument.send_cmd('')
+            self.instrument.send_cmd(':TRIG', paranoia_level=3)
+            self.assertAllCommandLogsEqual([])
+
+            self.instrument.send_binary_data(':TRAC:DATA', np.zeros(16, dtype=np.uint16))
+            self.assertAllCommandLogsEqual([
+                ((), dict(cmd_str=':INST:SEL 1; :TRAC:DEF 1, 192; :SEQ:SEL 1; '
+                                  ':INST:SEL 1; :OUTP ON; :INST:SEL 2; :OUTP ON', paranoia_level=None)),
+                ((), dict(cmd_str=':TRIG', paranoia_level=3))])
+
+            # the selected channel is still known after the flush
+            self.instrument.select_channel(2)
+            self.instrument.select_channel(1)
+        self.assertEqual(self.instrument.main_instrument.logged_commands[-1],
+                         ((), dict(cmd_str=':INST:SEL 1', paranoia_level=None)))
+
+        # outside of the context commands are sent directly
+        self.reset_instrument_logs()
+        self.instrument.select_channel(1)
+        self.instrument.select_channel(1)
+        self.assertAllCommandLogsEqual([((), dict(cmd_str=':INST:SEL 1', paranoia_level=None))] * 2)
+
+    def test_batched_commands_error(self):
+        from qctoolkit.hardware.awgs.tabor import TaborDeviceError
+        self.reset_instrument_logs()
+
+        mirror = self.instrument.mirrored_instruments[0]
+        error = RuntimeError('body failed')
+        with mock.patch.object(mirror, 'send_cmd', side_effect=RuntimeError('mirror failed')):
+            with self.assertRaises(TaborDeviceError) as context:
+                with self.instrument.batched_commands():
+                    self.instrument.send_cmd(':TRIG')
+                    raise error
+        self.assertIs(context.exception.__cause__, error)
+        self.assertIsNone(self.instrument._command_batch)
+
+        # without a failing flush the error of the body is raised
+        self.reset_instrument_logs()
+        with self.assertRaises(RuntimeError) as context:
+            with self.instrument.batched_commands():
+                self.instrument.send_cmd(':TRIG')
+                raise error
+        self.assertIs(context.exception, error)
+        self.assertAllCommandLogsEqual([((), dict(cmd_str=':TRIG', paranoia_level=None))])
+
+    def test_close(self):
+        self.instrument.send_cmd(':TRIG')
+        executor = self.instrument._device_executor
+        self.assertIsNotNone(executor)
+
+        self.instrument.close()
+        self.assertIsNone(self.instrument._device_executor)
+        with self.assertRaises(RuntimeError):
+            executor.submit(print)
+        self.instrument.close()
+
+        # the devices can still be used
+        self.instrument.send_cmd(':TRIG')
+        self.assertIsNotNone(self.instrument._device_executor)
+        self.instrument.close()
+
+    def test_batched_commands_length(self):
+        self.reset_instrument_logs()
+
+        with mock.patch.object(self.instrument, '_max_batched_command_length', 24):
+            with self.instrument.batched_commands():
+                for i in range(4):
+                    self.instrument.send_cmd(':TRAC:DEL {}'.format(i))
+        self.assertAllCommandLogsEqual([((), dict(cmd_str=':TRAC:DEL 0; :TRAC:DEL 1', paranoia_level=None)),
+                                        ((), dict(cmd_str=':TRAC:DEL 2; :TRAC:DEL 3', paranoia_level=None))])
+
+
 class TaborChannelPairTests(TaborDummyBasedTest):
     @classmethod
     def setUpClass(cls):
@@ -276,6 +416,91 @@ class TaborChannelPairTests(TaborDummyBasedTest):
         finally:
             sys.modules['qctoolkit.hardware.awgs.tabor'].TaborProgram = to_restore
 
+    def test_upload_pipelined(self):
+        segments = np.array([1, 2, 3, 4, 5])
+        segment_lengths = np.array([0, 16, 0, 16, 0], dtype=np.uint16)
+
+        to_restore = sys.modules['qctoolkit.hardware.awgs.tabor'].TaborProgram
+        my_class = DummyTaborProgramClass(segments=segments, segment_lengths=segment_lengths)
+        sys.modules['qctoolkit.hardware.awgs.tabor'].TaborProgram = my_class
+        try:
+            program = self.Loop(waveform=self.DummyWaveform(duration=192))
+
+            channel_pair = self.TaborChannelPair(self.instrument, identifier='asd', channels=(1, 2))
+            channel_pair.keep_segment_data = True
+            channel_pair.upload_pipeline_depth = 2
+
+            allowed_defragmentation = []
+
+            def dummy_stream_segments(segments_, segment_lengths_, amend_batch_size, allow_defragment):
+                self.assertIs(segment_lengths_, segment_lengths)
+                self.assertEqual(amend_batch_size, 2)
+                self.assertEqual(list(segments_), segments.tolist())
+                allowed_defragmentation.append(allow_defragment)
+                return np.array([5, 3, 1, 2, 6], dtype=np.int64)
+
+            channel_pair._stream_segments = dummy_stream_segments
+
+            channel_pair.upload('test', program, (1, None), (None, None), (lambda x: x, lambda x: x))
+
+            self.assertEqual(len(my_class.created[0].sampled_segments_calls), 1)
+            np.testing.assert_equal(channel_pair._known_programs['test'].waveform_to_segment,
+                                    np.array([5, 3, 1, 2, 6], dtype=np.int64))
+
+            # the segments of the overwritten program must not be discarded by a defragmentation
+            channel_pair._segment_references = np.ones(7, dtype=np.uint32)
+            channel_pair.upload('test', program, (1, None), (None, None), (lambda x: x, lambda x: x), force=True)
+            self.assertEqual(allowed_defragmentation, [True, False])
+        finally:
+            sys.modules['qctoolkit.hardware.awgs.tabor'].TaborProgram = to_restore
+
+    def test_stream_segments(self):
+        channel_pair = self.TaborChannelPair(self.instrument, identifier='asd', channels=(1, 2))
+
+        def make_segment(length, value):
+            return self.TaborSegment(np.full(length, value, dtype=np.uint16), None)
+
+        segments = [make_segment(192 + 32, 0), make_segment(192 + 16, 1), make_segment(192, 2),
+                    make_segment(192, 3), make_segment(400, 4)]
+
+        channel_pair._segment_capacity = 192 + np.asarray([0, 80, 32, 64, 32, 16], dtype=np.uint32)
+        channel_pair._segment_hashes = np.asarray([1, 2, 3, 4, hash(segments[2]), 6], dtype=np.int64)
+        channel_pair._segment_digests = np.full(len(channel_pair._segment_hashes), None, dtype=object)
+        channel_pair._segment_references = np.asarray([1, 0, 1, 0, 1, 0], dtype=np.uint32)
+
+        uploaded = []
+        amended = []
+
+        def dummy_upload_segment(segment_index, segment):
+            uploaded.append((segment_index, segment))
+            channel_pair._segment_references[segment_index] = 1
+            channel_pair._segment_hashes[segment_index] = hash(segment)
+
+        def dummy_amend_segments(segments_):
+            amended.append(list(segments_))
+            return np.arange(6, 6 + len(segments_), dtype=np.int64)
+
+        channel_pair._upload_segment = dummy_upload_segment
+        channel_pair._amend_segments = dummy_amend_segments
+
+        w2s = channel_pair._stream_segments(iter(segments), np.array([s.num_points for s in segments]),
+                                            amend_batch_size=2)
+
+        # best fitting free segments are used
+        self.assertEqual(w2s.tolist(), [3, 5, 4, 1, 6])
+        self.assertEqual([index for index, _ in uploaded], [3, 5, 1])
+        self.assertEqual([segment for _, segment in uploaded], [segments[0], segments[1], segments[3]])
+        self.assertEqual(len(amended), 1)
+        self.assertIs(amended[0][0], segments[4])
+        np.testing.assert_equal(channel_pair._segment_references, [1, 1, 1, 1, 2, 1])
+
+        # references are restored on error
+        references = channel_pair._segment_references.copy()
+        with self.assertRaises(MemoryError):
+            channel_pair._stream_segments(iter([segments[2], make_segment(channel_pair.total_capacity, 5)]),
+                                          np.array([192, channel_pair.total_capacity]), amend_batch_size=2)
+        np.testing.assert_equal(channel_pair._segment_references, references)
+
     def test_find_place_for_segments_in_memory(self):
         def hash_based_on_dir(ch):
             hash_list = []
@@ -307,6 +532,7 @@ class TaborChannelPairTests(TaborDummyBasedTest):
         # all new segments
         channel_pair._segment_capacity = 192 + np.asarray([0, 16, 32, 16, 0], dtype=np.uint32)
         channel_pair._segment_hashes = np.asarray([1, 2, 3, 4, 5], dtype=np.int64)
+        channel_pair._segment_digests = np.full(len(channel_pair._segment_hashes), None, dtype=object)
         channel_pair._segment_references = np.asarray([1, 1, 1, 2, 1], dtype=np.int32)
         hash_before = hash_based_on_dir(channel_pair)
 
@@ -319,6 +545,7 @@ class TaborChannelPairTests(TaborDummyBasedTest):
         # some known segments
         channel_pair._segment_capacity = 192 + np.asarray([0, 16, 32, 64, 0, 16], dtype=np.uint32)
         channel_pair._segment_hashes = np.asarray([1, 2, 3, -7, 5, -9], dtype=np.int64)
+        channel_pair._segment_digests = np.full(len(channel_pair._segment_hashes), None, dtype=object)
         channel_pair._segment_references = np.asarray([1, 1, 1, 2, 1, 3], dtype=np.int32)
         hash_before = hash_based_on_dir(channel_pair)
 
@@ -331,6 +558,7 @@ class TaborChannelPairTests(TaborDummyBasedTest):
         # insert some segments with same length
         channel_pair._segment_capacity = 192 + np.asarray([0, 16, 32, 64, 0, 16], dtype=np.uint32)
         channel_pair._segment_hashes = np.asarray([1, 2, 3, 4, 5, 6], dtype=np.int64)
+        channel_pair._segment_digests = np.full(len(channel_pair._segment_hashes), None, dtype=object)
         channel_pair._segment_references = np.asarray([1, 0, 1, 0, 1, 3], dtype=np.int32)
         hash_before = hash_based_on_dir(channel_pair)
 
@@ -343,13 +571,15 @@ class TaborChannelPairTests(TaborDummyBasedTest):
         # insert some segments with smaller length
         channel_pair._segment_capacity = 192 + np.asarray([0, 80, 32, 64, 96, 16], dtype=np.uint32)
         channel_pair._segment_hashes = np.asarray([1, 2, 3, 4, 5, 6], dtype=np.int64)
+        channel_pair._segment_digests = np.full(len(channel_pair._segment_hashes), None, dtype=object)
         channel_pair._segment_references = np.asarray([1, 0, 1, 1, 0, 3], dtype=np.int32)
         hash_before = hash_based_on_dir(channel_pair)
 
         w2s, ta, ti = channel_pair._find_place_for_segments_in_memory(segments, segment_lengths)
         self.assertEqual(w2s.tolist(), [-1, -1, -1, -1, -1])
         self.assertEqual(ta.tolist(), [True, True, False, False, True])
-        self.assertEqual(ti.tolist(), [-1, -1, 4, 1, -1])
+        # best fit: the largest segment takes the smallest fitting place
+        self.assertEqual(ti.tolist(), [-1, -1, 1, 4, -1])
         self.assertEqual(hash_before, hash_based_on_dir(channel_pair))
 
         # mix everything
@@ -358,6 +588,7 @@ class TaborChannelPairTests(TaborDummyBasedTest):
 
         channel_pair._segment_capacity = 192 + np.asarray([0, 80, 32, 64, 32, 16], dtype=np.uint32)
         channel_pair._segment_hashes = np.asarray([1, 2, 3, 4, -8, 6], dtype=np.int64)
+        channel_pair._segment_digests = np.full(len(channel_pair._segment_hashes), None, dtype=object)
         channel_pair._segment_references = np.asarray([1, 0, 1, 0, 1, 0], dtype=np.int32)
         hash_before = hash_based_on_dir(channel_pair)
 
@@ -367,6 +598,63 @@ class TaborChannelPairTests(TaborDummyBasedTest):
         self.assertEqual(ti.tolist(),  [1,     -1,   3,     -1,    -1,   -1,   -1])
         self.assertEqual(hash_before, hash_based_on_dir(channel_pair))
 
+    def test_find_place_hash_collision(self):
+        channel_pair = self.TaborChannelPair(self.instrument, identifier='asd', channels=(1, 2))
+
+        segment = self.TaborSegment(np.ones(192, dtype=np.uint16), None)
+        channel_pair._segment_capacity = np.asarray([192, 192], dtype=np.uint32)
+        channel_pair._segment_hashes = np.asarray([1, hash(segment)], dtype=np.int64)
+        channel_pair._segment_digests = np.full(len(channel_pair._segment_hashes), None, dtype=object)
+        channel_pair._segment_references = np.asarray([1, 1], dtype=np.int32)
+
+        channel_pair._segment_digests[1] = segment.digest
+        w2s, ta, ti = channel_pair._find_place_for_segments_in_memory([segment], np.array([192]))
+        self.assertEqual(w2s.tolist(), [1])
+        self.assertEqual(ta.tolist(), [False])
+
+        # a different segment with the same hash was uploaded
+        channel_pair._segment_digests[1] = bytes(32)
+        w2s, ta, ti = channel_pair._find_place_for_segments_in_memory([segment], np.array([192]))
+        self.assertEqual(w2s.tolist(), [-1])
+        self.assertEqual(ta.tolist(), [True])
+
+    def test_hash_collision_uploaded_segments(self):
+        channel_pair = self.TaborChannelPair(self.instrument, identifier='asd', channels=(1, 2))
+        channel_pair.keep_segment_data = True
+        channel_pair._configuration_guard_count = 2
+
+        # two segments with the same hash but different content
+        data = np.ones(192, dtype=np.uint16)
+        segment_a = self.TaborSegment(data, data)
+        segment_b = self.TaborSegment(2*data, 2*data)
+        segment_a._digest = bytes(8) + bytes([1]) * 24
+        segment_b._digest = bytes(8) + bytes([2]) * 24
+        self.assertEqual(hash(segment_a), hash(segment_b))
+
+        channel_pair._amend_segments([segment_a])
+        w2s, ta, ti = channel_pair._find_place_for_segments_in_memory([segment_b], np.array([192]))
+        self.assertEqual(w2s.tolist(), [-1])
+        self.assertEqual(ta.tolist(), [True])
+        channel_pair._amend_segments([segment_b])
+        np.testing.assert_equal(channel_pair._segment_digests, [channel_pair._idle_segment.digest,
+                                                                segment_a.digest, segment_b.digest])
+
+        # each segment is found in its own slot
+        w2s, ta, ti = channel_pair._find_place_for_segments_in_memory([segment_b, segment_a], np.array([192, 192]))
+        self.assertEqual(w2s.tolist(), [2, 1])
+        self.assertEqual(ta.tolist(), [False, False])
+
+        w2s = channel_pair._stream_segments(iter([segment_b, segment_a]), np.array([192, 192]), amend_batch_size=2)
+        self.assertEqual(w2s.tolist(), [2, 1])
+        np.testing.assert_equal(channel_pair._segment_references, [1, 2, 2])
+
+        # the digests follow the segments when the memory is defragmented
+        channel_pair._segment_references[1] = 0
+        channel_pair._defragment()
+        np.testing.assert_equal(channel_pair._segment_digests, [channel_pair._idle_segment.digest, segment_b.digest])
+        w2s, _, _ = channel_pair._find_place_for_segments_in_memory([segment_b, segment_a], np.array([192, 192]))
+        self.assertEqual(w2s.tolist(), [1, -1])
+
     def test_upload_segment(self):
         channel_pair = self.TaborChannelPair(self.instrument, identifier='asd', channels=(1, 2))
 
@@ -377,6 +665,7 @@ class TaborChannelPairTests(TaborDummyBasedTest):
         channel_pair._segment_lengths = channel_pair._segment_capacity.copy()
 
         channel_pair._segment_hashes = np.array([1, 2, 3, 4], dtype=np.int64)
+        channel_pair._segment_digests = np.full(len(channel_pair._segment_hashes), None, dtype=object)
 
         # prevent entering and exiting configuration mode
         channel_pair._configuration_guard_count = 2
@@ -393,6 +682,7 @@ class TaborChannelPairTests(TaborDummyBasedTest):
         np.testing.assert_equal(channel_pair._segment_capacity, 192 + np.array([0, 16, 32, 32], dtype=np.uint32))
         np.testing.assert_equal(channel_pair._segment_lengths, 192 + np.array([0, 16, 16, 32], dtype=np.uint32))
         np.testing.assert_equal(channel_pair._segment_hashes, np.array([1, 2, hash(segment), 4], dtype=np.int64))
+        self.assertEqual(channel_pair._segment_digests[2], segment.digest)
 
         expected_commands = [':INST:SEL 1', ':INST:SEL 1', ':INST:SEL 1',
                              ':TRAC:DEF 3, 208',
@@ -422,6 +712,7 @@ class TaborChannelPairTests(TaborDummyBasedTest):
         channel_pair._segment_lengths = 192 + np.array([0, 16, 16, 32], dtype=np.uint32)
 
         channel_pair._segment_hashes = np.array([1, 2, 3, 4], dtype=np.int64)
+        channel_pair._segment_digests = np.full(len(channel_pair._segment_hashes), None, dtype=object)
 
         data = np.ones(192, dtype=np.uint16)
         segments = [self.TaborSegment(0*data, 1*data),
@@ -469,6 +760,7 @@ class TaborChannelPairTests(TaborDummyBasedTest):
         channel_pair._segment_lengths = 192 + np.array([0, 0, 16, 16], dtype=np.uint32)
 
         channel_pair._segment_hashes = np.array([1, 2, 3, 4], dtype=np.int64)
+        channel_pair._segment_digests = np.full(len(channel_pair._segment_hashes), None, dtype=object)
 
         data = np.ones(192, dtype=np.uint16)
         segments = [self.TaborSegment(0*data, 1*data),
@@ -519,6 +811,7 @@ class TaborChannelPairTests(TaborDummyBasedTest):
         channel_pair._segment_capacity = 192 + np.array([0, 16, 32, 32], dtype=np.uint32)
         channel_pair._segment_lengths = 192 + np.array([0, 0, 16, 16], dtype=np.uint32)
         channel_pair._segment_hashes = np.array([1, 2, 3, 4], dtype=np.int64)
+        channel_pair._segment_digests = np.full(len(channel_pair._segment_hashes), None, dtype=object)
 
         channel_pair.cleanup()
         np.testing.assert_equal(channel_pair._segment_references, np.array([1, 2, 0, 1], dtype=np.uint32))
@@ -530,6 +823,7 @@ class TaborChannelPairTests(TaborDummyBasedTest):
         channel_pair._segment_capacity = 192 + np.array([0, 16, 32, 32, 32], dtype=np.uint32)
         channel_pair._segment_lengths = 192 + np.array([0, 0, 16, 16, 0], dtype=np.uint32)
         channel_pair._segment_hashes = np.array([1, 2, 3, 4, 5], dtype=np.int64)
+        channel_pair._segment_digests = np.full(len(channel_pair._segment_hashes), None, dtype=object)
 
         channel_pair.cleanup()
         np.testing.assert_equal(channel_pair._segment_references, np.array([1, 2, 0, 1], dtype=np.uint32))
@@ -537,6 +831,163 @@ class TaborChannelPairTests(TaborDummyBasedTest):
         np.testing.assert_equal(channel_pair._segment_lengths, 192 + np.array([0, 0, 16, 16], dtype=np.uint32))
         np.testing.assert_equal(channel_pair._segment_hashes, np.array([1, 2, 3, 4], dtype=np.int64))
 
+    def test_defragment(self):
+        channel_pair = self.TaborChannelPair(self.instrument, identifier='asd', channels=(1, 2))
+        channel_pair.keep_segment_data = True
+        # prevent entering and exiting configuration mode
+        channel_pair._configuration_guard_count = 2
+
+        data = np.ones(192, dtype=np.uint16)
+        segments = [self.TaborSegment(i*data, i*data) for i in range(1, 6)]
+        channel_pair._amend_segments(segments)
+
+        # segments 1 and 3 are free, segment 4 is shared by two programs
+        channel_pair._segment_references = np.array([1, 0, 1, 0, 2, 1], dtype=np.uint32)
+        program_1 = self.TaborProgramMemory(np.array([2, 4]), None)
+        program_2 = self.TaborProgramMemory(np.array([4, 5, 0]), None)
+        channel_pair._known_programs = dict(p1=program_1, p2=program_2)
+
+        self.reset_instrument_logs()
+        # the last two segments are moved into the holes
+        self.assertEqual(channel_pair.defragment(), 2)
+
+        np.testing.assert_equal(channel_pair._segment_references, [1, 1, 1, 2])
+        np.testing.assert_equal(channel_pair._segment_capacity, [192, 192, 192, 192])
+        np.testing.assert_equal(channel_pair._segment_hashes, [hash(channel_pair._idle_segment)] +
+                                [hash(segments[i]) for i in (4, 1, 3)])
+        self.assertEqual(sorted(channel_pair._segment_data), [0, 1, 2, 3])
+
+        np.testing.assert_equal(channel_pair._known_programs['p1'].waveform_to_segment, [2, 3])
+        np.testing.assert_equal(channel_pair._known_programs['p2'].waveform_to_segment, [3, 1, 0])
+
+        np.testing.assert_equal(self.instrument.main_instrument._send_binary_data_calls,
+                                [(':TRAC:DATA', segments[i].get_as_binary(), None) for i in (4, 3)])
+        self.assertTrue(any(':TRAC:DEL 5;TRAC:DEL 6' in kwargs['cmd_str']
+                            for _, kwargs in self.instrument.main_instrument.logged_commands))
+
+        # nothing to do
+        self.assertEqual(channel_pair.defragment(), 0)
+
+    def test_defragment_amends(self):
+        channel_pair = self.TaborChannelPair(self.instrument, identifier='asd', channels=(1, 2))
+        channel_pair.keep_segment_data = True
+        channel_pair._configuration_guard_count = 2
+
+        data = np.ones(192, dtype=np.uint16)
+        segments = [self.TaborSegment(i*data, i*data) for i in range(1, 6)]
+        channel_pair._amend_segments(segments)
+
+        # the holes are too small for the last segment
+        channel_pair._segment_capacity = np.array([192, 160, 192, 176, 192, 208], dtype=np.uint32)
+        channel_pair._segment_references = np.array([1, 0, 1, 0, 1, 1], dtype=np.uint32)
+
+        self.reset_instrument_logs()
+        # only the segments behind the last hole are moved if this frees enough memory
+        points_at_end = channel_pair.total_capacity - 192*4 - 160 - 208
+        index_map = channel_pair._defragment(points_at_end + 176)
+        np.testing.assert_equal(index_map, [0, 1, 2, -1, 3, 4])
+        np.testing.assert_equal(channel_pair._segment_references, [1, 0, 1, 1, 1])
+        np.testing.assert_equal(channel_pair._segment_capacity, [192, 160, 192, 192, 192])
+        np.testing.assert_equal(self.instrument.main_instrument._send_binary_data_calls,
+                                [(':TRAC:DATA', self.make_combined_wave(segments[3:]), None)])
+
+        # enough memory is free already
+        np.testing.assert_equal(channel_pair._defragment(points_at_end + 176), np.arange(5))
+
+        # all holes are removed otherwise
+        np.testing.assert_equal(channel_pair._defragment(), [0, -1, 1, 2, 3])
+        np.testing.assert_equal(channel_pair._segment_references, [1, 1, 1, 1])
+        np.testing.assert_equal(channel_pair._segment_hashes, [hash(channel_pair._idle_segment)] +
+                                [hash(segments[i]) for i in (1, 3, 4)])
+
+    def test_segment_data(self):
+        from qctoolkit.hardware.awgs.tabor import TaborException
+        channel_pair = self.TaborChannelPair(self.instrument, identifier='asd', channels=(1, 2))
+        channel_pair._configuration_guard_count = 2
+
+        data = np.ones(192, dtype=np.uint16)
+        segments = [self.TaborSegment(i*data, i*data) for i in range(1, 4)]
+
+        # no host side copies by default
+        channel_pair._amend_segments(segments[:2])
+        self.assertEqual(list(channel_pair._segment_data), [0])
+        channel_pair._segment_references[1] = 0
+        with self.assertRaisesRegex(TaborException, 'keep_segment_data'):
+            channel_pair.defragment()
+        np.testing.assert_equal(channel_pair._segment_hashes[1:], [hash(segments[0]), hash(segments[1])])
+
+        channel_pair.keep_segment_data = True
+        channel_pair._upload_segment(1, segments[2])
+        self.assertEqual(channel_pair._segment_data, {0: channel_pair._idle_segment, 1: segments[2]})
+
+        # the copies are dropped with the last reference
+        channel_pair._known_programs = dict(p1=self.TaborProgramMemory(np.array([1]), None),
+                                            p2=self.TaborProgramMemory(np.array([1, 2]), None))
+        channel_pair._segment_references = np.array([1, 2, 1], dtype=np.uint32)
+        channel_pair.free_program('p2')
+        self.assertEqual(channel_pair._segment_data, {0: channel_pair._idle_segment, 1: segments[2]})
+        channel_pair.free_program('p1')
+        self.assertEqual(channel_pair._segment_data, {0: channel_pair._idle_segment})
+
+    def test_stream_segments_defragments(self):
+        channel_pair = self.TaborChannelPair(self.instrument, identifier='asd', channels=(1, 2))
+        channel_pair.keep_segment_data = True
+        channel_pair._configuration_guard_count = 2
+
+        known = self.TaborSegment(np.full(192, 1, dtype=np.uint16), None)
+        channel_pair._amend_segments([self.TaborSegment(np.full(192, 2, dtype=np.uint16), None), known])
+
+        # a huge free segment in front of the known one
+        free_capacity = channel_pair.total_capacity - 192 - 192 - 1024
+        channel_pair._segment_capacity = np.array([192, free_capacity, 192], dtype=np.uint32)
+        channel_pair._segment_references = np.array([1, 0, 1], dtype=np.uint32)
+
+        large = self.TaborSegment(np.zeros(free_capacity + 192, dtype=np.uint16), None)
+        w2s = channel_pair._stream_segments(iter([known, large]), np.array([192, large.num_points]),
+                                            amend_batch_size=2, allow_defragment=True)
+        np.testing.assert_equal(w2s, [1, 2])
+        np.testing.assert_equal(channel_pair._segment_references, [1, 2, 1])
+        np.testing.assert_equal(channel_pair._segment_hashes[1:], [hash(known), hash(large)])
+
+    def test_upload_defragments(self):
+        segments = np.array([1, 2])
+        segment_lengths = np.array([192, 192], dtype=np.uint16)
+
+        to_restore = sys.modules['qctoolkit.hardware.awgs.tabor'].TaborProgram
+        my_class = DummyTaborProgramClass(segments=segments, segment_lengths=segment_lengths)
+        sys.modules['qctoolkit.hardware.awgs.tabor'].TaborProgram = my_class
+        try:
+            from qctoolkit.hardware.awgs.tabor import TaborFragmentationError
+            program = self.Loop(waveform=self.DummyWaveform(duration=192))
+            channel_pair = self.TaborChannelPair(self.instrument, identifier='asd', channels=(1, 2))
+            channel_pair.keep_segment_data = True
+
+            calls = []
+
+            def dummy_find_place(segments_, segment_lengths_):
+                calls.append('find_place')
+                if len(calls) == 1:
+                    raise TaborFragmentationError('Fragmentation does not allow upload.')
+                return np.array([0, 0], dtype=np.int64), np.array([False, False]), np.array([-1, -1])
+
+            def dummy_defragment():
+                calls.append('defragment')
+                return 1
+
+            channel_pair._find_place_for_segments_in_memory = dummy_find_place
+            channel_pair.defragment = dummy_defragment
+
+            channel_pair.upload('test', program, (1, None), (None, None), (lambda x: x, lambda x: x))
+            self.assertEqual(calls, ['find_place', 'defragment', 'find_place'])
+
+            calls.clear()
+            channel_pair.auto_defragment = False
+            with self.assertRaises(MemoryError):
+                channel_pair.upload('test2', program, (1, None), (None, None), (lambda x: x, lambda x: x))
+            self.assertEqual(calls, ['find_place'])
+        finally:
+            sys.modules['qctoolkit.hardware.awgs.tabor'].TaborProgram = to_restore
+
     def test_remove(self):
         channel_pair = self.TaborChannelPair(self.instrument, identifier='asd', channels=(1, 2))
 
@@ -658,3 +1109,68 @@ class TaborChannelPairTests(TaborDummyBasedTest):
         for device in self.instrument.all_devices:
             self.assertEqual(device._download_adv_seq_table_calls, expected_adv_seq_table_log)
             self.assertEqual(device._download_sequencer_table_calls, expected_sequencer_table_log)
+
+    def test_change_armed_program_sequence_slots(self):
+        channel_pair = self.TaborChannelPair(self.instrument, identifier='asd', channels=(1, 2))
+        # prevent entering and exiting configuration mode
+        channel_pair._configuration_guard_count = 2
+        self.reset_instrument_logs()
+
+        def make_program(sequencer_tables):
+            return DummyTaborProgramClass(advanced_sequencer_table=[(1, i + 1, 0) for i in range(len(sequencer_tables))],
+                                          sequencer_tables=sequencer_tables,
+                                          waveform_mode=self.TaborSequencing.ADVANCED)(None, None, None, None)
+
+        w2s = np.array([1, 2, 3])
+        table_a = [(1, 0, 0), (1, 1, 0), (1, 2, 0)]
+        table_b = [(2, 0, 0), (1, 1, 0), (1, 2, 0)]
+        table_c = [(3, 0, 0), (1, 1, 0), (1, 2, 0)]
+        channel_pair._segment_references = np.full(4, 4, dtype=np.uint32)
+        channel_pair._known_programs['a'] = self.TaborProgramMemory(w2s, make_program([table_a]))
+        channel_pair._known_programs['b'] = self.TaborProgramMemory(w2s, make_program([table_b, table_a]))
+
+        def translated(table):
+            return [(rep, w2s[wf] + 1, jump) for rep, wf, jump in table]
+
+        def sequence_downloads():
+            return [args[0] for args, _ in self.instrument.main_instrument._download_sequencer_table_calls]
+
+        def adv_seq_downloads():
+            return [table for table, _, _ in self.instrument.main_instrument._download_adv_seq_table_calls]
+
+        channel_pair.change_armed_program('a')
+        channel_pair.change_armed_program('b')
+        channel_pair.change_armed_program('a')
+        channel_pair.change_armed_program('a')
+        channel_pair.change_armed_program('b')
+
+        # table_a is shared
+        self.assertEqual(sequence_downloads(), [translated(table_a), translated(table_b)])
+        self.assertEqual(adv_seq_downloads(), [[(1, 1, 1), (1, 2, 0), (1, 1, 0)],
+                                               [(1, 1, 1), (1, 3, 0), (1, 2, 0)],
+                                               [(1, 1, 1), (1, 2, 0), (1, 1, 0)],
+                                               [(1, 1, 1), (1, 3, 0), (1, 2, 0)]])
+        self.assertEqual(channel_pair._sequence_references, [1, 2, 1])
+
+        # free slots are reused
+        channel_pair.free_program('b')
+        self.assertEqual(channel_pair._sequence_references, [1, 1, 0])
+        channel_pair._known_programs['c'] = self.TaborProgramMemory(w2s, make_program([table_c]))
+        channel_pair.change_armed_program('c')
+        self.assertEqual(sequence_downloads()[2:], [translated(table_c)])
+        self.assertEqual(channel_pair._sequence_references, [1, 1, 1])
+        self.assertEqual(channel_pair._program_sequences, {'a': [1], 'c': [2]})
+
+        # the slots of the least recently armed program are released if the device runs out of slots
+        channel_pair._known_programs['b'] = self.TaborProgramMemory(w2s, make_program([table_b]))
+        with mock.patch.dict(channel_pair.device.dev_properties, max_num_seq=3):
+            channel_pair.change_armed_program('b')
+            self.assertEqual(channel_pair._program_sequences, {'c': [2], 'b': [1]})
+
+            # the slots of the armed program are kept and three tables do not fit next to the idle table
+            channel_pair._known_programs['d'] = self.TaborProgramMemory(w2s, make_program([table_a, table_b, table_c]))
+            from qctoolkit.hardware.awgs.tabor import TaborException
+            with self.assertRaises(TaborException):
+                channel_pair.change_armed_program('d')
+            self.assertEqual(channel_pair._sequence_references, [1, 1, 0])
+            self.assertEqual(channel_pair._program_sequences, {'b': [1]})
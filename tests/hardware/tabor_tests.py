@@ -1,14 +1,25 @@
 import unittest
 import itertools
+import os
+import timeit
+import pickle
+import concurrent.futures
+from unittest import mock
 import numpy as np
 
 from teawg import model_properties_dict
 
 from qctoolkit.hardware.awgs.tabor import TaborException, TaborProgram, \
     TaborSegment, TaborSequencing, with_configuration_guard
-from qctoolkit.hardware.program import MultiChannelProgram, Loop
+from qctoolkit.hardware.program import MultiChannelProgram, Loop, CompactLoop
 from qctoolkit.pulses.instructions import InstructionBlock
 from qctoolkit.hardware.util import voltage_to_uint16
+from qctoolkit.pulses.table_pulse_template import TableWaveform
+from qctoolkit.pulses.function_pulse_template import FunctionWaveform
+from qctoolkit.expressions import Expression
+from qctoolkit.pulses.sequence_pulse_template import SequenceWaveform
+from qctoolkit.pulses.multi_channel_pulse_template import MultiChannelWaveform
+from qctoolkit.pulses.interpolation import HoldInterpolationStrategy, LinearInterpolationStrategy
 
 from tests.pulses.sequencing_dummies import DummyWaveform
 from tests.hardware.program_tests import LoopTests, WaveformGenerator, MultiChannelTests
@@ -31,6 +42,26 @@ class TaborSegmentTests(unittest.TestCase):
     def test_num_points(self):
         self.assertEqual(TaborSegment(np.zeros(5), np.zeros(5)).num_points, 5)
 
+    def test_digest(self):
+        data = np.arange(192, dtype=np.uint16)
+        ts = TaborSegment(data, None)
+
+        self.assertEqual(len(ts.digest), 32)
+        self.assertIs(ts.digest, ts.digest)
+        self.assertEqual(hash(ts), hash(TaborSegment(data.copy(), None)))
+        self.assertEqual(ts.digest, TaborSegment(data[::-1][::-1], None).digest)
+
+        self.assertNotEqual(ts.digest, TaborSegment(None, data).digest)
+        self.assertNotEqual(ts.digest, TaborSegment(data, data).digest)
+        self.assertNotEqual(ts.digest, TaborSegment(data + 1, None).digest)
+
+    def test_pickle(self):
+        ts = TaborSegment(np.arange(5, dtype=np.uint16), None)
+        unpickled = pickle.loads(pickle.dumps(ts))
+        self.assertIsInstance(unpickled, TaborSegment)
+        np.testing.assert_equal(unpickled[0], ts[0])
+        self.assertIsNone(unpickled[1])
+
 
 class TaborProgramTests(unittest.TestCase):
     def __init__(self, *args, **kwargs):
@@ -122,6 +153,34 @@ class TaborProgramTests(unittest.TestCase):
         self.assertEqual(t_program.get_sequencer_tables(), [[(3, 0, 0), (4, 1, 0), (1, 0, 0)]])
         self.assertEqual(t_program.get_advanced_sequencer_table(), [(1, 1, 0)])
 
+    def test_compact_program(self):
+        wf_1 = DummyWaveform(defined_channels={'A'})
+        wf_2 = DummyWaveform(defined_channels={'A'})
+
+        program = CompactLoop.from_loop(Loop(children=[Loop(waveform=wf_1, repetition_count=3),
+                                                       Loop(waveform=wf_2, repetition_count=4),
+                                                       Loop(waveform=wf_1, repetition_count=1)]))
+        t_program = TaborProgram(program, channels=(None, 'A'), markers=(None, None),
+                                 device_properties=self.instr_props)
+
+        self.assertIs(t_program.program, program)
+        self.assertEqual(t_program.waveform_mode, TaborSequencing.SINGLE)
+        self.assertEqual(t_program.get_sequencer_tables(), [[(3, 0, 0), (4, 1, 0), (1, 0, 0)]])
+        self.assertEqual(t_program.get_advanced_sequencer_table(), [(1, 1, 0)])
+        self.assertEqual(t_program._waveforms, (wf_1, wf_2))
+
+        program = CompactLoop.from_loop(Loop(children=[Loop(waveform=wf_1, repetition_count=3),
+                                                       Loop(waveform=wf_2, repetition_count=4),
+                                                       Loop(waveform=wf_1, repetition_count=1)],
+                                             repetition_count=5))
+        t_program = TaborProgram(program, channels=(None, 'A'), markers=(None, None),
+                                 device_properties=self.instr_props)
+
+        self.assertIsInstance(t_program.program, Loop)
+        self.assertEqual(t_program.waveform_mode, TaborSequencing.ADVANCED)
+        self.assertEqual(t_program.get_sequencer_tables(), [[(3, 0, 0), (4, 1, 0), (1, 0, 0)]])
+        self.assertEqual(t_program.get_advanced_sequencer_table(), [(5, 1, 0)])
+
     def test_depth_1_advanced_sequence_unroll(self):
         wf_1 = DummyWaveform(defined_channels={'A'})
         wf_2 = DummyWaveform(defined_channels={'A'})
@@ -157,6 +216,67 @@ class TaborProgramTests(unittest.TestCase):
         self.assertEqual(t_program.get_sequencer_tables(), [[(3, 0, 0), (4, 1, 0), (1, 0, 0)]])
         self.assertEqual(t_program.get_advanced_sequencer_table(), [(5, 1, 0)])
 
+    def test_advanced_sequence_split(self):
+        temp_properties = self.instr_props.copy()
+        temp_properties['max_seq_len'] = 5
+
+        program = Loop(children=[Loop(waveform=DummyWaveform(defined_channels={'A'}), repetition_count=1)
+                                 for _ in range(temp_properties['max_seq_len']+1)],
+                       repetition_count=2)
+        t_program = TaborProgram(program, channels=(None, 'A'), markers=(None, None),
+                                 device_properties=temp_properties)
+
+        self.assertEqual(t_program.waveform_mode, TaborSequencing.ADVANCED)
+        self.assertEqual(t_program.get_sequencer_tables(), [[(1, 0, 0), (1, 1, 0), (1, 2, 0)],
+                                                            [(1, 3, 0), (1, 4, 0), (1, 5, 0)]])
+        self.assertEqual(t_program.get_advanced_sequencer_table(), [(1, 1, 0), (1, 2, 0), (1, 1, 0), (1, 2, 0)])
+
+    def test_advanced_sequence_packing(self):
+        wfs = [DummyWaveform(defined_channels={'A'}) for _ in range(4)]
+
+        def expand(loop):
+            if loop.is_leaf():
+                return [loop.waveform] * loop.repetition_count
+            return [waveform for child in loop for waveform in expand(child)] * loop.repetition_count
+
+        program = Loop(children=[
+            # played once and too short -> merged with the next table
+            Loop(children=[Loop(waveform=wfs[0]), Loop(waveform=wfs[1])]),
+            Loop(children=[Loop(waveform=wfs[2])]),
+            # repeated and too short -> unrolled twice
+            Loop(children=[Loop(waveform=wfs[0]), Loop(waveform=wfs[1])], repetition_count=5),
+            # single waveform -> merged into one row
+            Loop(children=[Loop(waveform=wfs[3], repetition_count=2)], repetition_count=7),
+            # repeated and long enough
+            Loop(children=[Loop(waveform=wf) for wf in wfs], repetition_count=3),
+            # played once and too short -> takes a repetition of the previous table
+            Loop(children=[Loop(waveform=wfs[2])])
+        ])
+        expected_waveforms = expand(program)
+
+        t_program = TaborProgram(program, channels=(None, 'A'), markers=(None, None),
+                                 device_properties=self.instr_props)
+        self.assertEqual(t_program.waveform_mode, TaborSequencing.ADVANCED)
+
+        sequencer_tables = t_program.get_sequencer_tables()
+        played_waveforms = [t_program._waveforms[wf_index]
+                            for rep_count, seq_no, _ in t_program.get_advanced_sequencer_table()
+                            for _ in range(rep_count)
+                            for wf_rep_count, wf_index, _ in sequencer_tables[seq_no - 1]
+                            for _ in range(wf_rep_count)]
+        self.assertEqual(played_waveforms, expected_waveforms)
+        self.assertEqual(len(t_program._waveforms), 4)
+        for sequencer_table in sequencer_tables:
+            self.assertGreaterEqual(len(sequencer_table), self.instr_props['min_seq_len'])
+
+        self.assertEqual(t_program.get_advanced_sequencer_table(),
+                         [(1, 1, 0), (2, 2, 0), (1, 3, 0), (2, 4, 0), (1, 5, 0)])
+        self.assertEqual(sequencer_tables, [[(1, 0, 0), (1, 1, 0), (1, 2, 0)],
+                                            [(1, 0, 0), (1, 1, 0), (1, 0, 0), (1, 1, 0)],
+                                            [(1, 0, 0), (1, 1, 0), (14, 3, 0)],
+                                            [(1, 0, 0), (1, 1, 0), (1, 2, 0), (1, 3, 0)],
+                                            [(1, 0, 0), (1, 1, 0), (1, 2, 0), (1, 3, 0), (1, 2, 0)]])
+
     def test_advanced_sequence_exceptions(self):
         temp_properties = self.instr_props.copy()
         temp_properties['max_seq_len'] = 5
@@ -164,9 +284,6 @@ class TaborProgramTests(unittest.TestCase):
         program = Loop(children=[Loop(waveform=DummyWaveform(defined_channels={'A'}), repetition_count=1)
                                  for _ in range(temp_properties['max_seq_len']+1)],
                        repetition_count=2)
-        with self.assertRaises(TaborException):
-            TaborProgram(program.copy_tree_structure(), channels=(None, 'A'), markers=(None, None),
-                         device_properties=temp_properties)
 
         temp_properties['min_seq_len'] = 100
         temp_properties['max_seq_len'] = 120
@@ -245,6 +362,127 @@ class TaborProgramTests(unittest.TestCase):
             self.assertTrue(np.all(sampled_seg[0] << 2 == data[0] << 2))
             self.assertTrue(np.all(sampled_seg[1] << 2 == data[1] << 2))
 
+    def test_sampled_segments_chunked(self):
+        wf = MultiChannelWaveform([
+            TableWaveform('A', [(0, -0.5, HoldInterpolationStrategy()),
+                                (96, 0.5, LinearInterpolationStrategy()),
+                                (192, -0.2, LinearInterpolationStrategy())]),
+            TableWaveform('C', [(0, 0, HoldInterpolationStrategy()),
+                                (50, 1, HoldInterpolationStrategy()),
+                                (192, 0, HoldInterpolationStrategy())])])
+        root_loop = Loop(children=[Loop(waveform=wf, repetition_count=2)])
+
+        prog = TaborProgram(root_loop, self.instr_props, ('A', None), ('C', 'A'))
+        sampled, sampled_length = prog.sampled_segments(10**9, (1., 1.), (0, 0), (lambda x: x, lambda x: x))
+
+        with mock.patch.object(TaborProgram, '_sampling_chunk_size', 80):
+            chunked, chunked_length = prog.sampled_segments(10**9, (1., 1.), (0, 0), (lambda x: x, lambda x: x))
+
+        np.testing.assert_equal(chunked_length, sampled_length)
+        self.assertEqual(len(chunked), len(sampled))
+        for chunked_segment, sampled_segment in zip(chunked, sampled):
+            np.testing.assert_equal(chunked_segment[0], sampled_segment[0])
+            np.testing.assert_equal(chunked_segment[1], sampled_segment[1])
+            np.testing.assert_equal(chunked_segment[1], np.full(192, 8192, dtype=np.uint16))
+
+    def test_sampled_segments_executor(self):
+        root_loop = Loop(children=[Loop(waveform=TableWaveform('A', [(0, 0, HoldInterpolationStrategy()),
+                                                                     (16*i, 0.5, LinearInterpolationStrategy()),
+                                                                     (192 + 16*i, -0.5, LinearInterpolationStrategy())]))
+                                   for i in range(1, 9)])
+        prog = TaborProgram(root_loop, self.instr_props, ('A', None), (None, 'A'))
+        sampled, sampled_length = prog.sampled_segments(10**9, (1., 1.), (0, 0), (lambda x: x, lambda x: x))
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+            parallel, parallel_length = prog.sampled_segments(10**9, (1., 1.), (0, 0), (lambda x: x, lambda x: x),
+                                                              executor=executor)
+
+        np.testing.assert_equal(parallel_length, sampled_length)
+        self.assertEqual(len(parallel), 8)
+        for parallel_segment, sampled_segment in zip(parallel, sampled):
+            self.assertIsInstance(parallel_segment, TaborSegment)
+            np.testing.assert_equal(parallel_segment[0], sampled_segment[0])
+            np.testing.assert_equal(parallel_segment[1], sampled_segment[1])
+
+
+    def test_sampled_segments_process_pool(self):
+        root_loop = Loop(children=[Loop(waveform=TableWaveform('A', [(0, 0, HoldInterpolationStrategy()),
+                                                                     (16*i, 0.5, LinearInterpolationStrategy()),
+                                                                     (192 + 16*i, -0.5, LinearInterpolationStrategy())]))
+                                   for i in range(1, 5)])
+        prog = TaborProgram(root_loop, self.instr_props, ('A', None), (None, 'A'))
+        # lambdas cannot be pickled
+        transformations = (np.asarray, np.asarray)
+        sampled, sampled_length = prog.sampled_segments(10**9, (1., 1.), (0, 0), transformations)
+
+        with concurrent.futures.ProcessPoolExecutor(max_workers=2) as executor:
+            parallel, parallel_length = prog.sampled_segments(10**9, (1., 1.), (0, 0), transformations,
+                                                              executor=executor)
+
+            np.testing.assert_equal(parallel_length, sampled_length)
+            for parallel_segment, sampled_segment in zip(parallel, sampled):
+                self.assertIsInstance(parallel_segment, TaborSegment)
+                np.testing.assert_equal(parallel_segment[0], sampled_segment[0])
+                np.testing.assert_equal(parallel_segment[1], sampled_segment[1])
+
+            with self.assertRaisesRegex(TypeError, 'voltage transformation .* not picklable'):
+                prog.sampled_segments(10**9, (1., 1.), (0, 0), (lambda x: x, np.asarray), executor=executor)
+
+            function_waveform = FunctionWaveform(Expression('sin(t)'), 192, channel='A')
+            # the compiled lambda of the expression is not picklable
+            function_waveform.unsafe_sample('A', np.arange(3.))
+            function_prog = TaborProgram(Loop(children=[Loop(waveform=function_waveform)]), self.instr_props,
+                                         ('A', None), (None, None))
+            with self.assertRaisesRegex(TypeError, 'waveform .* not picklable'):
+                function_prog.sampled_segments(10**9, (1., 1.), (0, 0), transformations, executor=executor)
+
+
+class TaborProgramDedupeBenchmark(unittest.TestCase):
+    """Dedupe of a program with 10k waveforms in TaborProgram.setup_single_sequence_mode"""
+    n_waveforms = 10000
+    # generous upper bound in seconds. The dedupe takes well below one second on a desktop machine
+    max_duration = 5.
+
+    def setUp(self):
+        self.instr_props = model_properties_dict['WX2184C']
+
+        self.tables = [TableWaveform(channel, [(0, 0, HoldInterpolationStrategy()),
+                                               (96*i, v, LinearInterpolationStrategy()),
+                                               (192*4, 0, HoldInterpolationStrategy())])
+                       for i, v in ((1, 0.1), (2, 0.2), (3, 0.3))
+                       for channel in ('A', 'B')]
+
+    def build_program(self) -> Loop:
+        # every waveform is a new object but there are only three different ones
+        def make_waveform(i):
+            sub_waveforms = [MultiChannelWaveform(self.tables[2*((i + j) % 3):2*((i + j) % 3) + 2]) for j in range(4)]
+            return SequenceWaveform(sub_waveforms)
+        return Loop(children=[Loop(waveform=make_waveform(i)) for i in range(self.n_waveforms)])
+
+    def test_dedupe(self):
+        leaf_key_calls = []
+        leaf_compare_key = TableWaveform.compare_key
+
+        def counting_compare_key(waveform):
+            leaf_key_calls.append(waveform)
+            return leaf_compare_key.fget(waveform)
+
+        with mock.patch.object(TableWaveform, 'compare_key', property(counting_compare_key)):
+            program = TaborProgram(self.build_program(), self.instr_props, ('A', 'B'), (None, None))
+
+        self.assertEqual(len(program._waveforms), 3)
+        # the hash of each leaf is computed once and equal leafs are identical
+        self.assertLessEqual(len(leaf_key_calls), len(self.tables))
+
+    @unittest.skipUnless(os.getenv('QCTOOLKIT_BENCHMARKS', False), 'timing benchmarks are only run on request')
+    def test_dedupe_duration(self):
+        duration = min(timeit.repeat(lambda: TaborProgram(self.build_program(), self.instr_props,
+                                                          ('A', 'B'), (None, None)),
+                                     number=1, repeat=1))
+        self.assertLess(duration, self.max_duration)
+        # generous bound that only catches a regression to repeated hashing of the whole waveform trees
+        self.assertLess(duration, 10., 'Dedupe took {:.3f} s'.format(duration))
+
 
 class ConfigurationGuardTest(unittest.TestCase):
     class DummyChannelPair:
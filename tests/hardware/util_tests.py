@@ -6,7 +6,8 @@ import pytabor
 import numpy as np
 
 from qctoolkit.hardware.awgs.tabor import TaborSegment
-from qctoolkit.hardware.util import voltage_to_uint16, make_combined_wave, find_positions
+from qctoolkit.hardware.util import voltage_to_uint16, make_combined_wave, find_positions, iterate_in_background,\
+    BestFitAllocator
 
 
 from . import dummy_modules
@@ -30,6 +31,25 @@ class VoltageToBinaryTests(unittest.TestCase):
 
         self.assertTrue(np.all(expected_data == received_data))
 
+    def test_voltage_to_uint16_output_array(self):
+        linspace_voltage = np.linspace(0, 1, 128)
+        expected_data = np.arange(0, 128, dtype=np.uint16)
+
+        output_array = np.full(128, 0xC000, dtype=np.uint16)
+        received_data = voltage_to_uint16(linspace_voltage, 0.5, 0.5, 7, output_array=output_array)
+        self.assertIs(received_data, output_array)
+        np.testing.assert_equal(received_data, expected_data)
+        np.testing.assert_equal(linspace_voltage, np.linspace(0, 1, 128))
+
+        # convert in place
+        voltage = linspace_voltage.copy()
+        received_data = voltage_to_uint16(voltage, 0.5, 0.5, 7, output_array=output_array, scratch_array=voltage)
+        np.testing.assert_equal(received_data, expected_data)
+        np.testing.assert_equal(voltage, expected_data)
+
+        with self.assertRaises(ValueError):
+            voltage_to_uint16(linspace_voltage, 0.4, 0.5, 7, output_array=output_array)
+
 
 def validate_result(tabor_segments, result, fill_value=None):
     pos = 0
@@ -171,3 +191,90 @@ class FindPositionTest(unittest.TestCase):
         positions = find_positions(data, to_find)
 
         self.assertEqual(positions.tolist(), [-1, -1, 5, 6, -1, 1, 0])
+
+
+class IterateInBackgroundTests(unittest.TestCase):
+    def test_iterate(self):
+        self.assertEqual(list(iterate_in_background(range(10), max_queue_size=3)), list(range(10)))
+        self.assertEqual(list(iterate_in_background([], max_queue_size=1)), [])
+
+        with self.assertRaises(ValueError):
+            next(iterate_in_background(range(10), max_queue_size=0))
+
+    def test_bounded(self):
+        produced = []
+
+        def producer():
+            for i in range(100):
+                produced.append(i)
+                yield i
+
+        iterator = iterate_in_background(producer(), max_queue_size=2)
+        self.assertEqual(next(iterator), 0)
+        iterator.close()
+        # one element consumed, two in the queue and at most one waiting to be put
+        self.assertLessEqual(len(produced), 4)
+
+    def test_exception(self):
+        def producer():
+            yield 1
+            raise RuntimeError('producer failed')
+
+        iterator = iterate_in_background(producer(), max_queue_size=2)
+        self.assertEqual(next(iterator), 1)
+        with self.assertRaisesRegex(RuntimeError, 'producer failed'):
+            next(iterator)
+
+
+class BestFitAllocatorTests(unittest.TestCase):
+    def test_best_fit(self):
+        allocator = BestFitAllocator([(0, 64), (3, 32), (5, 128), (7, 32)])
+        self.assertEqual(len(allocator), 4)
+        self.assertEqual(allocator.free_total, 256)
+        self.assertEqual(allocator.largest_hole, 128)
+
+        self.assertEqual(allocator.find_best_fit(16), 3)
+        self.assertEqual(allocator.find_best_fit(32), 3)
+        self.assertEqual(allocator.find_best_fit(33), 0)
+        self.assertIsNone(allocator.find_best_fit(129))
+        self.assertEqual(len(allocator), 4)
+
+        self.assertEqual(allocator.allocate(32), 3)
+        self.assertEqual(allocator.allocate(32), 7)
+        self.assertEqual(allocator.allocate(32), 0)
+        self.assertIsNone(allocator.allocate(256))
+        self.assertEqual(list(allocator._sorted_holes), [(128, 5)])
+        self.assertNotIn(0, allocator)
+        self.assertIn(5, allocator)
+
+    def test_add_remove(self):
+        allocator = BestFitAllocator()
+        self.assertEqual(len(allocator), 0)
+        self.assertIsNone(allocator.allocate(0))
+        self.assertEqual(allocator.fragmentation, 0.)
+
+        allocator.add(2, 48)
+        allocator.add(1, 16)
+        with self.assertRaises(ValueError):
+            allocator.add(1, 32)
+        self.assertEqual(allocator.capacity(2), 48)
+        self.assertEqual(allocator.free_total, 64)
+        self.assertEqual(allocator.fragmentation, 0.25)
+
+        allocator.remove(2)
+        self.assertEqual(allocator.free_total, 16)
+        self.assertEqual(allocator.fragmentation, 0.)
+        with self.assertRaises(KeyError):
+            allocator.remove(2)
+        self.assertEqual(allocator.allocate(10), 1)
+        self.assertEqual(allocator.free_total, 0)
+
+    def test_many_holes(self):
+        capacities = np.random.RandomState(42).randint(1, 1000, size=10000)
+        allocator = BestFitAllocator(enumerate(capacities.tolist()))
+
+        for size in (1, 500, 999):
+            key = allocator.allocate(size)
+            fitting = capacities >= size
+            fitting[list(set(range(len(capacities))) - set(allocator._capacities) - {key})] = False
+            self.assertEqual(capacities[key], capacities[fitting].min())
@@ -1,11 +1,12 @@
 import unittest
+from unittest import mock
 import sympy
 
 from qctoolkit.pulses.function_pulse_template import FunctionPulseTemplate,\
     FunctionWaveform
 from qctoolkit.serialization import Serializer
-from qctoolkit.expressions import Expression
-from qctoolkit.pulses.parameters import ParameterConstraintViolation
+from qctoolkit.expressions import Expression, NonNumericEvaluation
+from qctoolkit.pulses.parameters import ParameterConstraintViolation, ParameterNotProvidedException
 import numpy as np
 
 from tests.serialization_dummies import DummySerializer, DummyStorageBackend
@@ -139,11 +140,27 @@ class FunctionPulseSequencingTest(FunctionPulseTest):
         self.assertIsNotNone(wf)
         self.assertIsInstance(wf, FunctionWaveform)
 
-        expression = Expression(self.s).evaluate_symbolic(self.valid_par_vals)
         duration = Expression(self.s2).evaluate_numeric(c=self.valid_par_vals['c'])
 
-        expected_waveform = FunctionWaveform(expression, duration=duration, channel='B')
+        expected_waveform = FunctionWaveform(Expression(self.s), duration=duration, channel='B',
+                                             parameters=dict(a=1, b=2))
         self.assertEqual(expected_waveform, wf)
+        self.assertIs(wf._expression, self.fpt.expression)
+
+        # same values as the substituted expression
+        expression = Expression(self.s).evaluate_symbolic(self.valid_par_vals)
+        sample_times = np.linspace(0, duration, num=11)
+        np.testing.assert_equal(wf.unsafe_sample('B', sample_times), expression.evaluate_numeric(t=sample_times))
+
+    def test_build_waveform_compiles_once(self) -> None:
+        fpt = FunctionPulseTemplate('a*sin(b*t)', 'c', channel='A')
+        sample_times = np.linspace(0, 1, num=5)
+        with mock.patch.object(sympy, 'lambdify', wraps=sympy.lambdify) as lambdify:
+            for a in range(100):
+                wf = fpt.build_waveform(dict(a=a, b=2., c=1.), channel_mapping={'A': 'A'})
+                np.testing.assert_almost_equal(wf.unsafe_sample('A', sample_times), a*np.sin(2.*sample_times))
+            # once for the expression and once for the duration expression
+            self.assertEqual(lambdify.call_count, 2)
 
     def test_requires_stop(self) -> None:
         parameters = dict(a=DummyParameter(36.126), z=DummyParameter(247.9543))
@@ -154,6 +171,12 @@ class FunctionPulseSequencingTest(FunctionPulseTest):
     def test_build_waveform_none(self):
         self.assertIsNone(self.fpt.build_waveform(self.valid_par_vals, channel_mapping={'A': None}))
 
+    def test_build_waveform_missing_parameter(self):
+        fpt = FunctionPulseTemplate('a*t', 'T', channel='A')
+        with self.assertRaises(ParameterNotProvidedException) as exception:
+            fpt.build_waveform(dict(T=1.), channel_mapping={'A': 'A'})
+        self.assertEqual(exception.exception.parameter_name, 'a')
+
 
 class TablePulseTemplateConstraintTest(ParameterConstrainerTest):
     def __init__(self, *args, **kwargs):
@@ -189,6 +212,34 @@ class FunctionWaveformTest(unittest.TestCase):
         self.assertNotEqual(wf1a, wf3)
         self.assertNotEqual(wf1a, wf4)
 
+    def test_parameters(self) -> None:
+        with self.assertRaises(ValueError):
+            FunctionWaveform(Expression('a*t'), 3, channel='A')
+
+        wf_a1 = FunctionWaveform(Expression('a*t'), 3, channel='A', parameters=dict(a=1., b=3.))
+        wf_a2 = FunctionWaveform(Expression('a*t'), 3, channel='A', parameters=dict(a=2.))
+        self.assertNotEqual(wf_a1, wf_a2)
+        self.assertEqual(wf_a1, FunctionWaveform(Expression('a*t'), 3, channel='A', parameters=dict(a=1.)))
+        self.assertEqual(hash(wf_a1), hash(FunctionWaveform(Expression('a*t'), 3, channel='A', parameters=dict(a=1.))))
+
+        np.testing.assert_equal(wf_a2.unsafe_sample('A', np.arange(3.)), [0., 2., 4.])
+        np.testing.assert_equal(FunctionWaveform(Expression('a'), 3, channel='A', parameters=dict(a=2.)).
+                                unsafe_sample('A', np.arange(3.)), [2., 2., 2.])
+
+    def test_get_sampled(self) -> None:
+        wf = FunctionWaveform(Expression('2*t'), 3, channel='A')
+        sample_times = np.arange(3.)
+
+        result = wf.get_sampled('A', sample_times)
+        np.testing.assert_equal(result, [0., 2., 4.])
+        self.assertFalse(result.flags.writeable)
+        np.testing.assert_equal(FunctionWaveform(Expression('2*t'), 3, channel='A').get_sampled('A', sample_times),
+                                result)
+
+        output_array = np.empty(3)
+        self.assertIs(wf.get_sampled('A', sample_times, output_array=output_array), output_array)
+        np.testing.assert_equal(output_array, [0., 2., 4.])
+
     def test_defined_channels(self) -> None:
         wf = FunctionWaveform(Expression('t'), 4, channel='A')
         self.assertEqual({'A'}, wf.defined_channels)
@@ -211,6 +262,23 @@ class FunctionWaveformTest(unittest.TestCase):
         np.testing.assert_equal(result, expected_result)
         self.assertIs(result, out_array)
 
+    def test_unsafe_sample_invalid_result(self):
+        t = np.linspace(0, 5, dtype=float)
+
+        expression = Expression('a*t')
+        expression._expression_lambda = lambda *args: 'no number'
+        with self.assertRaises(NonNumericEvaluation):
+            FunctionWaveform(expression, 5, channel='A', parameters=dict(a=1.)).unsafe_sample('A', t)
+
+        expression = Expression('a*t')
+        expression._expression_lambda = lambda *args: np.zeros(3)
+        with self.assertRaises(ValueError):
+            FunctionWaveform(expression, 5, channel='A', parameters=dict(a=1.)).unsafe_sample('A', t)
+
+        # constant expressions are broadcast
+        np.testing.assert_equal(FunctionWaveform(Expression('a'), 5, channel='A', parameters=dict(a=2.)).
+                                unsafe_sample('A', t), np.full(len(t), 2.))
+
     def test_unsafe_get_subset_for_channels(self):
         fw = FunctionWaveform(Expression('sin(2*pi*t) + 3'), 5, channel='A')
         self.assertIs(fw.unsafe_get_subset_for_channels({'A'}), fw)
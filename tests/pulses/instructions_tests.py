@@ -1,4 +1,5 @@
 import unittest
+from unittest import mock
 import numpy
 from typing import Dict, Any, List
 
@@ -37,6 +38,26 @@ class WaveformTest(unittest.TestCase):
         self.assertIs(wf.get_sampled('A', sample_times=numpy.arange(2)),
                       wf.get_sampled('A', sample_times=numpy.arange(2)))
 
+    def test_get_sampled_cache_hit(self):
+        wf = DummyWaveform(duration=2., sample_output=numpy.asarray([1., 2.]), defined_channels={'A', 'B'})
+        equal_wf = DummyWaveform(duration=2., sample_output=numpy.asarray([1., 2.]), defined_channels={'A', 'B'})
+
+        sampled = wf.get_sampled('A', sample_times=numpy.arange(2.))
+        self.assertFalse(sampled.flags.writeable)
+        self.assertIs(equal_wf.get_sampled('A', sample_times=numpy.arange(2.)), sampled)
+        self.assertEqual(len(equal_wf.sample_calls), 0)
+
+        wf.get_sampled('B', sample_times=numpy.arange(2.))
+        wf.get_sampled('A', sample_times=numpy.asarray([0., 1.5]))
+        self.assertEqual(len(wf.sample_calls), 3)
+
+    def test_sample_uniform_cache_hit(self):
+        wf = DummyWaveform(duration=2., defined_channels={'A', 'B'})
+
+        sampled = wf.sample_channels_uniform(('A', 'B'), 3, 1.)
+        self.assertIs(wf.sample_channels_uniform(('A', 'B'), 3, 1.), sampled)
+        self.assertEqual(len(wf.sample_calls), 2)
+
     def test_get_sampled_empty(self):
         wf = DummyWaveform(duration=2., defined_channels={'A', 'B'})
 
@@ -65,6 +86,69 @@ class WaveformTest(unittest.TestCase):
         self.assertIs(wf.sample_calls[0][-1], out_expected)
         self.assertEqual(out_received.tolist(), [1, 2])
 
+    def test_sample_channels_exceptions(self):
+        wf = DummyWaveform(duration=2., defined_channels={'A', 'B'})
+
+        with self.assertRaises(ValueError):
+            wf.sample_channels(channels=('A',), sample_times=numpy.asarray([2, 1], dtype=float))
+        with self.assertRaises(ValueError):
+            wf.sample_channels(channels=('A',), sample_times=numpy.asarray([0.5, 3], dtype=float))
+        with self.assertRaises(KeyError):
+            wf.sample_channels(channels=('A', 'C'), sample_times=numpy.asarray([0.5, 1], dtype=float))
+        with self.assertRaises(ValueError):
+            wf.sample_channels(channels=('A', 'B'), sample_times=numpy.asarray([0.5, 1], dtype=float),
+                               output_array=numpy.empty((1, 2)))
+
+    def test_sample_channels(self):
+        wf = DummyWaveform(duration=2., defined_channels={'A', 'B'})
+        sample_times = numpy.asarray([0.5, 1, 1.5])
+
+        output_array = numpy.empty((2, 3))
+        sampled = wf.sample_channels(channels=('B', 'A'), sample_times=sample_times, output_array=output_array)
+        self.assertIs(sampled, output_array)
+        numpy.testing.assert_equal(sampled, [sample_times, sample_times])
+        self.assertEqual([call[0] for call in wf.sample_calls], ['B', 'A'])
+
+        sampled = wf.sample_channels(channels=('A',), sample_times=numpy.zeros(0))
+        self.assertEqual(sampled.shape, (1, 0))
+
+    def test_sample_uniform(self):
+        wf = DummyWaveform(duration=2., defined_channels={'A', 'B'})
+
+        output_array = numpy.empty(4)
+        self.assertIs(wf.sample_uniform('A', 4, 2., t0=0.5, output_array=output_array), output_array)
+        numpy.testing.assert_equal(output_array, [0.5, 1., 1.5, 2.])
+
+        sampled = wf.sample_channels_uniform(('B', 'A'), 3, 1.)
+        numpy.testing.assert_equal(sampled, [[0., 1., 2.], [0., 1., 2.]])
+
+        with self.assertRaises(ValueError):
+            wf.sample_uniform('A', 4, 1.)
+        with self.assertRaises(ValueError):
+            wf.sample_uniform('A', 2, 1., t0=-1.)
+        with self.assertRaises(ValueError):
+            wf.sample_uniform('A', 2, 0.)
+        with self.assertRaises(ValueError):
+            wf.sample_uniform('A', 2, 1., output_array=numpy.empty(3))
+        with self.assertRaises(KeyError):
+            wf.sample_uniform('C', 2, 1.)
+
+    def test_hash_cached(self):
+        wf = DummyWaveform(duration=2., sample_output=numpy.asarray([1., 2.]))
+        equal_wf = DummyWaveform(duration=2., sample_output=numpy.asarray([1., 2.]))
+        other_wf = DummyWaveform(duration=2., sample_output=numpy.asarray([1., 3.]))
+
+        self.assertEqual(hash(wf), hash(wf.compare_key))
+        hash(other_wf)
+        with mock.patch.object(DummyWaveform, 'compare_key', new_callable=mock.PropertyMock) as compare_key:
+            hash(wf)
+            compare_key.assert_not_called()
+
+            # different hashes -> compare keys are not compared
+            self.assertNotEqual(wf, other_wf)
+            compare_key.assert_not_called()
+        self.assertEqual(wf, equal_wf)
+
     def test_get_subset_for_channels(self):
         wf_ab = DummyWaveform(defined_channels={'A', 'B'})
         wf_a = DummyWaveform(defined_channels={'A'})
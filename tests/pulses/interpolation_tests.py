@@ -1,7 +1,8 @@
 import unittest
 import numpy as np
 
-from qctoolkit.pulses.interpolation import LinearInterpolationStrategy, HoldInterpolationStrategy, JumpInterpolationStrategy
+from qctoolkit.pulses.interpolation import LinearInterpolationStrategy, HoldInterpolationStrategy, JumpInterpolationStrategy,\
+    InterpolationStrategy
 
 
 class InterpolationTest(unittest.TestCase):
@@ -35,6 +36,34 @@ class InterpolationTest(unittest.TestCase):
         with self.assertRaises(ValueError):
             strat(end, start, t)
     
+    def test_output_array(self):
+        start = (-1, -1)
+        end = (3, 3)
+        t = np.linspace(-1, 3, 9)
+        for strat, expected in ((LinearInterpolationStrategy(), t),
+                                (HoldInterpolationStrategy(), np.full_like(t, -1)),
+                                (JumpInterpolationStrategy(), np.full_like(t, 3))):
+            output_array = np.empty(11)
+            result = strat(start, end, t, output_array=output_array[1:-1])
+            self.assertIs(result.base, output_array)
+            np.testing.assert_equal(result, expected)
+
+            # no bounds check
+            output_array = np.empty_like(t)
+            self.assertIs(strat.unsafe_interpolate(end, start, t, output_array), output_array)
+
+    def test_default_unsafe_interpolate(self):
+        class CustomInterpolation(InterpolationStrategy):
+            def __call__(self, start, end, times):
+                return times * 2
+
+            def __repr__(self):
+                return 'custom'
+
+        output_array = np.empty(3)
+        CustomInterpolation().unsafe_interpolate((0, 0), (2, 2), np.arange(3.), output_array)
+        np.testing.assert_equal(output_array, [0, 2, 4])
+
     def test_repr_str(self):
         #Test hash
         strategies = {LinearInterpolationStrategy():("linear","<Linear Interpolation>"),
@@ -6,6 +6,8 @@ from qctoolkit.pulses.pulse_template_parameter_mapping import MissingMappingExce
     MissingParameterDeclarationException
 from qctoolkit.pulses.multi_channel_pulse_template import MultiChannelWaveform, MappingPulseTemplate, ChannelMappingException, AtomicMultiChannelPulseTemplate
 from qctoolkit.pulses.parameters import ParameterConstraint, ParameterConstraintViolation
+from qctoolkit.pulses.table_pulse_template import TableWaveform
+from qctoolkit.pulses.interpolation import HoldInterpolationStrategy
 
 from tests.pulses.sequencing_dummies import DummySequencer, DummyInstructionBlock, DummyPulseTemplate, DummyWaveform
 from tests.serialization_dummies import DummySerializer
@@ -93,6 +95,33 @@ class MultiChannelWaveformTest(unittest.TestCase):
         self.assertIs(result_a, dwf_a.sample_calls[1][2])
         numpy.testing.assert_equal(result_b, samples_b)
 
+    def test_unsafe_sample_channels(self) -> None:
+        sample_times = numpy.linspace(98.5, 103.5, num=11)
+        samples_a = numpy.linspace(4, 5, 11)
+        samples_b = numpy.linspace(2, 3, 11)
+        dwf_a = DummyWaveform(duration=3.2, sample_output=samples_a, defined_channels={'A'})
+        dwf_b = DummyWaveform(duration=3.2, sample_output=samples_b, defined_channels={'B', 'C'})
+        waveform = MultiChannelWaveform((dwf_a, dwf_b))
+
+        # rows of dwf_b are not contiguous
+        output_array = numpy.empty((3, 11))
+        result = waveform.unsafe_sample_channels(('B', 'A', 'C'), sample_times, output_array)
+        self.assertIs(result, output_array)
+        numpy.testing.assert_equal(result, [samples_b, samples_a, samples_b])
+
+        self.assertEqual([call[0] for call in dwf_a.sample_calls], ['A'])
+        self.assertEqual([call[0] for call in dwf_b.sample_calls], ['B', 'C'])
+
+    def test_constant_value(self) -> None:
+        hold = HoldInterpolationStrategy()
+        waveform = MultiChannelWaveform([TableWaveform('A', [(0, 1., hold), (3., 1., hold)]),
+                                         TableWaveform('B', [(0, 1., hold), (1., 2., hold), (3., 2., hold)])])
+        self.assertEqual(waveform.constant_value('A'), 1.)
+        self.assertIsNone(waveform.constant_value('B'))
+        self.assertEqual(waveform.constant_intervals('B'), [(0., 1., 1.), (1., 3., 2.)])
+        self.assertFalse(waveform.is_constant)
+        self.assertTrue(waveform.get_subset_for_channels({'A'}).is_constant)
+
     def test_equality(self) -> None:
         dwf_a = DummyWaveform(duration=246.2, defined_channels={'A'})
         dwf_b = DummyWaveform(duration=246.2, defined_channels={'B'})
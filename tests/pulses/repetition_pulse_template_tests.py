@@ -41,7 +41,7 @@ class RepetitionWaveformTest(unittest.TestCase):
     def test_compare_key(self):
         body_wf = DummyWaveform(defined_channels={'a'})
         wf = RepetitionWaveform(body_wf, 2)
-        self.assertEqual(wf.compare_key, (body_wf.compare_key, 2))
+        self.assertEqual(wf.compare_key, (body_wf, 2))
 
     def test_unsafe_get_subset_for_channels(self):
         body_wf = DummyWaveform(defined_channels={'a', 'b'})
@@ -60,12 +60,87 @@ class RepetitionWaveformTest(unittest.TestCase):
         rwf = RepetitionWaveform(body=body_wf, repetition_count=10)
 
         sample_times = np.arange(80) * 70./80.
-        np.testing.assert_equal(rwf.unsafe_sample(channel='A', sample_times=sample_times), sample_times)
+        expected_result = np.tile(sample_times[:8], 10)
+        np.testing.assert_equal(rwf.unsafe_sample(channel='A', sample_times=sample_times), expected_result)
 
         output_expected = np.empty_like(sample_times)
         output_received = rwf.unsafe_sample(channel='A', sample_times=sample_times, output_array=output_expected)
         self.assertIs(output_expected, output_received)
-        np.testing.assert_equal(output_received, sample_times)
+        np.testing.assert_equal(output_received, expected_result)
+
+    def test_unsafe_sample_tiled(self):
+        body_wf = DummyWaveform(duration=7)
+        rwf = RepetitionWaveform(body=body_wf, repetition_count=10)
+
+        # includes the end of the waveform
+        sample_times = np.arange(81) * 70./80.
+        expected_result = np.concatenate((np.tile(sample_times[:8], 10), [7.]))
+
+        np.testing.assert_equal(rwf.unsafe_sample(channel='A', sample_times=sample_times), expected_result)
+        self.assertEqual(len(body_wf.sample_calls), 2)
+        self.assertEqual(body_wf.sample_calls[0][1], list(sample_times[:8]))
+        self.assertEqual(body_wf.sample_calls[1][1], [7.])
+
+    def test_unsafe_sample_channels_tiled(self):
+        body_wf = DummyWaveform(duration=7, defined_channels={'A', 'B'})
+        rwf = RepetitionWaveform(body=body_wf, repetition_count=10)
+
+        sample_times = np.arange(81) * 70./80.
+        expected_result = np.concatenate((np.tile(sample_times[:8], 10), [7.]))
+
+        output_array = np.empty((2, 81))
+        result = rwf.unsafe_sample_channels(channels=('B', 'A'), sample_times=sample_times, output_array=output_array)
+        self.assertIs(result, output_array)
+        np.testing.assert_equal(result, [expected_result, expected_result])
+        self.assertEqual([call[0] for call in body_wf.sample_calls], ['B', 'A', 'B', 'A'])
+
+    def test_sample_uniform(self):
+        body_wf = DummyWaveform(duration=7)
+        rwf = RepetitionWaveform(body=body_wf, repetition_count=10)
+
+        # one sample per time unit -> the body is sampled once plus the end of the waveform
+        expected_result = np.concatenate((np.tile(np.arange(7.), 10), [7.]))
+        np.testing.assert_equal(rwf.sample_uniform('A', 71, 1.), expected_result)
+        self.assertEqual(len(body_wf.sample_calls), 2)
+
+        # repetitions do not start on samples
+        sample_times = np.arange(47) * 1.5
+        expected_result = sample_times - 7 * np.minimum(sample_times // 7, 9)
+        np.testing.assert_almost_equal(rwf.sample_uniform('A', 47, 1/1.5), expected_result)
+
+    def test_sample_uniform_offset(self):
+        body_wf = DummyWaveform(duration=7)
+        rwf = RepetitionWaveform(body=body_wf, repetition_count=10)
+
+        # grid starts inside the second repetition -> head, tiled body and tail
+        expected_result = np.concatenate((np.tile(np.arange(7.), 10), [7.]))[10:]
+        np.testing.assert_equal(rwf.sample_uniform('A', 61, 1., t0=10.), expected_result)
+        self.assertEqual(len(body_wf.sample_calls), 3)
+
+        # grid inside a single repetition
+        np.testing.assert_equal(rwf.sample_uniform('A', 3, 1., t0=15.), [1., 2., 3.])
+
+    def test_unsafe_sample_incommensurate(self):
+        body_wf = DummyWaveform(duration=7)
+        rwf = RepetitionWaveform(body=body_wf, repetition_count=3)
+
+        sample_times = np.linspace(0, 21, num=11)
+        expected_result = sample_times - 7*np.minimum(sample_times // 7, 2)
+
+        np.testing.assert_almost_equal(rwf.unsafe_sample(channel='A', sample_times=sample_times), expected_result)
+        self.assertEqual(len(body_wf.sample_calls), 3)
+
+    def test_unsafe_sample_shifted_repetition(self):
+        body_wf = DummyWaveform(duration=7)
+        rwf = RepetitionWaveform(body=body_wf, repetition_count=3)
+
+        # the middle repetition is sampled later than the others
+        sample_times = np.arange(21.)
+        sample_times[7:14] += 0.5
+        expected_result = sample_times - 7*(sample_times // 7)
+
+        np.testing.assert_equal(rwf.unsafe_sample(channel='A', sample_times=sample_times), expected_result)
+        self.assertEqual(len(body_wf.sample_calls), 3)
 
 
 class RepetitionPulseTemplateTest(unittest.TestCase):
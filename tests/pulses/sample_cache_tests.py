@@ -0,0 +1,87 @@
+import unittest
+
+import numpy
+
+from qctoolkit.pulses.sample_cache import SampleCache
+
+
+class SampleCacheTests(unittest.TestCase):
+    def test_init(self):
+        cache = SampleCache(max_bytes=100)
+        self.assertEqual(cache.max_bytes, 100)
+        self.assertEqual(cache.size, 0)
+        self.assertEqual(len(cache), 0)
+
+        with self.assertRaises(ValueError):
+            SampleCache(max_bytes=-1)
+
+    def test_get_put(self):
+        cache = SampleCache()
+        data = numpy.arange(4.)
+
+        self.assertIsNone(cache.get('a'))
+        self.assertIs(cache.put('a', data), data)
+        self.assertFalse(data.flags.writeable)
+        self.assertIs(cache.get('a'), data)
+
+        self.assertEqual(cache.size, data.nbytes)
+        self.assertEqual((cache.hits, cache.misses, cache.evictions), (1, 1, 0))
+
+        cache.put('a', numpy.arange(2.))
+        self.assertEqual(cache.size, 16)
+        self.assertEqual(len(cache), 1)
+
+    def test_lru_eviction(self):
+        cache = SampleCache(max_bytes=3*8*4)
+        for key in 'abc':
+            cache.put(key, numpy.zeros(4))
+        # a is now the most recently used entry
+        cache.get('a')
+        cache.put('d', numpy.zeros(4))
+
+        self.assertNotIn('b', cache)
+        self.assertIn('a', cache)
+        self.assertEqual(cache.evictions, 1)
+        self.assertEqual(cache.size, 3*8*4)
+
+        cache.max_bytes = 8*4
+        self.assertEqual(len(cache), 1)
+        self.assertIn('d', cache)
+        self.assertEqual(cache.evictions, 3)
+
+    def test_too_large(self):
+        cache = SampleCache(max_bytes=8)
+        data = numpy.zeros(2)
+        self.assertIs(cache.put('a', data), data)
+        self.assertNotIn('a', cache)
+        self.assertEqual(cache.evictions, 0)
+
+    def test_get_or_sample(self):
+        cache = SampleCache()
+        calls = []
+
+        def sample():
+            calls.append(None)
+            return numpy.ones(3)
+
+        first = cache.get_or_sample('a', sample)
+        self.assertIs(cache.get_or_sample('a', sample), first)
+        self.assertEqual(len(calls), 1)
+
+    def test_get_or_sample_unhashable(self):
+        cache = SampleCache()
+        data = numpy.ones(3)
+        self.assertIs(cache.get_or_sample(([],), lambda: data), data)
+        self.assertEqual(len(cache), 0)
+
+    def test_clear_and_statistics(self):
+        cache = SampleCache()
+        cache.put('a', numpy.zeros(3))
+        cache.get('a')
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.size, 0)
+        self.assertEqual(cache.hits, 1)
+
+        cache.reset_statistics()
+        self.assertEqual((cache.hits, cache.misses, cache.evictions), (0, 0, 0))
@@ -55,6 +55,35 @@ class SequenceWaveformTest(unittest.TestCase):
         output_2 = swf.unsafe_sample('A', sample_times=sample_times, output_array=output)
         self.assertIs(output_2, output)
 
+    def test_unsafe_sample_channels(self):
+        dwfs = (DummyWaveform(duration=1., defined_channels={'A', 'B'}),
+                DummyWaveform(duration=3., defined_channels={'A', 'B'}))
+
+        swf = SequenceWaveform(dwfs)
+
+        sample_times = np.arange(0, 41)*0.1
+        # sub waveforms are sampled relative to their start
+        expected_output = np.concatenate((sample_times[:10], sample_times[10:] - 1.))
+
+        output = swf.unsafe_sample_channels(('A', 'B'), sample_times=sample_times, output_array=np.empty((2, 41)))
+        np.testing.assert_almost_equal(output, [expected_output, expected_output])
+        self.assertEqual(len(dwfs[0].sample_calls), 2)
+        self.assertEqual(len(dwfs[1].sample_calls), 2)
+
+    def test_sample_uniform(self):
+        dwfs = (DummyWaveform(duration=1., defined_channels={'A', 'B'}),
+                DummyWaveform(duration=3., defined_channels={'A', 'B'}))
+
+        swf = SequenceWaveform(dwfs)
+
+        sample_times = np.arange(0, 41)*0.1
+        expected_output = np.concatenate((sample_times[:10], sample_times[10:] - 1.))
+
+        output = swf.sample_channels_uniform(('A', 'B'), n_samples=41, sample_rate=10.)
+        np.testing.assert_almost_equal(output, [expected_output, expected_output])
+        self.assertEqual([len(call[1]) for call in dwfs[0].sample_calls], [10, 10])
+        self.assertEqual([len(call[1]) for call in dwfs[1].sample_calls], [31, 31])
+
     def test_unsafe_get_subset_for_channels(self):
         dwf_1 = DummyWaveform(duration=2.2, defined_channels={'A', 'B', 'C'})
         dwf_2 = DummyWaveform(duration=3.3, defined_channels={'A', 'B', 'C'})
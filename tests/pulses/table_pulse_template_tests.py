@@ -687,6 +687,69 @@ class TableWaveformTests(unittest.TestCase):
         self.assertIs(output_expected, output_received)
         numpy.testing.assert_equal(expected_result, output_received)
 
+    def test_unsafe_sample_compiled(self) -> None:
+        entries = [TableWaveformEntry(0, 0, HoldInterpolationStrategy()),
+                   TableWaveformEntry(2.1, -33.2, LinearInterpolationStrategy()),
+                   TableWaveformEntry(2.1, 12.3, HoldInterpolationStrategy()),
+                   TableWaveformEntry(4., 12.3, JumpInterpolationStrategy()),
+                   TableWaveformEntry(5., 1.5, HoldInterpolationStrategy()),
+                   TableWaveformEntry(5.7, 123.4, LinearInterpolationStrategy())]
+        waveform = TableWaveform('A', entries)
+        self.assertIsNotNone(waveform._interpolation_codes)
+
+        sample_times = numpy.unique(numpy.concatenate((numpy.linspace(0, 5.7, num=31), [2.1, 4., 5.])))
+
+        expected_result = numpy.empty_like(sample_times)
+        for entry1, entry2 in zip(waveform._table[:-1], waveform._table[1:]):
+            indices = slice(numpy.searchsorted(sample_times, entry1.t, 'left'),
+                            numpy.searchsorted(sample_times, entry2.t, 'right'))
+            expected_result[indices] = entry2.interp((entry1.t, entry1.v), (entry2.t, entry2.v), sample_times[indices])
+
+        numpy.testing.assert_equal(waveform.unsafe_sample('A', sample_times), expected_result)
+
+        output_expected = numpy.empty_like(sample_times)
+        output_received = waveform.unsafe_sample('A', sample_times, output_array=output_expected)
+        self.assertIs(output_expected, output_received)
+        numpy.testing.assert_equal(output_received, expected_result)
+
+    def test_sample_uniform(self) -> None:
+        entries = [TableWaveformEntry(0, 0, HoldInterpolationStrategy()),
+                   TableWaveformEntry(2., -33.2, LinearInterpolationStrategy()),
+                   TableWaveformEntry(2., 12.3, HoldInterpolationStrategy()),
+                   TableWaveformEntry(4., 12.3, JumpInterpolationStrategy()),
+                   TableWaveformEntry(5.1, 1.5, HoldInterpolationStrategy()),
+                   TableWaveformEntry(8., 123.4, LinearInterpolationStrategy())]
+        waveform = TableWaveform('A', entries)
+
+        for sample_rate, t0 in ((1., 0.), (4., 0.), (3., 0.5)):
+            n_samples = int((waveform.duration - t0) * sample_rate) + 1
+            expected_result = waveform.unsafe_sample('A', t0 + numpy.arange(n_samples) / sample_rate)
+            numpy.testing.assert_almost_equal(waveform.sample_uniform('A', n_samples, sample_rate, t0=t0),
+                                              expected_result)
+
+    def test_constant_intervals(self) -> None:
+        entries = [TableWaveformEntry(0, 1., HoldInterpolationStrategy()),
+                   TableWaveformEntry(2., 1., LinearInterpolationStrategy()),
+                   TableWaveformEntry(3., 1., HoldInterpolationStrategy()),
+                   TableWaveformEntry(4., 2., LinearInterpolationStrategy()),
+                   TableWaveformEntry(5., 3., JumpInterpolationStrategy()),
+                   TableWaveformEntry(6., 4., HoldInterpolationStrategy())]
+        waveform = TableWaveform('A', entries)
+        self.assertEqual(waveform.constant_intervals('A'), [(0., 3., 1.), (4., 6., 3.)])
+        self.assertIsNone(waveform.constant_value('A'))
+        self.assertFalse(waveform.is_constant)
+
+        waveform = TableWaveform('A', [TableWaveformEntry(0, 1., HoldInterpolationStrategy()),
+                                       TableWaveformEntry(2., 1., LinearInterpolationStrategy()),
+                                       TableWaveformEntry(3., 2., HoldInterpolationStrategy())])
+        self.assertEqual(waveform.constant_intervals('A'), [(0., 3., 1.)])
+        self.assertEqual(waveform.constant_value('A'), 1.)
+        self.assertTrue(waveform.is_constant)
+
+        waveform = TableWaveform('A', [TableWaveformEntry(0, 1., DummyInterpolationStrategy()),
+                                       TableWaveformEntry(2., 1., DummyInterpolationStrategy())])
+        self.assertEqual(waveform.constant_intervals('A'), [])
+
     def test_simple_properties(self):
         interp = DummyInterpolationStrategy()
         entries = [TableWaveformEntry(0, 0, interp),
@@ -116,3 +116,40 @@ class NodeTests(unittest.TestCase):
 
         self.assertEqual(breadth_nodes, (root, root[0], root[1], root[0][0], root[0][1]))
 
+
+    def test_depth_and_balance(self):
+        leaf = Node()
+        self.assertEqual(leaf.depth(), 0)
+        self.assertTrue(leaf.is_balanced())
+
+        root = Node(children=[Node(children=[Node(), Node()]), Node()])
+        self.assertEqual(root.depth(), 2)
+        self.assertFalse(root.is_balanced())
+        self.assertTrue(root[0].is_balanced())
+
+        root[1] = Node(children=[Node()])
+        self.assertEqual(root.depth(), 2)
+        self.assertTrue(root.is_balanced())
+
+        # changes below a cached node are propagated up the parent chain
+        root[0][1][:] = [Node(children=[Node()])]
+        self.assertEqual(root[0].depth(), 3)
+        self.assertEqual(root.depth(), 4)
+        self.assertFalse(root.is_balanced())
+
+        root[0][:] = []
+        self.assertEqual(root.depth(), 2)
+        self.assertFalse(root.is_balanced())
+
+    def test_depth_deep_tree(self):
+        root = Node()
+        node = root
+        for _ in range(10000):
+            node[:] = [Node()]
+            node = node[0]
+        self.assertEqual(root.depth(), 10000)
+        self.assertTrue(root.is_balanced())
+
+        node[:] = [Node(), Node(children=[Node()])]
+        self.assertEqual(root.depth(), 10002)
+        self.assertFalse(root.is_balanced())